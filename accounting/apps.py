@@ -1,6 +1,12 @@
+import contextlib
+
 from django.apps import AppConfig
 
 
 class AccountingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounting"
+
+    def ready(self):
+        with contextlib.suppress(ImportError):
+            import accounting.signals  # noqa: F401
@@ -0,0 +1,112 @@
+"""
+Group commit of seat reservations
+
+When RESERVATION_BATCH_WINDOW is set, AddInvoiceItemSerializer does not reserve
+its seat in the transaction of the request. The reservation is handed to the
+batcher of the process, which collects the reservations of a match arriving
+within the window and applies them in one transaction (one commit and one round
+of row locks instead of one per request). Each caller gets its own invoice item
+or its own error back.
+
+The batcher only groups the requests that one process serves at the same time,
+so it needs a deployment where a worker serves many requests at once: the ASGI
+application (config/asgi.py) or gunicorn with threads (--threads). A sync
+gunicorn worker serves one request at a time, there every batch holds a single
+reservation and the window is only added latency, so leave the window at 0
+there. To group the reservations of all processes, use the reservation queue
+(RESERVATION_QUEUE_ENABLED, see accounting.reservation_queue) instead.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from accounting.models import InvoiceItem
+from accounting.reservations import SeatReservation
+from accounting.reservations import reserve_seats_in_order
+
+
+class PendingReservation(NamedTuple):
+    reservation: SeatReservation
+    future: Future
+
+
+class ReservationBatcher:
+    """
+    Collect the reservations of each match for window seconds, then apply them
+    in one transaction in a thread of the batcher
+    """
+
+    def __init__(self, window: float, max_batch_size: int = 500):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._batches: dict[int, list[PendingReservation]] = {}
+        self._executor = ThreadPoolExecutor(thread_name_prefix="reservation-batcher")
+
+    def reserve(
+        self,
+        match_id: int,
+        reservation: SeatReservation,
+    ) -> InvoiceItem:
+        """
+        Reserve the seat in the next batch of its match and wait for the batch to
+        be committed
+
+        :param match_id: match of the seat
+        :type match_id: int
+        :param reservation: the reservation
+        :type reservation: SeatReservation
+        :return: the created invoice item
+        :rtype: InvoiceItem
+        """
+        pending = PendingReservation(reservation, Future())
+        with self._lock:
+            batch = self._batches.get(match_id)
+            if batch is None:
+                batch = self._batches[match_id] = []
+                self._executor.submit(self._apply_batch, match_id, batch)
+            batch.append(pending)
+            if len(batch) >= self.max_batch_size:
+                # the next reservation starts a new batch
+                del self._batches[match_id]
+        return pending.future.result()
+
+    def _apply_batch(self, match_id: int, batch: list[PendingReservation]) -> None:
+        time.sleep(self.window)
+        with self._lock:
+            if self._batches.get(match_id) is batch:
+                del self._batches[match_id]
+        close_old_connections()
+        try:
+            results = reserve_seats_in_order(
+                match_id,
+                [pending.reservation for pending in batch],
+            )
+        except Exception as error:  # noqa: BLE001
+            for pending in batch:
+                pending.future.set_exception(error)
+        else:
+            for pending, result in zip(batch, results, strict=True):
+                if isinstance(result, InvoiceItem):
+                    pending.future.set_result(result)
+                else:
+                    pending.future.set_exception(result)
+        finally:
+            close_old_connections()
+
+
+@cache
+def get_reservation_batcher() -> ReservationBatcher:
+    """
+    Return the reservation batcher of this process
+    """
+    return ReservationBatcher(window=settings.RESERVATION_BATCH_WINDOW / 1000)
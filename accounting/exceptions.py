@@ -10,8 +10,53 @@ class AlreadyReservedSeatError(ValidationError):
     so it will be raised
     """
 
-    code = "already_reserved_seat"
-    detail = "Already reserved seat"
+    default_code = "already_reserved_seat"
+    default_detail = "Already reserved seat"
+
+
+class SeatDoesNotExistError(ValidationError):
+    """
+    Some of the requested seats do not exist
+    """
+
+    default_code = "does_not_exist"
+    default_detail = "Seat does not exist"
+
+
+class SeatNotGivenError(ValidationError):
+    """
+    A reservation must give a seat id, or a match and a seat number
+    """
+
+    default_code = "seat_not_given"
+    default_detail = "Give a seat id, or a match and a seat number"
+
+
+class DuplicateSeatError(ValidationError):
+    """
+    A seat is requested more than one time in a request
+    """
+
+    default_code = "duplicate_seat"
+    default_detail = "Each seat can be requested one time"
+
+
+class NotEnoughFreeSeatsError(ValidationError):
+    """
+    The match has not enough free seats for the request
+    """
+
+    default_code = "not_enough_free_seats"
+    default_detail = "There are not enough free seats"
+
+
+class NoLiveInvoiceItemsError(ValidationError):
+    """
+    An invoice whose items are all expired (or which has none) can not be paid
+    """
+
+    default_code = "no_live_invoice_items"
+    default_detail = "The invoice has no items to pay, they have expired"
 
 
 class OnlyInvoiceOwner(PermissionDenied):
@@ -33,6 +78,17 @@ class OnlyPendingInvoice(PermissionDenied):
     detail = "Only pending invoices can be modified!"
 
 
+class SeatHoldsUnavailableError(APIException):
+    """
+    Deferred seat holds need the redis seat hold engine, which the flusher
+    process shares with the web processes
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_code = "seat_holds_unavailable"
+    default_detail = "Seat holds are not available, they need redis."
+
+
 class ProcessFailed(APIException):
     status_code = status.HTTP_401_UNAUTHORIZED
     default_detail = "Process failed because of some unkown reasons."
@@ -0,0 +1,367 @@
+"""
+Seat hold engine
+
+During an on-sale rush most purchase attempts are for seats that are already
+taken, locking the seat row in postgres just to find that out piles up row locks.
+The hold engine claims seats atomically in redis (one hash per match keyed by
+seat number), so rejected and duplicate attempts never reach the database.
+Successful holds are queued and written to Seat/InvoiceItem in batches by
+`accounting.tasks.flush_seat_holds`, in another process, so they need redis (see
+get_deferred_seat_hold_engine).
+Every other reservation path claims its seats in the engine before writing them,
+so a seat held here is never sold by another path. Those claims are leases of
+settings.SEAT_CLAIM_TTL seconds which become permanent when the transaction that
+writes the seat commits (see accounting.signals), so the claim of a transaction
+which rolls back, fails to commit or whose worker dies is released.
+A hold whose seat is found reserved or missing by the flusher anyway (e.g. after
+the loss of redis state) is recorded as dropped, see HoldSeatStatusView.
+Redis state can be rebuilt from the Seat table by
+`accounting.tasks.rebuild_seat_holds` after a restart.
+"""
+
+from __future__ import annotations
+
+import enum
+import json
+import threading
+import time
+from collections import deque
+from functools import cache
+from typing import TYPE_CHECKING
+from typing import NamedTuple
+
+from django.conf import settings
+
+from accounting.exceptions import SeatHoldsUnavailableError
+from config.utils import redis_connection
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+class HoldStatus(enum.IntEnum):
+    REJECTED = 0
+    CLAIMED = 1
+    DUPLICATE = 2
+
+
+class SeatHold(NamedTuple):
+    match_id: int
+    number: int
+    user_id: int
+    full_name: str
+
+    def dumps(self) -> str:
+        return json.dumps(self)
+
+    @classmethod
+    def loads(cls, value: str | bytes) -> SeatHold:
+        return cls(*json.loads(value))
+
+
+class DroppedHold(NamedTuple):
+    user_id: int
+    # code of the error, e.g. already_reserved_seat
+    error: str
+
+
+# the owner of seats which are reserved in the database without a hold
+DATABASE_OWNER = 0
+# seconds a dropped hold is kept for its user to see it
+DROPPED_HOLD_TTL = 24 * 60 * 60
+
+
+class LocalSeatHoldEngine:
+    """
+    In-process stand-in of the redis engine, used in local development and tests
+    where the default cache is not redis.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._owners: dict[int, dict[int, int]] = {}
+        # (match id, seat number) -> expiry time of the leased claims
+        self._leases: dict[tuple[int, int], float] = {}
+        self._pending: deque[SeatHold] = deque()
+        self._dropped: dict[int, dict[int, DroppedHold]] = {}
+
+    def claim(
+        self,
+        hold: SeatHold,
+        *,
+        defer: bool = True,
+        ttl: int | None = None,
+    ) -> HoldStatus:
+        """
+        Claim the seat for the user of the hold
+
+        :param hold: the seat hold
+        :type hold: SeatHold
+        :param defer: queue the hold to be written to the database by the flusher
+        :type defer: bool
+        :param ttl: seconds the claim is leased for, it's released then unless
+            the seat is marked reserved, None for a permanent claim
+        :type ttl: int | None
+        :return: claimed, duplicate (already held by this user) or rejected
+        :rtype: HoldStatus
+        """
+        with self._lock:
+            owners = self._owners.setdefault(hold.match_id, {})
+            owner = self._owner(hold.match_id, hold.number)
+            if owner is not None:
+                if owner == hold.user_id:
+                    return HoldStatus.DUPLICATE
+                return HoldStatus.REJECTED
+            owners[hold.number] = hold.user_id
+            if ttl is not None:
+                self._leases[hold.match_id, hold.number] = self._clock() + ttl
+            self._dropped.get(hold.match_id, {}).pop(hold.number, None)
+            if defer:
+                self._pending.append(hold)
+            return HoldStatus.CLAIMED
+
+    def owner(self, match_id: int, number: int) -> int | None:
+        """Return the user id of the holder of the seat, DATABASE_OWNER or None"""
+        with self._lock:
+            return self._owner(match_id, number)
+
+    def _owner(self, match_id: int, number: int) -> int | None:
+        expires_at = self._leases.get((match_id, number))
+        if expires_at is not None and expires_at <= self._clock():
+            del self._leases[match_id, number]
+            self._owners[match_id].pop(number, None)
+        return self._owners.get(match_id, {}).get(number)
+
+    def drop(self, holds: list[SeatHold], error: str) -> None:
+        """
+        Record holds which could not be written to the database for their users
+
+        :param holds: the dropped holds
+        :type holds: list[SeatHold]
+        :param error: code of the error
+        :type error: str
+        """
+        with self._lock:
+            for hold in holds:
+                dropped = self._dropped.setdefault(hold.match_id, {})
+                dropped[hold.number] = DroppedHold(hold.user_id, error)
+
+    def dropped(self, match_id: int, number: int) -> DroppedHold | None:
+        with self._lock:
+            return self._dropped.get(match_id, {}).get(number)
+
+    def mark_reserved(self, match_id: int, numbers: list[int]) -> None:
+        """Record seats that are reserved in the database"""
+        with self._lock:
+            owners = self._owners.setdefault(match_id, {})
+            for number in numbers:
+                owners[number] = DATABASE_OWNER
+                self._leases.pop((match_id, number), None)
+
+    def release(self, match_id: int, numbers: list[int]) -> None:
+        with self._lock:
+            owners = self._owners.get(match_id, {})
+            for number in numbers:
+                owners.pop(number, None)
+                self._leases.pop((match_id, number), None)
+
+    def unclaim(self, hold: SeatHold) -> None:
+        """Release the seat of the hold if it's still claimed by its user"""
+        with self._lock:
+            if self._owner(hold.match_id, hold.number) == hold.user_id:
+                del self._owners[hold.match_id][hold.number]
+                self._leases.pop((hold.match_id, hold.number), None)
+
+    def pop_pending(self, count: int) -> list[SeatHold]:
+        with self._lock:
+            count = min(count, len(self._pending))
+            return [self._pending.popleft() for _ in range(count)]
+
+    def requeue(self, holds: list[SeatHold]) -> None:
+        with self._lock:
+            self._pending.extendleft(reversed(holds))
+
+    def rebuild(self, match_id: int, numbers: list[int]) -> None:
+        """
+        Replace hold state of the match with the reserved seats of the database
+
+        :param match_id: the match id
+        :type match_id: int
+        :param numbers: numbers of the reserved seats
+        :type numbers: list[int]
+        """
+        with self._lock:
+            self._owners[match_id] = dict.fromkeys(numbers, DATABASE_OWNER)
+            for match_number in [key for key in self._leases if key[0] == match_id]:
+                del self._leases[match_number]
+
+
+class RedisSeatHoldEngine:
+    """
+    Seat hold engine backed by redis
+    - seat-holds:<match id> is a hash of seat number to the owner user id, a
+      leased claim is "<user id>:<expiry unix time>"
+    - seat-holds:pending is the list of holds waiting to be written to database
+    - seat-holds:dropped:<match id> is a hash of seat number to the dropped hold
+    """
+
+    PENDING_KEY = "seat-holds:pending"
+    CLAIM_SCRIPT = """
+    local now = tonumber(redis.call('TIME')[1])
+    local owner = redis.call('HGET', KEYS[1], ARGV[1])
+    if owner then
+        local user, expires_at = string.match(owner, '^(%d+):?(%d*)$')
+        if expires_at == '' or tonumber(expires_at) > now then
+            if user == ARGV[2] then
+                return 2
+            end
+            return 0
+        end
+    end
+    local value = ARGV[2]
+    if ARGV[5] ~= '' then
+        value = value .. ':' .. (now + tonumber(ARGV[5]))
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], value)
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    if ARGV[4] == '1' then
+        redis.call('RPUSH', KEYS[2], ARGV[3])
+    end
+    return 1
+    """
+
+    UNCLAIM_SCRIPT = """
+    local owner = redis.call('HGET', KEYS[1], ARGV[1])
+    if owner and string.match(owner, '^(%d+)') == ARGV[2] then
+        return redis.call('HDEL', KEYS[1], ARGV[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._claim = client.register_script(self.CLAIM_SCRIPT)
+        self._unclaim = client.register_script(self.UNCLAIM_SCRIPT)
+
+    @staticmethod
+    def _key(match_id: int) -> str:
+        return f"seat-holds:{match_id}"
+
+    @staticmethod
+    def _dropped_key(match_id: int) -> str:
+        return f"seat-holds:dropped:{match_id}"
+
+    def claim(
+        self,
+        hold: SeatHold,
+        *,
+        defer: bool = True,
+        ttl: int | None = None,
+    ) -> HoldStatus:
+        status = self._claim(
+            keys=[
+                self._key(hold.match_id),
+                self.PENDING_KEY,
+                self._dropped_key(hold.match_id),
+            ],
+            args=[
+                hold.number,
+                hold.user_id,
+                hold.dumps(),
+                int(defer),
+                "" if ttl is None else ttl,
+            ],
+        )
+        return HoldStatus(int(status))
+
+    def owner(self, match_id: int, number: int) -> int | None:
+        owner = self._client.hget(self._key(match_id), number)
+        if owner is None:
+            return None
+        user_id, _, expires_at = owner.decode().partition(":")
+        if expires_at and int(expires_at) <= time.time():
+            return None
+        return int(user_id)
+
+    def drop(self, holds: list[SeatHold], error: str) -> None:
+        if not holds:
+            return
+        pipeline = self._client.pipeline(transaction=True)
+        for hold in holds:
+            pipeline.hset(
+                self._dropped_key(hold.match_id),
+                hold.number,
+                json.dumps(DroppedHold(hold.user_id, error)),
+            )
+            pipeline.expire(self._dropped_key(hold.match_id), DROPPED_HOLD_TTL)
+        pipeline.execute()
+
+    def dropped(self, match_id: int, number: int) -> DroppedHold | None:
+        value = self._client.hget(self._dropped_key(match_id), number)
+        return None if value is None else DroppedHold(*json.loads(value))
+
+    def mark_reserved(self, match_id: int, numbers: list[int]) -> None:
+        if numbers:
+            self._client.hset(
+                self._key(match_id),
+                mapping=dict.fromkeys(numbers, DATABASE_OWNER),
+            )
+
+    def release(self, match_id: int, numbers: list[int]) -> None:
+        if numbers:
+            self._client.hdel(self._key(match_id), *numbers)
+
+    def unclaim(self, hold: SeatHold) -> None:
+        self._unclaim(keys=[self._key(hold.match_id)], args=[hold.number, hold.user_id])
+
+    def pop_pending(self, count: int) -> list[SeatHold]:
+        values = self._client.lpop(self.PENDING_KEY, count) or []
+        return [SeatHold.loads(value) for value in values]
+
+    def requeue(self, holds: list[SeatHold]) -> None:
+        if holds:
+            self._client.lpush(
+                self.PENDING_KEY,
+                *[hold.dumps() for hold in reversed(holds)],
+            )
+
+    def rebuild(self, match_id: int, numbers: list[int]) -> None:
+        pipeline = self._client.pipeline(transaction=True)
+        pipeline.delete(self._key(match_id))
+        if numbers:
+            pipeline.hset(
+                self._key(match_id),
+                mapping=dict.fromkeys(numbers, DATABASE_OWNER),
+            )
+        pipeline.execute()
+
+
+@cache
+def get_seat_hold_engine() -> LocalSeatHoldEngine | RedisSeatHoldEngine:
+    """
+    Return the seat hold engine of this process,
+    redis when the default cache is redis otherwise the local stand-in
+    """
+    client = redis_connection()
+    if client is None:
+        return LocalSeatHoldEngine()
+    return RedisSeatHoldEngine(client)
+
+
+def get_deferred_seat_hold_engine() -> LocalSeatHoldEngine | RedisSeatHoldEngine:
+    """
+    Return the seat hold engine of deferred holds, they are written to the
+    database by the flusher in another process, so they need the redis engine.
+    The local stand-in is only accepted when DEFERRED_SEAT_HOLDS_IN_PROCESS is set,
+    in tests which run the views and the flusher in one process.
+    :return: the seat hold engine
+    :rtype: LocalSeatHoldEngine | RedisSeatHoldEngine
+    :raises SeatHoldsUnavailableError: if the engine is not redis
+    """
+    engine = get_seat_hold_engine()
+    if isinstance(engine, LocalSeatHoldEngine) and not (
+        settings.DEFERRED_SEAT_HOLDS_IN_PROCESS
+    ):
+        raise SeatHoldsUnavailableError
+    return engine
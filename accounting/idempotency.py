@@ -0,0 +1,250 @@
+"""
+Idempotency keys of the accounting write endpoints
+
+A request with an Idempotency-Key header runs once, its response is stored and
+replayed byte for byte to retries with the same key, without authenticating them
+or touching the database. Duplicates that arrive while the first request is
+running wait for its response instead of racing it.
+Keys are scoped by the credential of the request, its method and path.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from functools import cache
+from functools import partial
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
+from django.http import JsonResponse
+from rest_framework import status
+
+from config.utils import redis_connection
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+# Seconds between checks of a duplicate waiting for the first request
+WAIT_INTERVAL = 0.05
+
+
+class StoredResponse(NamedTuple):
+    status: int
+    content_type: str
+    content: bytes
+    # hash of the request body, a key can not be reused for another body
+    fingerprint: str
+
+    @classmethod
+    def from_response(cls, response, fingerprint: str) -> StoredResponse:
+        return cls(
+            response.status_code,
+            response.get("Content-Type", ""),
+            response.content,
+            fingerprint,
+        )
+
+    def to_response(self) -> HttpResponse:
+        response = HttpResponse(
+            self.content,
+            status=self.status,
+            content_type=self.content_type,
+        )
+        response[REPLAYED_HEADER] = "true"
+        return response
+
+    def dumps(self) -> str:
+        content = base64.b64encode(self.content).decode()
+        return json.dumps(self._replace(content=content))
+
+    @classmethod
+    def loads(cls, value: str | bytes) -> StoredResponse:
+        stored = cls(*json.loads(value))
+        return stored._replace(content=base64.b64decode(stored.content))
+
+
+class LocalIdempotencyStore:
+    """
+    In-process stand-in of the redis idempotency store, used in local development
+    and tests where the default cache is not redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._responses: dict[str, tuple[float, StoredResponse]] = {}
+        self._locks: dict[str, float] = {}
+
+    def get(self, key: str) -> StoredResponse | None:
+        with self._lock:
+            expires_at, response = self._responses.get(key, (0, None))
+            return response if expires_at > time.monotonic() else None
+
+    def acquire(self, key: str, timeout: float) -> bool:
+        with self._lock:
+            if self._locks.get(key, 0) > time.monotonic():
+                return False
+            self._locks[key] = time.monotonic() + timeout
+            return True
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            self._locks.pop(key, None)
+
+    def save(self, key: str, response: StoredResponse, ttl: int) -> None:
+        with self._lock:
+            self._responses[key] = (time.monotonic() + ttl, response)
+            self._locks.pop(key, None)
+
+
+class RedisIdempotencyStore:
+    """
+    Idempotency records stored in redis,
+    idempotency:<scope> is the stored response as json with a ttl and
+    idempotency-lock:<scope> is held while the first request runs.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def get(self, key: str) -> StoredResponse | None:
+        stored = self._client.get(f"idempotency:{key}")
+        return None if stored is None else StoredResponse.loads(stored)
+
+    def acquire(self, key: str, timeout: float) -> bool:
+        return bool(
+            self._client.set(
+                f"idempotency-lock:{key}",
+                1,
+                nx=True,
+                px=int(timeout * 1000),
+            ),
+        )
+
+    def release(self, key: str) -> None:
+        self._client.delete(f"idempotency-lock:{key}")
+
+    def save(self, key: str, response: StoredResponse, ttl: int) -> None:
+        pipeline = self._client.pipeline()
+        pipeline.set(f"idempotency:{key}", response.dumps(), ex=ttl)
+        pipeline.delete(f"idempotency-lock:{key}")
+        pipeline.execute()
+
+
+class _RequestResponses(threading.local):
+    # scopes of the current request whose response is saved when its transaction
+    # commits, None outside of requests
+    scopes: list[str] | None = None
+
+
+_request_responses = _RequestResponses()
+
+
+def start_request_responses() -> None:
+    _request_responses.scopes = []
+
+
+def release_request_responses() -> None:
+    """
+    Release the idempotency locks of the request whose transaction did not
+    commit, e.g. it was rolled back after the view returned or its commit failed,
+    so retries run again instead of waiting for IDEMPOTENCY_LOCK_TIMEOUT.
+    """
+    scopes, _request_responses.scopes = _request_responses.scopes, None
+    store = get_idempotency_store()
+    for scope in scopes or []:
+        store.release(scope)
+
+
+def _save_response(scope: str, response: StoredResponse) -> None:
+    get_idempotency_store().save(scope, response, settings.IDEMPOTENCY_TTL)
+    if _request_responses.scopes is not None and scope in _request_responses.scopes:
+        _request_responses.scopes.remove(scope)
+
+
+@cache
+def get_idempotency_store() -> LocalIdempotencyStore | RedisIdempotencyStore:
+    """
+    Return the idempotency store of this process,
+    redis when the default cache is redis otherwise the local stand-in
+    """
+    client = redis_connection()
+    if client is None:
+        return LocalIdempotencyStore()
+    return RedisIdempotencyStore(client)
+
+
+class IdempotentMixin:
+    """
+    Make the write methods of an APIView idempotent by the Idempotency-Key header
+    Successful responses are stored when the transaction of the request commits,
+    if it does not commit the lock is released when the request finishes,
+    validation errors are stored at once (their transaction is rolled back).
+    Other errors (authentication, throttling, server errors...) are not stored,
+    so they can be retried.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or request.method not in ("POST", "PUT", "PATCH", "DELETE"):
+            return super().dispatch(request, *args, **kwargs)
+        scope = self._idempotency_scope(request, key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        store = get_idempotency_store()
+        stored = store.get(scope)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+        while stored is None and not store.acquire(
+            scope,
+            settings.IDEMPOTENCY_LOCK_TIMEOUT,
+        ):
+            if time.monotonic() > deadline:
+                return JsonResponse(
+                    {"detail": "A request with this idempotency key is running."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+            time.sleep(WAIT_INTERVAL)
+            stored = store.get(scope)
+        if stored is not None:
+            if stored.fingerprint != fingerprint:
+                return JsonResponse(
+                    {"detail": "The idempotency key is used by another request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            return stored.to_response()
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            response.render()
+        except BaseException:
+            store.release(scope)
+            raise
+        self._store_response(
+            scope,
+            StoredResponse.from_response(response, fingerprint),
+        )
+        return response
+
+    @staticmethod
+    def _idempotency_scope(request, key: str) -> str:
+        credential = request.headers.get("Authorization") or request.COOKIES.get(
+            settings.SESSION_COOKIE_NAME,
+            "",
+        )
+        return hashlib.sha256(
+            f"{credential}:{request.method}:{request.path}:{key}".encode(),
+        ).hexdigest()
+
+    @staticmethod
+    def _store_response(scope: str, response: StoredResponse) -> None:
+        store = get_idempotency_store()
+        if status.is_success(response.status):
+            if _request_responses.scopes is not None:
+                _request_responses.scopes.append(scope)
+            transaction.on_commit(partial(_save_response, scope, response))
+        elif response.status == status.HTTP_400_BAD_REQUEST:
+            store.save(scope, response, settings.IDEMPOTENCY_TTL)
+        else:
+            store.release(scope)
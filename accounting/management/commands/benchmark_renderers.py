@@ -0,0 +1,156 @@
+import importlib.util
+import time
+import uuid
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Prefetch
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from accounting.models import Invoice
+from accounting.models import InvoiceItem
+from accounting.serializers import InvoiceSerializer
+from config.renderers import MessagePackRenderer
+from config.renderers import ORJSONRenderer
+from matchticketselling.users.models import User
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.models import Stadium
+from stadium_management.models import Team
+from stadium_management.serializers import SeatSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the serializer and the renderer stages of SeatSerializer and "
+        "InvoiceSerializer lists, with the json renderer of rest framework, the "
+        "orjson renderer and the msgpack renderer when msgpack is installed. "
+        "Its stadium, match, seats, users and invoices are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seats", type=int, default=10000)
+        parser.add_argument("--invoices", type=int, default=1000)
+        parser.add_argument("--items", type=int, default=4, help="Items per invoice")
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=5,
+            help="Runs of each stage, the best one is reported",
+        )
+
+    def handle(self, *args, seats, invoices, items, repeat, **options):
+        renderers = {"json": JSONRenderer(), "orjson": ORJSONRenderer()}
+        if importlib.util.find_spec("msgpack") is not None:
+            renderers["msgpack"] = MessagePackRenderer()
+        with transaction.atomic():
+            match = self._setup(seats, invoices, items)
+            self._benchmark(
+                "SeatSerializer",
+                partial(self._seats, match),
+                renderers,
+                repeat,
+            )
+            self._benchmark(
+                "InvoiceSerializer",
+                partial(self._invoices, match),
+                renderers,
+                repeat,
+            )
+            transaction.set_rollback(True)
+
+    def _benchmark(self, name, serialize, renderers, repeat):
+        data, duration = self._best(serialize, repeat)
+        self.stdout.write(f"{name}: {len(data)} rows, serializer {duration:.1f}ms")
+        for renderer_name, renderer in renderers.items():
+            rendered, duration = self._best(partial(renderer.render, data), repeat)
+            self.stdout.write(
+                f"  {renderer_name:>8}: {duration:>7.1f}ms, "
+                f"{len(rendered) / 1024:.0f} KB",
+            )
+
+    @staticmethod
+    def _best(function, repeat):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = function()
+            durations.append((time.perf_counter() - start) * 1000)
+        return result, min(durations)
+
+    @staticmethod
+    def _seats(match):
+        seats = Seat.objects.filter(match=match).select_related(
+            "match__host_team",
+            "match__guest_team",
+            "match__stadium",
+        )
+        return SeatSerializer(seats, many=True).data
+
+    @staticmethod
+    def _invoices(match):
+        invoices = Invoice.objects.filter(
+            invoiceitem__seat__match=match,
+        ).prefetch_related(
+            Prefetch(
+                "invoiceitem_set",
+                InvoiceItem.objects.select_related(
+                    "seat__match__host_team",
+                    "seat__match__guest_team",
+                    "seat__match__stadium",
+                ),
+            ),
+        )
+        return InvoiceSerializer(invoices.distinct(), many=True).data
+
+    @staticmethod
+    def _setup(seats, invoices, items):
+        name = f"benchmark-{uuid.uuid4().hex[:8]}"
+        stadium = Stadium.objects.create(name=name, description=name, capacity=seats)
+        match = Match.objects.create(
+            host_team=Team.objects.create(name=f"{name}-host"),
+            guest_team=Team.objects.create(name=f"{name}-guest"),
+            stadium=stadium,
+            datetime=timezone.now(),
+            seat_price=1000,
+        )
+        match.create_seats()
+        users = User.objects.bulk_create(
+            [User(username=f"{name}-{index}") for index in range(invoices)],
+        )
+        created = Invoice.objects.bulk_create(
+            [
+                Invoice(
+                    user=user,
+                    status=Invoice.InvoiceStatus.PAID,
+                    total_price=items * match.seat_price,
+                    paid_at=timezone.now(),
+                )
+                for user in users
+            ],
+        )
+        seat_ids = list(
+            Seat.objects.filter(match=match)
+            .order_by("number")
+            .values_list("id", flat=True)[: invoices * items],
+        )
+        InvoiceItem.objects.bulk_create(
+            [
+                InvoiceItem(
+                    invoice=invoice,
+                    seat_id=seat_id,
+                    full_name=f"{name} {index}",
+                    hold_expires_at=None,
+                )
+                for index, (invoice, seat_id) in enumerate(
+                    zip(
+                        (invoice for invoice in created for _ in range(items)),
+                        seat_ids,
+                        strict=False,
+                    ),
+                )
+            ],
+        )
+        return match
@@ -0,0 +1,185 @@
+import random
+import statistics
+import threading
+import time
+import uuid
+from functools import partial
+from types import SimpleNamespace
+
+import pgtrigger
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from accounting.batching import ReservationBatcher
+from accounting.models import Invoice
+from accounting.models import InvoiceItem
+from accounting.reservations import SeatReservation
+from accounting.reservations import reserve_any_seat
+from accounting.serializers import AddInvoiceItemSerializer
+from matchticketselling.users.models import User
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.models import Stadium
+from stadium_management.models import Team
+
+SEAT_TRIGGER = "stadium_management.Seat:protect_reserved_seats_from_update_and_delete"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare reservation throughput and latency of the seat specific path "
+        "(AddInvoiceItemSerializer), the seat specific path with group commit "
+        "(ReservationBatcher) and the any seat path (SKIP LOCKED) "
+        "with the same number of concurrent clients. "
+        "It creates and removes its own stadium, match, seats and users."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=16)
+        parser.add_argument("--seats", type=int, default=2000)
+        parser.add_argument(
+            "--reservations",
+            type=int,
+            default=None,
+            help="Successful reservations to wait for, half of the seats by default",
+        )
+        parser.add_argument(
+            "--popular",
+            type=float,
+            default=0.2,
+            help="Fraction of seats the seat specific clients pick from",
+        )
+        parser.add_argument(
+            "--batch-window",
+            type=float,
+            default=2,
+            help="Milliseconds the group commit batcher collects reservations",
+        )
+
+    def handle(  # noqa: PLR0913
+        self,
+        *args,
+        clients,
+        seats,
+        reservations,
+        popular,
+        batch_window,
+        **options,
+    ):
+        reservations = reservations or seats // 2
+        batcher = ReservationBatcher(window=batch_window / 1000)
+        for name, reserve in (
+            ("specific seat", self._reserve_specific_seat),
+            ("group commit", partial(self._reserve_batched_seat, batcher)),
+            ("any seat", self._reserve_any_seat),
+        ):
+            match, users = self._setup(clients, seats)
+            seat_ids = list(
+                Seat.objects.filter(match=match)
+                .order_by("number")
+                .values_list("id", flat=True),
+            )
+            seat_ids = seat_ids[: max(reservations, int(len(seat_ids) * popular))]
+            try:
+                elapsed, succeeded, failed, latencies = self._run(
+                    users,
+                    seat_ids,
+                    reservations,
+                    partial(reserve, match),
+                )
+            finally:
+                self._teardown(match, users)
+            latencies.sort()
+            self.stdout.write(
+                f"{name:>14}: {succeeded} reserved, {failed} failed attempts "
+                f"in {elapsed:.2f}s, {succeeded / elapsed:.0f} reservations/s, "
+                f"p50 {statistics.median(latencies) * 1000:.1f}ms, "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms",
+            )
+
+    def _run(self, users, seat_ids, reservations, reserve):
+        lock = threading.Lock()
+        counters = {"succeeded": 0, "failed": 0}
+        latencies: list[float] = []
+
+        def client(user):
+            try:
+                while counters["succeeded"] < reservations:
+                    start = time.perf_counter()
+                    try:
+                        reserve(user, random.choice(seat_ids))  # noqa: S311
+                    except ValidationError:
+                        result = "failed"
+                    else:
+                        result = "succeeded"
+                    with lock:
+                        counters[result] += 1
+                        latencies.append(time.perf_counter() - start)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client, args=(user,)) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return (
+            time.perf_counter() - start,
+            counters["succeeded"],
+            counters["failed"],
+            latencies,
+        )
+
+    @staticmethod
+    def _reserve_specific_seat(match, user, seat_id):
+        # the same transaction as a request, ATOMIC_REQUESTS is on
+        with transaction.atomic():
+            serializer = AddInvoiceItemSerializer(
+                data={"seat": seat_id, "full_name": user.username},
+                context={"request": SimpleNamespace(user=user)},
+            )
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+    @staticmethod
+    def _reserve_batched_seat(batcher, match, user, seat_id):
+        # the batcher commits in its own transaction, like in a request
+        batcher.reserve(match.id, SeatReservation(user.id, seat_id, user.username))
+
+    @staticmethod
+    def _reserve_any_seat(match, user, seat_id):
+        with transaction.atomic():
+            reserve_any_seat(user, match.id, full_name=user.username)
+
+    @staticmethod
+    def _setup(clients, seats):
+        name = f"benchmark-{uuid.uuid4().hex[:8]}"
+        stadium = Stadium.objects.create(name=name, description=name, capacity=seats)
+        match = Match.objects.create(
+            host_team=Team.objects.create(name=f"{name}-host"),
+            guest_team=Team.objects.create(name=f"{name}-guest"),
+            stadium=stadium,
+            datetime=timezone.now(),
+            seat_price=1000,
+        )
+        match.create_seats()
+        users = [
+            User.objects.create_user(username=f"{name}-{index}")
+            for index in range(clients)
+        ]
+        return match, users
+
+    @staticmethod
+    def _teardown(match, users):
+        with transaction.atomic(), pgtrigger.ignore(SEAT_TRIGGER):
+            InvoiceItem.objects.filter(invoice__user__in=users).delete()
+            Invoice.objects.filter(user__in=users).delete()
+            teams = [match.host_team, match.guest_team]
+            match.stadium.delete()
+            for team in teams:
+                team.delete()
+            User.objects.filter(id__in=[user.id for user in users]).delete()
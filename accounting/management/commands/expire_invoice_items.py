@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounting.tasks import expire_inactive_invoice_items
+from accounting.tasks import next_hold_expiry
+
+# Minimum seconds between runs, a due hold which is locked by another run or by
+# a payment is skipped and still due, the loop must not spin on it
+MIN_SLEEP = 0.05
+
+
+class Command(BaseCommand):
+    help = (
+        "Expire the invoice items whose hold is due and release their seats, in "
+        "batches. It sleeps until the next hold is due, at most interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Maximum seconds to sleep between runs",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Expire the stale items and exit",
+        )
+
+    def handle(self, *args, batch_size: int, interval: float, once: bool, **options):
+        items_expired = seats_released = 0
+        while True:
+            start = time.perf_counter()
+            run = expire_inactive_invoice_items(batch_size=batch_size)
+            if run.items_expired:
+                items_expired += run.items_expired
+                seats_released += run.seats_released
+                self.stdout.write(
+                    f"items_expired={run.items_expired} "
+                    f"seats_released={run.seats_released} "
+                    f"duration_ms={(time.perf_counter() - start) * 1000:.1f} "
+                    f"items_expired_total={items_expired} "
+                    f"seats_released_total={seats_released}",
+                )
+            if run.items_expired == batch_size:
+                continue
+            if once:
+                return
+            time.sleep(self._sleep_time(interval))
+
+    @staticmethod
+    def _sleep_time(interval: float) -> float:
+        next_expiry = next_hold_expiry()
+        if next_expiry is None:
+            return interval
+        due_in = (next_expiry - timezone.now()).total_seconds()
+        return max(MIN_SLEEP, min(interval, due_in))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from accounting.exceptions import SeatHoldsUnavailableError
+from accounting.holds import get_deferred_seat_hold_engine
+from accounting.tasks import flush_seat_holds
+
+
+class Command(BaseCommand):
+    help = "Write the seat holds of the seat hold engine to the database in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.5,
+            help="Seconds to sleep when there is no pending hold",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Flush the pending holds and exit",
+        )
+
+    def handle(self, *args, batch_size: int, interval: float, once: bool, **options):
+        # the holds of the web processes are only seen through redis
+        try:
+            get_deferred_seat_hold_engine()
+        except SeatHoldsUnavailableError as error:
+            raise CommandError(error.detail) from error
+        while True:
+            processed = flush_seat_holds(batch_size=batch_size)
+            if processed:
+                self.stdout.write(f"{processed} seat holds are flushed")
+                continue
+            if once:
+                return
+            time.sleep(interval)
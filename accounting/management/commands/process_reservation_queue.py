@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounting.reservation_queue import process_reservation_queue
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the queued reservations of the queued reservation mode, "
+        "the queue of each match in batches and in order of arrival"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=0.2,
+            help="Seconds to sleep when there is no queued reservation",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Apply the queued reservations and exit",
+        )
+
+    def handle(self, *args, batch_size: int, interval: float, once: bool, **options):
+        while True:
+            processed = process_reservation_queue(batch_size=batch_size)
+            if processed:
+                self.stdout.write(f"{processed} reservations are processed")
+                continue
+            if once:
+                return
+            time.sleep(interval)
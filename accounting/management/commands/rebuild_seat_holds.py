@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from accounting.exceptions import SeatHoldsUnavailableError
+from accounting.holds import get_deferred_seat_hold_engine
+from accounting.tasks import rebuild_seat_holds
+
+
+class Command(BaseCommand):
+    help = "Rebuild the seat hold engine state from the Seat table"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--match",
+            type=int,
+            action="append",
+            dest="match_ids",
+            help="Match id to rebuild, can be repeated. All matches by default",
+        )
+
+    def handle(self, *args, match_ids: list[int] | None, **options):
+        # the holds of the web processes are only seen through redis
+        try:
+            get_deferred_seat_hold_engine()
+        except SeatHoldsUnavailableError as error:
+            raise CommandError(error.detail) from error
+        rebuild_seat_holds(match_ids)
+        self.stdout.write(self.style.SUCCESS("Seat holds are rebuilt"))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:34
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_pending_invoices(apps, schema_editor):
+    """Move items of duplicate pending invoices of a user to the oldest one"""
+    Invoice = apps.get_model("accounting", "Invoice")
+    InvoiceItem = apps.get_model("accounting", "InvoiceItem")
+    users = (
+        Invoice.objects.filter(status="PEND")
+        .values("user_id")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+        .values_list("user_id", flat=True)
+    )
+    for user_id in users:
+        invoices = list(
+            Invoice.objects.filter(status="PEND", user_id=user_id).order_by("id"),
+        )
+        kept, duplicates = invoices[0], invoices[1:]
+        InvoiceItem.objects.filter(invoice__in=duplicates).update(invoice=kept)
+        kept.total_price = sum(invoice.total_price or 0 for invoice in invoices)
+        kept.save(update_fields=["total_price"])
+        Invoice.objects.filter(id__in=[invoice.id for invoice in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounting", "0002_alter_invoice_total_price"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_pending_invoices, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="invoice",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "PEND")),
+                fields=("user",),
+                name="one_pending_invoice_per_user",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0004_alter_seat_full_name_alter_seat_is_reserved'),
+        ('accounting', '0003_one_pending_invoice_per_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoiceitem',
+            name='seat',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='stadium_management.seat'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0005_partition_seat_by_match'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounting', '0004_invoiceitem_seat_without_db_constraint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservationRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('full_name', models.CharField(max_length=127)),
+                ('status', models.CharField(choices=[('QUED', 'Queued'), ('RESV', 'Reserved'), ('FAIL', 'Failed')], default='QUED', max_length=4)),
+                ('error', models.CharField(blank=True, max_length=63)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='accounting.invoiceitem')),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stadium_management.match')),
+                ('seat', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='stadium_management.seat')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'reservation_request',
+                'verbose_name_plural': 'reservation_requests',
+                'indexes': [models.Index(condition=models.Q(('status', 'QUED')), fields=['match', 'id'], name='queued_reservation_requests')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:02
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+import accounting.models
+
+
+def set_hold_expiry_times(apps, schema_editor):
+    """Only live items of pending invoices hold their seats"""
+    InvoiceItem = apps.get_model("accounting", "InvoiceItem")
+    InvoiceItem.objects.exclude(invoice__status="PEND", expired=False).update(
+        hold_expires_at=None,
+    )
+    InvoiceItem.objects.filter(invoice__status="PEND", expired=False).update(
+        hold_expires_at=F("created_at")
+        + timedelta(seconds=settings.INVOICE_ITEM_HOLD_TIME),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounting", "0005_reservationrequest"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoiceitem",
+            name="hold_expires_at",
+            field=models.DateTimeField(
+                blank=True,
+                default=accounting.models.hold_expiry_time,
+                null=True,
+            ),
+        ),
+        migrations.RunPython(set_hold_expiry_times, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="invoiceitem",
+            index=models.Index(
+                condition=models.Q(("hold_expires_at__isnull", False)),
+                fields=["hold_expires_at"],
+                name="invoice_item_holds",
+            ),
+        ),
+    ]
@@ -1,15 +1,71 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
 from django.db import models
+from django.db import transaction
 from django.db.models import CheckConstraint
 from django.db.models import Q
+from django.db.models import Sum
 from django.db.models import UniqueConstraint
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from accounting.exceptions import NoLiveInvoiceItemsError
 from config.utils import TimeStampedModel
 from matchticketselling.users.models import User
+from stadium_management.models import Match
 from stadium_management.models import Seat
 
 
+class InvoiceManager(models.Manager):
+    UPSERT_PENDING_SQL = """
+    INSERT INTO {invoice} (user_id, status, total_price, created_at)
+    VALUES (%(user_id)s, %(status)s, %(total_price)s, %(created_at)s)
+    ON CONFLICT (user_id) WHERE status = %(status)s
+    DO UPDATE SET total_price = {invoice}.total_price + EXCLUDED.total_price
+    RETURNING {columns}
+    """
+
+    def get_or_create_pending(self, user_id: int, total_price: int = 0) -> Invoice:
+        """
+        Get or create the pending invoice of the user and add total_price to it
+        It's one INSERT ... ON CONFLICT ... RETURNING statement on the partial unique
+        index of pending invoices, so concurrent requests of a user can not create
+        two pending invoices and there is no extra SELECT.
+        :param user_id: the user id
+        :type user_id: int
+        :param total_price: amount to add to the invoice total price
+        :type total_price: int
+        :return: the pending invoice, with the updated total price
+        :rtype: Invoice
+        """
+        fields = self.model._meta.concrete_fields  # noqa: SLF001
+        sql = self.UPSERT_PENDING_SQL.format(
+            invoice=self.model._meta.db_table,  # noqa: SLF001
+            columns=", ".join(field.column for field in fields),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                sql,
+                {
+                    "user_id": user_id,
+                    "status": Invoice.InvoiceStatus.PENDING,
+                    "total_price": total_price,
+                    "created_at": timezone.now(),
+                },
+            )
+            row = cursor.fetchone()
+        return self.model.from_db(
+            self.db,
+            [field.attname for field in fields],
+            row,
+        )
+
+
 class Invoice(TimeStampedModel):
     class InvoiceStatus(models.TextChoices):
         PENDING = "PEND", "Pending"
@@ -26,29 +82,95 @@ class Invoice(TimeStampedModel):
     total_price = models.PositiveIntegerField(default=0)
     paid_at = models.DateTimeField(null=True, blank=True)
 
+    objects = InvoiceManager()
+
     class Meta:
         verbose_name = _("invoice")
         verbose_name_plural = _("invoices")
+        constraints = [
+            UniqueConstraint(
+                fields=["user"],
+                condition=Q(status="PEND"),
+                name="one_pending_invoice_per_user",
+            ),
+        ]
 
     def __str__(self):
         return f"invoice of {self.user} has status {self.status}"
 
-    def pay(self):
+    def pay(self) -> bool:
+        """
+        Pay the invoice if it's still pending, for its items which are not expired
+        The items are locked first, in the order of the expiry run, so the run
+        skips them (SKIP LOCKED) or the payment waits for the run to commit and
+        sees its items expired. The total is recomputed from the live locked items,
+        items added by a concurrent reservation are not paid and expire.
+        :return: False if the invoice is not pending anymore
+        :rtype: bool
+        :raises NoLiveInvoiceItemsError: if the invoice has no live items to pay
+        """
+        with transaction.atomic():
+            item_ids = list(
+                self.invoiceitem_set.select_for_update()
+                .filter(expired=False)
+                .order_by("id")
+                .values_list("id", flat=True),
+            )
+            if not item_ids:
+                raise NoLiveInvoiceItemsError
+            total_price = InvoiceItem.objects.filter(id__in=item_ids).aggregate(
+                total_price=Coalesce(Sum("seat__price"), 0),
+            )["total_price"]
+            paid_at = timezone.now()
+            if not Invoice.objects.filter(
+                id=self.id,
+                status=Invoice.InvoiceStatus.PENDING,
+            ).update(
+                status=Invoice.InvoiceStatus.PAID,
+                paid_at=paid_at,
+                total_price=total_price,
+            ):
+                return False
+            # paid seats are not held anymore, they must not be expired
+            InvoiceItem.objects.filter(id__in=item_ids).update(hold_expires_at=None)
         self.status = Invoice.InvoiceStatus.PAID
-        self.paid_at = timezone.now()
-        self.save(update_fields=["status", "paid_at"])
+        self.paid_at = paid_at
+        self.total_price = total_price
+        return True
+
+
+def hold_expiry_time():
+    return timezone.now() + timedelta(seconds=settings.INVOICE_ITEM_HOLD_TIME)
 
 
 class InvoiceItem(models.Model):
     invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE)
-    seat = models.ForeignKey(Seat, on_delete=models.PROTECT)
+    # the seat table is partitioned by match, its primary key is (id, match_id)
+    # and postgres can not reference its id alone by a foreign key constraint.
+    # Referential integrity is not enforced by the database: PROTECT only guards
+    # deletes made through the ORM, a raw delete or a dropped partition of the
+    # seat table (seat_partitions --drop) leaves items pointing at no seat
+    seat = models.ForeignKey(Seat, on_delete=models.PROTECT, db_constraint=False)
     full_name = models.CharField(max_length=127)
     created_at = models.DateTimeField(default=timezone.now)
     expired = models.BooleanField(default=False)
+    # the item holds its seat until then, null once it's expired or paid
+    hold_expires_at = models.DateTimeField(
+        default=hold_expiry_time,
+        null=True,
+        blank=True,
+    )
 
     class Meta:
         verbose_name = _("invoice_item")
         verbose_name_plural = _("invoice_items")
+        indexes = [
+            models.Index(
+                fields=["hold_expires_at"],
+                condition=Q(hold_expires_at__isnull=False),
+                name="invoice_item_holds",
+            ),
+        ]
         constraints = [
             UniqueConstraint(
                 fields=["invoice_id", "seat_id"],
@@ -62,3 +184,51 @@ class InvoiceItem(models.Model):
 
     def __str__(self):
         return f"item of invoice {self.invoice_id} for seat {self.seat_id}"
+
+
+class ReservationRequest(models.Model):
+    """
+    A reservation of a seat waiting in the queue of its match, it's created by
+    AddInvoiceItemView in the queued reservation mode and applied by
+    accounting.reservation_queue.process_match_queue.
+    """
+
+    class RequestStatus(models.TextChoices):
+        QUEUED = "QUED", "Queued"
+        RESERVED = "RESV", "Reserved"
+        FAILED = "FAIL", "Failed"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    match = models.ForeignKey(Match, on_delete=models.CASCADE)
+    # see InvoiceItem.seat
+    seat = models.ForeignKey(Seat, on_delete=models.CASCADE, db_constraint=False)
+    full_name = models.CharField(max_length=127)
+    status = models.CharField(
+        choices=RequestStatus.choices,
+        default=RequestStatus.QUEUED,
+        max_length=4,
+    )
+    # code of the error of a failed request, e.g. already_reserved_seat
+    error = models.CharField(max_length=63, blank=True)
+    item = models.ForeignKey(
+        InvoiceItem,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("reservation_request")
+        verbose_name_plural = _("reservation_requests")
+        indexes = [
+            models.Index(
+                fields=["match", "id"],
+                condition=Q(status="QUED"),
+                name="queued_reservation_requests",
+            ),
+        ]
+
+    def __str__(self):
+        return f"reservation request {self.id} for seat {self.seat_id}"
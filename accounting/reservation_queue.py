@@ -0,0 +1,142 @@
+"""
+Queued reservation mode
+
+For the biggest on-sales AddInvoiceItemView only puts the reservation on the queue
+of its match (the ReservationRequest table) and answers 202 Accepted with a
+ticket, the client polls or long-polls the ticket for the result.
+A worker drains the queue of each match in order of arrival and applies a batch
+of reservations in one transaction. The queue of a match is drained by one
+worker at a time, so the writers of a match never wait on each other's row locks.
+"""
+
+from __future__ import annotations
+
+import time
+import typing
+
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+
+from accounting.models import InvoiceItem
+from accounting.models import ReservationRequest
+from accounting.reservations import SeatReservation
+from accounting.reservations import reserve_seats_in_order
+
+if typing.TYPE_CHECKING:
+    from matchticketselling.users.models import User
+
+# Seconds between checks of a long-polled ticket
+POLL_INTERVAL = 0.1
+# Namespace of the advisory locks of match queues
+LOCK_NAMESPACE = "accounting.reservation_queue"
+
+
+def process_reservation_queue(batch_size: int = 500) -> int:
+    """
+    Apply one batch of the queue of every match which has queued reservations,
+    matches whose queue is drained by another worker are skipped.
+    :param batch_size: maximum number of reservations of a match to apply
+    :type batch_size: int
+    :return: number of processed reservations, zero when the queues are empty
+    :rtype: int
+    """
+    match_ids = (
+        ReservationRequest.objects.filter(
+            status=ReservationRequest.RequestStatus.QUEUED,
+        )
+        .order_by("match_id")
+        .values_list("match_id", flat=True)
+        .distinct()
+    )
+    return sum(
+        process_match_queue(match_id, batch_size=batch_size)
+        for match_id in list(match_ids)
+    )
+
+
+def process_match_queue(match_id: int, batch_size: int = 500) -> int:
+    """
+    Apply the oldest queued reservations of the match in one transaction, in
+    order of arrival (see reserve_seats_in_order)
+    :param match_id: the match id
+    :type match_id: int
+    :param batch_size: maximum number of reservations to apply
+    :type batch_size: int
+    :return: number of processed reservations, zero if the queue is empty or
+        drained by another worker
+    :rtype: int
+    """
+    with transaction.atomic():
+        if not _try_lock_match_queue(match_id):
+            return 0
+        requests = list(
+            ReservationRequest.objects.filter(
+                match_id=match_id,
+                status=ReservationRequest.RequestStatus.QUEUED,
+            ).order_by("id")[:batch_size],
+        )
+        if not requests:
+            return 0
+        results = reserve_seats_in_order(
+            match_id,
+            [
+                SeatReservation(request.user_id, request.seat_id, request.full_name)
+                for request in requests
+            ],
+        )
+        processed_at = timezone.now()
+        for request, result in zip(requests, results, strict=True):
+            request.processed_at = processed_at
+            if isinstance(result, InvoiceItem):
+                request.status = ReservationRequest.RequestStatus.RESERVED
+                request.item = result
+            else:
+                request.status = ReservationRequest.RequestStatus.FAILED
+                request.error = result.default_code
+        ReservationRequest.objects.bulk_update(
+            requests,
+            fields=["status", "error", "item", "processed_at"],
+        )
+    return len(requests)
+
+
+def _try_lock_match_queue(match_id: int) -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_try_advisory_xact_lock(hashtext(%s), %s)",
+            [LOCK_NAMESPACE, match_id],
+        )
+        return cursor.fetchone()[0]
+
+
+def wait_for_reservation(
+    ticket: int,
+    user: User,
+    timeout: float,
+) -> ReservationRequest | None:
+    """
+    Return the reservation request of the ticket once it's processed or the
+    timeout passes, whichever comes first.
+    Call it out of a transaction, a long poll must not keep one open.
+    :param ticket: the reservation request id
+    :type ticket: int
+    :param user: owner of the request
+    :type user: User
+    :param timeout: maximum seconds to wait, at most RESERVATION_QUEUE_MAX_WAIT
+    :type timeout: float
+    :return: the reservation request, None if the user has not such a ticket
+    :rtype: ReservationRequest | None
+    """
+    deadline = time.monotonic() + min(timeout, settings.RESERVATION_QUEUE_MAX_WAIT)
+    requests = ReservationRequest.objects.filter(id=ticket, user=user)
+    request = requests.first()
+    while (
+        request is not None
+        and request.status == ReservationRequest.RequestStatus.QUEUED
+        and time.monotonic() < deadline
+    ):
+        time.sleep(POLL_INTERVAL)
+        request = requests.first()
+    return request
@@ -0,0 +1,622 @@
+import threading
+from collections import defaultdict
+from datetime import datetime
+from datetime import timedelta
+from functools import partial
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from accounting.exceptions import AlreadyReservedSeatError
+from accounting.exceptions import NotEnoughFreeSeatsError
+from accounting.exceptions import SeatDoesNotExistError
+from accounting.holds import HoldStatus
+from accounting.holds import SeatHold
+from accounting.holds import get_seat_hold_engine
+from accounting.models import Invoice
+from accounting.models import InvoiceItem
+from matchticketselling.users.models import User
+from stadium_management.availability import ensure_seat_availability
+from stadium_management.availability import get_seat_availability
+from stadium_management.inventory import materialize_seats
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.signals import seats_reserved
+from stadium_management.signals import send_on_commit
+
+# Allocation retries when the bitmap offers seats which are held or reserved
+MAX_ALLOCATION_ROUNDS = 3
+
+# Pick the lowest numbered free seat of the match and reserve it in one statement,
+# rows locked by concurrent buyers are skipped instead of waited for.
+RESERVE_ANY_SEAT_SQL = """
+WITH picked AS (
+    SELECT id FROM {seat}
+    WHERE match_id = %(match_id)s
+        AND NOT is_reserved
+        AND (%(price)s::integer IS NULL OR price = %(price)s::integer)
+        AND number <> ALL(%(excluded)s::integer[])
+    ORDER BY number
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE {seat} AS seat SET is_reserved = true, full_name = %(full_name)s
+FROM picked
+WHERE seat.id = picked.id
+RETURNING seat.id, seat.number, seat.price
+"""
+
+
+# Reserve a free seat, upsert the pending invoice of the buyer and insert the
+# invoice item in one statement. The UPDATE locks the seat row and checks
+# is_reserved again after a concurrent reservation of the seat commits, so the
+# row is locked only for this statement and the commit.
+# It always returns one row, the reservation columns are null when the seat is
+# reserved or does not exist.
+RESERVE_SEAT_SQL = """
+WITH reserved AS (
+    UPDATE {seat} SET is_reserved = true, full_name = %(full_name)s
+    WHERE id = %(seat_id)s AND match_id = %(match_id)s AND NOT is_reserved
+    RETURNING id, number, price
+), invoice AS (
+    INSERT INTO {invoice} (user_id, status, total_price, created_at)
+    SELECT %(user_id)s, %(status)s, price, %(now)s FROM reserved
+    ON CONFLICT (user_id) WHERE status = %(status)s
+    DO UPDATE SET total_price = {invoice}.total_price + EXCLUDED.total_price
+    RETURNING id
+), item AS (
+    INSERT INTO {item} (
+        invoice_id, seat_id, full_name, created_at, expired, hold_expires_at
+    )
+    SELECT invoice.id, reserved.id, %(full_name)s, %(now)s, false, %(expires_at)s
+    FROM reserved, invoice
+    RETURNING id, invoice_id
+)
+SELECT
+    EXISTS(SELECT FROM {seat} WHERE id = %(seat_id)s AND match_id = %(match_id)s),
+    reserved.number,
+    reserved.price,
+    item.id,
+    item.invoice_id
+FROM (VALUES (1)) AS one
+LEFT JOIN reserved ON true
+LEFT JOIN item ON true
+"""
+
+
+class _RequestClaims(threading.local):
+    # claims of the current request whose transaction has not committed yet,
+    # None outside of requests
+    holds: list[SeatHold] | None = None
+
+
+_request_claims = _RequestClaims()
+
+
+def start_request_claims() -> None:
+    _request_claims.holds = []
+
+
+def release_request_claims() -> None:
+    """
+    Release the claims of the request whose transaction did not commit, e.g. it
+    was rolled back or its commit failed. They would expire after
+    SEAT_CLAIM_TTL anyway, this makes their seats free at once.
+    """
+    holds, _request_claims.holds = _request_claims.holds, None
+    release_holds(holds or [])
+
+
+def _confirm_request_claims(holds: list[SeatHold]) -> None:
+    if _request_claims.holds is not None:
+        _request_claims.holds = [
+            hold for hold in _request_claims.holds if hold not in holds
+        ]
+
+
+def claim_seat(hold: SeatHold) -> HoldStatus:
+    """
+    Claim the seat of the hold in the seat hold engine for the transaction which
+    writes it, the claim is leased for SEAT_CLAIM_TTL seconds and becomes
+    permanent when the seat is marked reserved on commit
+    :param hold: the seat hold
+    :type hold: SeatHold
+    :return: claimed, duplicate (already held by this user) or rejected
+    :rtype: HoldStatus
+    """
+    status = get_seat_hold_engine().claim(
+        hold,
+        defer=False,
+        ttl=settings.SEAT_CLAIM_TTL,
+    )
+    if (
+        status == HoldStatus.CLAIMED
+        and _request_claims.holds is not None
+        and connection.in_atomic_block
+    ):
+        _request_claims.holds.append(hold)
+        transaction.on_commit(partial(_confirm_request_claims, [hold]))
+    return status
+
+
+def claim_seats(
+    user_id: int,
+    seats: list[Seat],
+    full_names: list[str],
+) -> list[SeatHold]:
+    """
+    Claim the seats in the seat hold engine before they are written, so a seat
+    held by another user (whose hold is not written to the database yet) is not
+    sold. Seats already held by the user are not claimed again.
+    :param user_id: the buyer
+    :type user_id: int
+    :param seats: the seats, their match_id and number are used
+    :type seats: list[Seat]
+    :param full_names: full name of each seat owner, in the order of seats
+    :type full_names: list[str]
+    :return: the holds claimed by this call, release them if the seats are not
+        written
+    :rtype: list[SeatHold]
+    :raises AlreadyReservedSeatError: if a seat is held by another user, nothing
+        is claimed then
+    """
+    claimed: list[SeatHold] = []
+    for seat, full_name in zip(seats, full_names, strict=True):
+        hold = SeatHold(seat.match_id, seat.number, user_id, full_name)
+        status = claim_seat(hold)
+        if status == HoldStatus.REJECTED:
+            release_holds(claimed)
+            raise AlreadyReservedSeatError
+        if status == HoldStatus.CLAIMED:
+            claimed.append(hold)
+    return claimed
+
+
+def release_holds(holds: list[SeatHold]) -> None:
+    """Release the seats of the holds which are still claimed by their users"""
+    engine = get_seat_hold_engine()
+    for hold in holds:
+        engine.unclaim(hold)
+
+
+def seat_of_number(match_id: int, number: int) -> Seat:
+    """
+    Return the seat of the number for the reservations which take seats, the
+    seat of a lazy match is materialized first, see stadium_management.inventory
+    :param match_id: the match id
+    :type match_id: int
+    :param number: the seat number
+    :type number: int
+    :return: the seat, only its id, match_id and number are loaded
+    :rtype: Seat
+    :raises SeatDoesNotExistError: if the match has no seat of the number
+    """
+    materialize_seats(match_id, [number])
+    seat = (
+        Seat.objects.filter(match_id=match_id, number=number)
+        .only("id", "match_id", "number")
+        .first()
+    )
+    if seat is None:
+        raise SeatDoesNotExistError
+    return seat
+
+
+def reserve_seat(user: User, seat: Seat, full_name: str) -> InvoiceItem:
+    """
+    Reserve the seat for the user in one round trip, see RESERVE_SEAT_SQL
+    The seat is claimed in the seat hold engine first.
+    :param user: the buyer
+    :type user: User
+    :param seat: the seat, only its id, match_id and number are used
+    :type seat: Seat
+    :param full_name: full name of the seat owner
+    :type full_name: str
+    :return: created invoice item
+    :rtype: InvoiceItem
+    """
+    created_at = timezone.now()
+    hold_expires_at = created_at + timedelta(seconds=settings.INVOICE_ITEM_HOLD_TIME)
+    claimed = claim_seats(user.id, [seat], [full_name])
+    try:
+        exists, number, price, item_id, invoice_id = _execute_reserve_seat(
+            user,
+            seat,
+            full_name,
+            created_at,
+            hold_expires_at,
+        )
+    except Exception:
+        release_holds(claimed)
+        raise
+    if item_id is None:
+        if not exists:
+            release_holds(claimed)
+            raise SeatDoesNotExistError
+        # reserved in the database, but the engine did not know it
+        for hold in claimed:
+            get_seat_hold_engine().mark_reserved(hold.match_id, [hold.number])
+        raise AlreadyReservedSeatError
+    seat = Seat(
+        id=seat.id,
+        match_id=seat.match_id,
+        number=number,
+        price=price,
+        is_reserved=True,
+        full_name=full_name,
+    )
+    send_on_commit(seats_reserved, [seat])
+    return InvoiceItem(
+        id=item_id,
+        invoice_id=invoice_id,
+        seat=seat,
+        full_name=full_name,
+        created_at=created_at,
+        hold_expires_at=hold_expires_at,
+    )
+
+
+def _execute_reserve_seat(
+    user: User,
+    seat: Seat,
+    full_name: str,
+    created_at: datetime,
+    hold_expires_at: datetime,
+) -> tuple:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RESERVE_SEAT_SQL.format(
+                seat=Seat._meta.db_table,  # noqa: SLF001
+                invoice=Invoice._meta.db_table,  # noqa: SLF001
+                item=InvoiceItem._meta.db_table,  # noqa: SLF001
+            ),
+            {
+                "seat_id": seat.id,
+                "match_id": seat.match_id,
+                "user_id": user.id,
+                "full_name": full_name,
+                "status": Invoice.InvoiceStatus.PENDING,
+                "now": created_at,
+                "expires_at": hold_expires_at,
+            },
+        )
+        return cursor.fetchone()
+
+
+def reserve_seats(
+    user: User,
+    seats: list[Seat],
+    full_names: list[str],
+) -> list[InvoiceItem]:
+    """
+    Reserve all the seats for the user or none of them
+    Seats are locked by one SELECT ... FOR UPDATE ordered by id, so concurrent
+    reservations lock rows in the same order and can not deadlock. The seats are
+    looked up within their matches, so only the partitions of the matches are
+    read.
+    Seats are updated by one bulk update, the pending invoice is upserted with the
+    total price of the seats and the invoice items are bulk inserted.
+    :param user: the buyer
+    :type user: User
+    :param seats: seats to reserve, only their id and match_id are used
+    :type seats: list[Seat]
+    :param full_names: full name of each seat owner, in the order of seats
+    :type full_names: list[str]
+    :return: created invoice items
+    :rtype: list[InvoiceItem]
+    """
+    seat_full_names = {
+        seat.id: full_name for seat, full_name in zip(seats, full_names, strict=True)
+    }
+    with transaction.atomic():
+        seats = list(
+            Seat.objects.select_for_update()
+            .filter(
+                match_id__in={seat.match_id for seat in seats},
+                id__in=seat_full_names,
+            )
+            .order_by("id"),
+        )
+        if len(seats) != len(seat_full_names):
+            raise SeatDoesNotExistError
+        if any(seat.is_reserved for seat in seats):
+            raise AlreadyReservedSeatError
+        claimed = claim_seats(
+            user.id,
+            seats,
+            [seat_full_names[seat.id] for seat in seats],
+        )
+        try:
+            for seat in seats:
+                seat.is_reserved = True
+                seat.full_name = seat_full_names[seat.id]
+            Seat.objects.bulk_update(seats, fields=["is_reserved", "full_name"])
+            invoice = Invoice.objects.get_or_create_pending(
+                user.id,
+                total_price=sum(seat.price for seat in seats),
+            )
+            items = InvoiceItem.objects.bulk_create(
+                [
+                    InvoiceItem(invoice=invoice, seat=seat, full_name=seat.full_name)
+                    for seat in seats
+                ],
+            )
+        except Exception:
+            release_holds(claimed)
+            raise
+        send_on_commit(seats_reserved, seats)
+    return items
+
+
+class SeatReservation(NamedTuple):
+    user_id: int
+    seat_id: int
+    full_name: str
+
+
+def reserve_seats_in_order(
+    match_id: int,
+    reservations: list[SeatReservation],
+) -> list[InvoiceItem | ValidationError]:
+    """
+    Apply the reservations of several buyers for seats of the match in one
+    transaction, in order: the first reservation of a seat wins and the later
+    ones fail without failing the others.
+    Seats are locked by one query ordered by id and claimed in the seat hold
+    engine, then seats, invoices and invoice items are written in bulk.
+    :param match_id: the match id
+    :type match_id: int
+    :param reservations: the reservations, in order of arrival
+    :type reservations: list[SeatReservation]
+    :return: the invoice item of each reservation or its error
+    :rtype: list[InvoiceItem | ValidationError]
+    """
+    with transaction.atomic():
+        seats = {
+            seat.id: seat
+            for seat in Seat.objects.select_for_update()
+            .filter(
+                match_id=match_id,
+                id__in={reservation.seat_id for reservation in reservations},
+            )
+            .order_by("id")
+        }
+        results: list[ValidationError | None] = []
+        reserved: list[SeatReservation] = []
+        claimed: list[SeatHold] = []
+        for reservation in reservations:
+            seat = seats.get(reservation.seat_id)
+            if seat is None:
+                results.append(SeatDoesNotExistError())
+                continue
+            if not seat.is_reserved:
+                try:
+                    claimed += claim_seats(
+                        reservation.user_id,
+                        [seat],
+                        [reservation.full_name],
+                    )
+                except AlreadyReservedSeatError:
+                    pass
+                else:
+                    seat.is_reserved = True
+                    seat.full_name = reservation.full_name
+                    reserved.append(reservation)
+                    results.append(None)
+                    continue
+            results.append(AlreadyReservedSeatError())
+        try:
+            items = iter(_write_reservations(reserved, seats) if reserved else [])
+        except Exception:
+            release_holds(claimed)
+            raise
+    return [next(items) if result is None else result for result in results]
+
+
+def _write_reservations(
+    reserved: list[SeatReservation],
+    seats: dict[int, Seat],
+) -> list[InvoiceItem]:
+    Seat.objects.bulk_update(
+        [seats[reservation.seat_id] for reservation in reserved],
+        fields=["is_reserved", "full_name"],
+    )
+    totals: dict[int, int] = defaultdict(int)
+    for reservation in reserved:
+        totals[reservation.user_id] += seats[reservation.seat_id].price
+    invoices = {
+        user_id: Invoice.objects.get_or_create_pending(user_id, total_price=total)
+        for user_id, total in sorted(totals.items())
+    }
+    items = InvoiceItem.objects.bulk_create(
+        [
+            InvoiceItem(
+                invoice=invoices[reservation.user_id],
+                seat=seats[reservation.seat_id],
+                full_name=reservation.full_name,
+            )
+            for reservation in reserved
+        ],
+    )
+    send_on_commit(seats_reserved, [item.seat for item in items])
+    return items
+
+
+def reserve_best_available_seats(
+    user: User,
+    match_id: int,
+    full_names: list[str],
+) -> list[InvoiceItem]:
+    """
+    Pick the best available (lowest numbered) free seats of the match and reserve
+    them. Free seats are taken from the match bitmap, so concurrent buyers get
+    different seats instead of colliding on the same rows, then they are claimed
+    in the seat hold engine to respect holds which are not written to database yet.
+    :param user: the buyer
+    :type user: User
+    :param match_id: the match id
+    :type match_id: int
+    :param full_names: full name of each seat owner, one seat for each of them
+    :type full_names: list[str]
+    :return: created invoice items
+    :rtype: list[InvoiceItem]
+    """
+    availability = ensure_seat_availability(match_id)
+    engine = get_seat_hold_engine()
+    seats: list[Seat] = []
+    for _ in range(MAX_ALLOCATION_ROUNDS):
+        numbers = availability.allocate(match_id, len(full_names) - len(seats))
+        if not numbers:
+            break
+        # the names left for this round, the seats get theirs again once sorted
+        names = full_names[len(seats) :]
+        claimed = [
+            number
+            for number, full_name in zip(numbers, names, strict=False)
+            if claim_seat(SeatHold(match_id, number, user.id, full_name))
+            == HoldStatus.CLAIMED
+        ]
+        materialize_seats(match_id, claimed)
+        free_seats = list(
+            Seat.objects.filter(
+                match_id=match_id,
+                number__in=claimed,
+                is_reserved=False,
+            ).only("id", "match_id", "number"),
+        )
+        free_numbers = {seat.number for seat in free_seats}
+        engine.mark_reserved(
+            match_id,
+            [number for number in claimed if number not in free_numbers],
+        )
+        seats += free_seats
+        if len(seats) == len(full_names):
+            break
+    seats.sort(key=lambda seat: seat.number)
+    try:
+        if len(seats) == len(full_names):
+            return reserve_seats(user, seats, full_names)
+    except Exception:
+        _free_allocated_seats(match_id, seats)
+        raise
+    _free_allocated_seats(match_id, seats)
+    raise NotEnoughFreeSeatsError
+
+
+def _free_allocated_seats(match_id: int, seats: list[Seat]) -> None:
+    numbers = [seat.number for seat in seats]
+    get_seat_hold_engine().release(match_id, numbers)
+    get_seat_availability().mark_free(match_id, numbers)
+
+
+def reserve_any_seat(
+    user: User,
+    match_id: int,
+    full_name: str,
+    price: int | None = None,
+) -> InvoiceItem:
+    """
+    Reserve any free seat of the match, optionally with the given price
+    The seat is picked and reserved by one UPDATE with FOR UPDATE SKIP LOCKED, so
+    concurrent buyers spread over the free rows instead of queueing on a row lock.
+    Seats held in the seat hold engine are skipped.
+    :param user: the buyer
+    :type user: User
+    :param match_id: the match id
+    :type match_id: int
+    :param full_name: full name of the seat owner
+    :type full_name: str
+    :param price: price of the seat, any price if it's None
+    :type price: int | None
+    :return: created invoice item
+    :rtype: InvoiceItem
+    """
+    engine = get_seat_hold_engine()
+    excluded: list[int] = []
+    with transaction.atomic():
+        for _ in range(MAX_ALLOCATION_ROUNDS):
+            savepoint = transaction.savepoint()
+            seat = _pick_any_seat(match_id, full_name, price, excluded)
+            if seat is None:
+                transaction.savepoint_rollback(savepoint)
+                return _reserve_any_lazy_seat(user, match_id, full_name, price)
+            hold = SeatHold(match_id, seat.number, user.id, full_name)
+            if claim_seat(hold) != HoldStatus.REJECTED:
+                transaction.savepoint_commit(savepoint)
+                break
+            # the seat is held but the hold is not written to the database yet
+            transaction.savepoint_rollback(savepoint)
+            excluded.append(seat.number)
+        else:
+            raise NotEnoughFreeSeatsError
+        try:
+            invoice = Invoice.objects.get_or_create_pending(
+                user.id,
+                total_price=seat.price,
+            )
+            item = InvoiceItem.objects.create(
+                invoice=invoice,
+                seat=seat,
+                full_name=full_name,
+            )
+        except Exception:
+            engine.release(match_id, [seat.number])
+            raise
+        send_on_commit(seats_reserved, [seat])
+    return item
+
+
+def _reserve_any_lazy_seat(
+    user: User,
+    match_id: int,
+    full_name: str,
+    price: int | None,
+) -> InvoiceItem:
+    # seats of a lazy match which have never been reserved have no rows to pick,
+    # they all have the seat price of the match
+    seat_price = (
+        Match.objects.filter(
+            id=match_id,
+            lazy_seats=True,
+            seats_status=Match.SeatsStatus.READY,
+        )
+        .values_list("seat_price", flat=True)
+        .first()
+    )
+    if seat_price is None or price not in (None, seat_price):
+        raise NotEnoughFreeSeatsError
+    return reserve_best_available_seats(user, match_id, [full_name])[0]
+
+
+def _pick_any_seat(
+    match_id: int,
+    full_name: str,
+    price: int | None,
+    excluded: list[int],
+) -> Seat | None:
+    seat_table = Seat._meta.db_table  # noqa: SLF001
+    with connection.cursor() as cursor:
+        cursor.execute(
+            RESERVE_ANY_SEAT_SQL.format(seat=seat_table),
+            {
+                "match_id": match_id,
+                "price": price,
+                "excluded": excluded,
+                "full_name": full_name,
+            },
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return Seat(
+        id=row[0],
+        match_id=match_id,
+        number=row[1],
+        price=row[2],
+        is_reserved=True,
+        full_name=full_name,
+    )
@@ -1,11 +1,23 @@
-from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.conf import settings
 from rest_framework import serializers
 
+from accounting.batching import get_reservation_batcher
 from accounting.exceptions import AlreadyReservedSeatError
-from accounting.exceptions import ProcessFailed
+from accounting.exceptions import DuplicateSeatError
+from accounting.exceptions import SeatNotGivenError
+from accounting.holds import HoldStatus
+from accounting.holds import SeatHold
+from accounting.holds import get_deferred_seat_hold_engine
 from accounting.models import Invoice
 from accounting.models import InvoiceItem
+from accounting.models import ReservationRequest
+from accounting.reservations import SeatReservation
+from accounting.reservations import reserve_any_seat
+from accounting.reservations import reserve_best_available_seats
+from accounting.reservations import reserve_seat
+from accounting.reservations import reserve_seats
+from accounting.reservations import seat_of_number
+from config.utils import parse_id
 from stadium_management.models import Seat
 
 
@@ -44,10 +56,52 @@ class InvoiceSerializer(serializers.ModelSerializer):
         return obj.get_status_display()
 
 
+def validate_seat_of_number(attrs: dict, seat_field: str) -> dict:
+    """
+    Replace the number of the attrs by the seat of the number, a seat is given by
+    its id or by its match and number
+    """
+    number = attrs.pop("number", None)
+    if seat_field in attrs:
+        if number is not None:
+            raise SeatNotGivenError
+        return attrs
+    if attrs.get("match") is None or number is None:
+        raise SeatNotGivenError
+    seat = seat_of_number(attrs["match"], number)
+    attrs[seat_field] = seat if seat_field == "seat" else seat.id
+    return attrs
+
+
+class SeatOfMatchField(serializers.PrimaryKeyRelatedField):
+    """
+    A seat by its id, looked up within the match of the request when it's given,
+    so only the partition of the match is read
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        data = self.parent.initial_data
+        match_id = parse_id(data.get("match")) if hasattr(data, "get") else None
+        if match_id is not None:
+            queryset = queryset.filter(match_id=match_id)
+        return queryset
+
+
 class AddInvoiceItemSerializer(serializers.ModelSerializer):
+    seat = SeatOfMatchField(queryset=Seat.objects.all(), required=False)
+    # the seats of a lazy match which have no id yet are reserved by number
+    match = serializers.IntegerField(min_value=1, required=False, write_only=True)
+    number = serializers.IntegerField(min_value=1, required=False, write_only=True)
+
     class Meta:
         model = InvoiceItem
-        fields = ["seat", "full_name"]
+        fields = ["seat", "full_name", "match", "number"]
+
+    def validate(self, attrs: dict) -> dict:
+        attrs = validate_seat_of_number(attrs, "seat")
+        attrs.pop("match", None)
+        return attrs
 
     @property
     def _user(self):
@@ -59,28 +113,221 @@ class AddInvoiceItemSerializer(serializers.ModelSerializer):
         we can have a mechanisem to reserve the seat for this user for 10 minutes and
         Then if the user pay this invoice, it's finalized and
         If the user does not reserve the invoice it will be expired.
+        The seat is reserved in one round trip by reserve_seat. When
+        RESERVATION_BATCH_WINDOW is set it's reserved by the reservation batcher,
+        in its own transaction with the reservations of other requests of this
+        process (see accounting.batching for the deployments where that pays off).
         :param validated_data:
         :type validated_data:
         :return:
         :rtype:
         """
-        with transaction.atomic():
-            seat = validated_data.pop("seat")
-            seat: Seat = get_object_or_404(Seat.objects.select_for_update(), id=seat.id)
-            if seat.is_reserved:
-                raise AlreadyReservedSeatError
-            seat.is_reserved = True
-            seat.full_name = validated_data["full_name"]
-            seat.save(update_fields=["is_reserved", "full_name"])
-            invoice, _ = Invoice.objects.get_or_create(
-                status=Invoice.InvoiceStatus.PENDING,
-                user=self._user,
+        if settings.RESERVATION_BATCH_WINDOW:
+            return get_reservation_batcher().reserve(
+                validated_data["seat"].match_id,
+                SeatReservation(
+                    self._user.id,
+                    validated_data["seat"].id,
+                    validated_data["full_name"],
+                ),
             )
-            invoice.total_price += seat.price
-            invoice.save(update_fields=["total_price"])
-            return InvoiceItem.objects.create(
-                invoice=invoice,
-                seat=seat,
-                **validated_data,
-            )
-        raise ProcessFailed
+        return reserve_seat(
+            self._user,
+            validated_data["seat"],
+            validated_data["full_name"],
+        )
+
+
+class ReservationRequestSerializer(serializers.ModelSerializer):
+    """
+    Put a reservation of a seat on the queue of its match, see
+    accounting.reservation_queue
+    """
+
+    ticket = serializers.IntegerField(source="id", read_only=True)
+    status = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReservationRequest
+        fields = ["ticket", "status", "match", "seat", "full_name", "error", "item"]
+        read_only_fields = ["match", "error", "item"]
+
+    @property
+    def _user(self):
+        return self.context["request"].user
+
+    def get_status(self, obj: ReservationRequest) -> str:
+        return obj.get_status_display()
+
+    def validate_seat(self, seat: Seat) -> Seat:
+        # the worker rejects it too, but most of such requests end here
+        if seat.is_reserved:
+            raise AlreadyReservedSeatError
+        return seat
+
+    def create(self, validated_data: dict) -> ReservationRequest:
+        return ReservationRequest.objects.create(
+            user=self._user,
+            match_id=validated_data["seat"].match_id,
+            **validated_data,
+        )
+
+
+class LongPollSerializer(serializers.Serializer):
+    wait = serializers.FloatField(min_value=0, default=0)
+
+
+class ReservationItemSerializer(serializers.Serializer):
+    # the match of the seat, its seats are looked up in its partition
+    match = serializers.IntegerField(min_value=1, write_only=True)
+    seat = serializers.IntegerField(source="seat_id", min_value=1, required=False)
+    full_name = serializers.CharField(max_length=127)
+    # see AddInvoiceItemSerializer
+    number = serializers.IntegerField(min_value=1, required=False, write_only=True)
+
+    def validate(self, attrs: dict) -> dict:
+        return validate_seat_of_number(attrs, "seat_id")
+
+
+class AddInvoiceItemsSerializer(serializers.Serializer):
+    """
+    Reserve several seats in one request, e.g. a family buying seats together
+    """
+
+    MAX_ITEMS = 20
+
+    items = ReservationItemSerializer(
+        many=True,
+        allow_empty=False,
+        max_length=MAX_ITEMS,
+    )
+
+    @property
+    def _user(self):
+        return self.context["request"].user
+
+    def validate_items(self, items: list[dict]) -> list[dict]:
+        seat_ids = [item["seat_id"] for item in items]
+        if len(set(seat_ids)) != len(seat_ids):
+            raise DuplicateSeatError
+        return items
+
+    def create(self, validated_data: dict) -> dict:
+        """
+        Reserve all the seats or none of them
+        :param validated_data: validated data dictionary
+        :type validated_data: dict
+        :return: created invoice items
+        :rtype: dict
+        """
+        items = validated_data["items"]
+        return {
+            "items": reserve_seats(
+                self._user,
+                seats=[
+                    Seat(id=item["seat_id"], match_id=item["match"]) for item in items
+                ],
+                full_names=[item["full_name"] for item in items],
+            ),
+        }
+
+
+class BestAvailableSeatsSerializer(serializers.Serializer):
+    """
+    Reserve the best available seats of a match, one seat for each full name
+    """
+
+    match = serializers.IntegerField(min_value=1, write_only=True)
+    full_names = serializers.ListField(
+        child=serializers.CharField(max_length=127),
+        allow_empty=False,
+        max_length=AddInvoiceItemsSerializer.MAX_ITEMS,
+        write_only=True,
+    )
+    items = ReservationItemSerializer(many=True, read_only=True)
+
+    @property
+    def _user(self):
+        return self.context["request"].user
+
+    def create(self, validated_data: dict) -> dict:
+        return {
+            "match": validated_data["match"],
+            "items": reserve_best_available_seats(
+                self._user,
+                match_id=validated_data["match"],
+                full_names=validated_data["full_names"],
+            ),
+        }
+
+
+class AddAnySeatInvoiceItemSerializer(serializers.Serializer):
+    """
+    Reserve any free seat of a match, optionally only seats with the given price
+    """
+
+    match = serializers.IntegerField(min_value=1, write_only=True)
+    price = serializers.IntegerField(min_value=0, required=False)
+    full_name = serializers.CharField(max_length=127)
+    seat = serializers.IntegerField(read_only=True)
+    number = serializers.IntegerField(read_only=True)
+
+    @property
+    def _user(self):
+        return self.context["request"].user
+
+    def create(self, validated_data: dict) -> dict:
+        item = reserve_any_seat(
+            self._user,
+            match_id=validated_data["match"],
+            full_name=validated_data["full_name"],
+            price=validated_data.get("price"),
+        )
+        return {
+            "match": item.seat.match_id,
+            "price": item.seat.price,
+            "full_name": item.full_name,
+            "seat": item.seat.id,
+            "number": item.seat.number,
+        }
+
+
+class HoldSeatSerializer(serializers.Serializer):
+    match = serializers.IntegerField(source="match_id", min_value=1)
+    number = serializers.IntegerField(min_value=1)
+    full_name = serializers.CharField(max_length=127)
+
+    @property
+    def _user(self):
+        return self.context["request"].user
+
+    def create(self, validated_data: dict) -> SeatHold:
+        """
+        Claim the seat in the seat hold engine without touching the database,
+        the hold is written to the database later by the flusher.
+        :param validated_data: validated data dictionary
+        :type validated_data: dict
+        :return: the claimed seat hold
+        :rtype: SeatHold
+        """
+        hold = SeatHold(user_id=self._user.id, **validated_data)
+        if get_deferred_seat_hold_engine().claim(hold) == HoldStatus.REJECTED:
+            raise AlreadyReservedSeatError
+        return hold
+
+
+class HoldSeatStatusSerializer(serializers.Serializer):
+    """
+    State of a hold of the user: held until the flusher writes it, reserved once
+    it's written to the invoice, or dropped with the code of its error
+    """
+
+    HELD = "held"
+    RESERVED = "reserved"
+    DROPPED = "dropped"
+
+    match = serializers.IntegerField()
+    number = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=[HELD, RESERVED, DROPPED])
+    error = serializers.CharField(allow_blank=True)
+    item = serializers.IntegerField(allow_null=True)
@@ -0,0 +1,41 @@
+from django.core.signals import request_finished
+from django.core.signals import request_started
+from django.dispatch import receiver
+
+from accounting.holds import get_seat_hold_engine
+from accounting.idempotency import release_request_responses
+from accounting.idempotency import start_request_responses
+from accounting.reservations import release_request_claims
+from accounting.reservations import start_request_claims
+from stadium_management.signals import seats_released
+from stadium_management.signals import seats_reserved
+
+
+@receiver(seats_reserved)
+def mark_seat_holds_reserved(sender, match_id: int, numbers: list[int], **kwargs):
+    get_seat_hold_engine().mark_reserved(match_id, numbers)
+
+
+@receiver(seats_released)
+def release_seat_holds(sender, match_id: int, numbers: list[int], **kwargs):
+    get_seat_hold_engine().release(match_id, numbers)
+
+
+@receiver(request_started)
+def start_seat_claims(sender, **kwargs):
+    start_request_claims()
+
+
+@receiver(request_finished)
+def release_uncommitted_seat_claims(sender, **kwargs):
+    release_request_claims()
+
+
+@receiver(request_started)
+def start_idempotent_responses(sender, **kwargs):
+    start_request_responses()
+
+
+@receiver(request_finished)
+def release_uncommitted_idempotency_keys(sender, **kwargs):
+    release_request_responses()
@@ -1,34 +1,237 @@
-from datetime import timedelta
+from collections import defaultdict
+from datetime import datetime
+from typing import NamedTuple
 
+import pgtrigger
+from django.db import connection
 from django.db import transaction
-from django.db.models import OuterRef
-from django.db.models import Subquery
-from django.db.models import Sum
+from django.db.models import Min
+from django.db.models import Q
 from django.utils import timezone
 
+from accounting.exceptions import AlreadyReservedSeatError
+from accounting.exceptions import SeatDoesNotExistError
+from accounting.holds import SeatHold
+from accounting.holds import get_seat_hold_engine
 from accounting.models import Invoice
 from accounting.models import InvoiceItem
+from stadium_management.inventory import materialize_seats
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.partitions import SEAT_TRIGGER
+from stadium_management.signals import seats_released
+from stadium_management.signals import seats_reserved
+from stadium_management.signals import send_on_commit
 
+# Expire the items whose hold is due, in order of their deadlines by the
+# invoice_item_holds index, so a run reads only the due holds. Items locked by
+# another expiry run or by a removal are skipped instead of waited for.
+EXPIRE_ITEMS_SQL = """
+WITH due AS (
+    SELECT id FROM {item}
+    WHERE hold_expires_at <= %s
+    ORDER BY hold_expires_at
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+)
+UPDATE {item} AS item SET expired = true, hold_expires_at = NULL
+FROM due
+WHERE item.id = due.id
+RETURNING item.seat_id, item.invoice_id
+"""
+# Release the seats of the expired items, positional parameters as
+# pgtrigger.ignore prepends its own statement with them
+RELEASE_SEATS_SQL = """
+UPDATE {seat} SET is_reserved = false, full_name = ''
+WHERE id = ANY(%s) AND is_reserved
+RETURNING id, match_id, number
+"""
+# Recompute the totals of the pending invoices whose items were expired by the
+# run, from their live items grouped by invoice. An invoice without live items
+# gets a zero total.
+UPDATE_TOTALS_SQL = """
+UPDATE {invoice} AS invoice SET total_price = totals.total_price
+FROM (
+    SELECT
+        touched.id,
+        COALESCE(SUM(seat.price) FILTER (WHERE NOT item.expired), 0) AS total_price
+    FROM unnest(%s::bigint[]) AS touched(id)
+    JOIN {item} AS item ON item.invoice_id = touched.id
+    JOIN {seat} AS seat ON seat.id = item.seat_id
+    GROUP BY touched.id
+) AS totals
+WHERE invoice.id = totals.id AND invoice.status = %s
+"""
 
-def expire_inactive_invoice_items():
-    # TODO: it must be setup in celery as periodic task to be run each 5 minutes
+
+class ExpiryRun(NamedTuple):
+    items_expired: int
+    seats_released: int
+
+
+def expire_inactive_invoice_items(batch_size: int = 500) -> ExpiryRun:
+    """
+    Expire a batch of the items whose hold is due (see InvoiceItem.hold_expires_at)
+    and release their seats, it's run by the expire_invoice_items command.
+    Items, seats and the totals of the touched invoices are updated by one
+    statement each, the reserved seats protection trigger is ignored for the
+    release.
+    :param batch_size: maximum number of items to expire
+    :type batch_size: int
+    :return: number of expired items and released seats
+    :rtype: ExpiryRun
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                EXPIRE_ITEMS_SQL.format(item=InvoiceItem._meta.db_table),  # noqa: SLF001
+                [timezone.now(), batch_size],
+            )
+            rows = cursor.fetchall()
+        seat_ids = [seat_id for seat_id, _ in rows]
+        if not seat_ids:
+            return ExpiryRun(0, 0)
+        with pgtrigger.ignore(SEAT_TRIGGER), connection.cursor() as cursor:
+            cursor.execute(
+                RELEASE_SEATS_SQL.format(seat=Seat._meta.db_table),  # noqa: SLF001
+                [seat_ids],
+            )
+            seats = [
+                Seat(id=seat_id, match_id=match_id, number=number)
+                for seat_id, match_id, number in cursor.fetchall()
+            ]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                UPDATE_TOTALS_SQL.format(
+                    invoice=Invoice._meta.db_table,  # noqa: SLF001
+                    item=InvoiceItem._meta.db_table,  # noqa: SLF001
+                    seat=Seat._meta.db_table,  # noqa: SLF001
+                ),
+                [
+                    sorted({invoice_id for _, invoice_id in rows}),
+                    Invoice.InvoiceStatus.PENDING,
+                ],
+            )
+        send_on_commit(seats_released, seats)
+    return ExpiryRun(len(seat_ids), len(seats))
+
+
+def next_hold_expiry() -> datetime | None:
+    """
+    Return the deadline of the hold which is due first, None if there is no hold
     """
-    This celery task check invoices and expire inactive invoice items after 10 minutes
-    and make seat free
-    :return: Nothing
-    :rtype: None
+    return InvoiceItem.objects.filter(hold_expires_at__isnull=False).aggregate(
+        next_expiry=Min("hold_expires_at"),
+    )["next_expiry"]
+
+
+def flush_seat_holds(batch_size: int = 500) -> int:
+    """
+    Write a batch of the holds claimed in the seat hold engine to the database
+    All seats of the batch are locked in one query (ordered by id to avoid
+    deadlocks), then seats, invoices and invoice items are written in bulk.
+    Holds of seats that do not exist are released and holds of seats that are
+    reserved in the database anyway are left to the database, both are recorded
+    as dropped for their users (see HoldSeatStatusView).
+    If writing fails the holds are put back to the queue.
+    :param batch_size: maximum number of holds to write
+    :type batch_size: int
+    :return: number of processed holds, zero when the queue is empty
+    :rtype: int
     """
+    engine = get_seat_hold_engine()
+    holds = engine.pop_pending(batch_size)
+    if not holds:
+        return 0
+    try:
+        missing, taken = _write_seat_holds(holds)
+    except Exception:
+        engine.requeue(holds)
+        raise
+    for hold in missing:
+        engine.release(hold.match_id, [hold.number])
+    for hold in taken:
+        engine.mark_reserved(hold.match_id, [hold.number])
+    engine.drop(missing, SeatDoesNotExistError.default_code)
+    engine.drop(taken, AlreadyReservedSeatError.default_code)
+    return len(holds)
+
+
+def _write_seat_holds(
+    holds: list[SeatHold],
+) -> tuple[list[SeatHold], list[SeatHold]]:
+    condition = Q()
+    numbers: dict[int, list[int]] = defaultdict(list)
+    for hold in holds:
+        condition |= Q(match_id=hold.match_id, number=hold.number)
+        numbers[hold.match_id].append(hold.number)
     with transaction.atomic():
-        invoices = Invoice.objects.filter(status=Invoice.InvoiceStatus.PENDING)
-        items = InvoiceItem.objects.filter(
-            invoice__in=Subquery(invoices.values("id")),
-            created_at__lte=timezone.now() - timedelta(minutes=10),
+        for match_id, match_numbers in sorted(numbers.items()):
+            materialize_seats(match_id, match_numbers)
+        seats = {
+            (seat.match_id, seat.number): seat
+            for seat in Seat.objects.select_for_update()
+            .filter(condition)
+            .order_by("id")
+        }
+        reserved: list[tuple[SeatHold, Seat]] = []
+        missing: list[SeatHold] = []
+        taken: list[SeatHold] = []
+        for hold in holds:
+            seat = seats.get((hold.match_id, hold.number))
+            if seat is None:
+                missing.append(hold)
+                continue
+            if seat.is_reserved:
+                taken.append(hold)
+                continue
+            seat.is_reserved = True
+            seat.full_name = hold.full_name
+            reserved.append((hold, seat))
+        if not reserved:
+            return missing, taken
+        Seat.objects.bulk_update(
+            [seat for _, seat in reserved],
+            fields=["is_reserved", "full_name"],
         )
-        items.update(expired=True)
-        invoices.update(
-            total_price=Subquery(
-                InvoiceItem.objects.filter(invoice_id=OuterRef("id"), expired=False)
-                .annotate(total_price=Sum("seat__price"))
-                .values("total_price"),
-            ),
+        totals: dict[int, int] = defaultdict(int)
+        for hold, seat in reserved:
+            totals[hold.user_id] += seat.price
+        invoices = {
+            user_id: Invoice.objects.get_or_create_pending(user_id, total_price=total)
+            for user_id, total in sorted(totals.items())
+        }
+        InvoiceItem.objects.bulk_create(
+            [
+                InvoiceItem(
+                    invoice=invoices[hold.user_id],
+                    seat=seat,
+                    full_name=hold.full_name,
+                )
+                for hold, seat in reserved
+            ],
         )
+        send_on_commit(seats_reserved, [seat for _, seat in reserved])
+    return missing, taken
+
+
+def rebuild_seat_holds(match_ids: list[int] | None = None) -> None:
+    """
+    Rebuild the seat hold engine state from the Seat table, e.g. after a redis
+    restart. Pending holds are flushed first, so they are part of the rebuilt state.
+    :param match_ids: matches to rebuild, all of them if it's None
+    :type match_ids: list[int] | None
+    """
+    while flush_seat_holds():
+        pass
+    engine = get_seat_hold_engine()
+    if match_ids is None:
+        match_ids = list(Match.objects.values_list("id", flat=True))
+    reserved: dict[int, list[int]] = defaultdict(list)
+    for match_id, number in Seat.objects.filter(
+        match_id__in=match_ids,
+        is_reserved=True,
+    ).values_list("match_id", "number"):
+        reserved[match_id].append(number)
+    for match_id in match_ids:
+        engine.rebuild(match_id, reserved[match_id])
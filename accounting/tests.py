@@ -1,18 +1,69 @@
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
 from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
 
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+from django.db import connection
+from django.db import transaction
+from django.test import RequestFactory
+from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from model_bakery import baker
 from rest_framework import status
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
+from rest_framework.test import APITransactionTestCase
 
+from accounting.batching import get_reservation_batcher
+from accounting.exceptions import AlreadyReservedSeatError
+from accounting.holds import DATABASE_OWNER
+from accounting.holds import HoldStatus
+from accounting.holds import LocalSeatHoldEngine
+from accounting.holds import SeatHold
+from accounting.holds import get_seat_hold_engine
+from accounting.idempotency import IDEMPOTENCY_HEADER
+from accounting.idempotency import REPLAYED_HEADER
+from accounting.idempotency import IdempotentMixin
+from accounting.idempotency import StoredResponse
+from accounting.idempotency import get_idempotency_store
+from accounting.management.commands.expire_invoice_items import MIN_SLEEP
 from accounting.models import Invoice
 from accounting.models import InvoiceItem
+from accounting.models import ReservationRequest
+from accounting.reservation_queue import process_match_queue
+from accounting.reservation_queue import process_reservation_queue
+from accounting.reservations import SeatReservation
+from accounting.reservations import release_request_claims
+from accounting.reservations import reserve_seat
+from accounting.reservations import reserve_seats_in_order
+from accounting.reservations import start_request_claims
+from accounting.serializers import AddInvoiceItemSerializer
+from accounting.tasks import ExpiryRun
+from accounting.tasks import expire_inactive_invoice_items
+from accounting.tasks import flush_seat_holds
+from accounting.tasks import next_hold_expiry
+from accounting.tasks import rebuild_seat_holds
+from config.throttling import get_sliding_windows
 from matchticketselling.users.models import User
+from stadium_management.availability import ensure_seat_availability
+from stadium_management.availability import get_seat_availability
+from stadium_management.availability import unpack_seat_numbers
 from stadium_management.models import Match
 from stadium_management.models import Seat
 from stadium_management.models import Stadium
 from stadium_management.models import Team
+from stadium_management.waiting_room import WAITING_ROOM_HEADER
+from stadium_management.waiting_room import get_waiting_room
+from stadium_management.waiting_room import make_waiting_room_token
 
 
 class BaseAuthenticatedUserAPITestCase(APITestCase):
@@ -159,6 +210,155 @@ class AddInvoiceItemViewTest(BaseAuthenticatedUserAPITestCase):
         assert response.status_code == status.HTTP_400_BAD_REQUEST
         assert response.data["seat"][0].code == "does_not_exist"
 
+    def test_seat_is_looked_up_in_the_match(self):
+        other_match = baker.make(Match)
+        response = self.client.post(
+            self.get_url(),
+            data={"seat": self.seat.id, "match": other_match.id, "full_name": "a"},
+        )
+        assert response.data["seat"][0].code == "does_not_exist"
+        response = self.client.post(
+            self.get_url(),
+            data={"seat": self.seat.id, "match": self.seat.match_id, "full_name": "a"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_reservation_is_one_statement(self):
+        serializer = AddInvoiceItemSerializer(
+            data={"seat": self.seat.id, "full_name": "Jon Smith"},
+            context={"request": SimpleNamespace(user=self.user)},
+        )
+        serializer.is_valid(raise_exception=True)
+        with self.assertNumQueries(1):
+            item = serializer.save()
+        assert item.invoice.total_price == self.seat.price
+        assert item.seat.is_reserved
+
+    def test_seat_reserved_after_validation(self):
+        serializer = AddInvoiceItemSerializer(
+            data={"seat": self.seat.id, "full_name": "Jon Smith"},
+            context={"request": SimpleNamespace(user=self.user)},
+        )
+        serializer.is_valid(raise_exception=True)
+        Seat.objects.filter(id=self.seat.id).update(is_reserved=True, full_name="name")
+        with pytest.raises(AlreadyReservedSeatError):
+            serializer.save()
+        assert not Invoice.objects.exists()
+
+
+class AddAnySeatInvoiceItemViewTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:add-any-seat-invoice-item"
+
+    def setUp(self):
+        super().setUp()
+        get_seat_hold_engine.cache_clear()
+        self.match = baker.make(Match)
+        baker.make(Seat, match=self.match, number=1, is_reserved=True, full_name="a")
+        baker.make(Seat, match=self.match, number=2, price=1000)
+        baker.make(Seat, match=self.match, number=3, price=2000)
+
+    def reserve(self, **data):
+        return self.client.post(
+            self.get_url(),
+            data={"match": self.match.id, "full_name": "Jon Smith", **data},
+        )
+
+    def test_reserve_lowest_free_seat(self):
+        response = self.reserve()
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["number"] == Seat.objects.get(full_name="Jon Smith").number
+        invoice = Invoice.objects.get(user=self.user)
+        assert invoice.total_price == response.data["price"]
+
+    def test_reserve_with_price(self):
+        response = self.reserve(price=2000)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Seat.objects.get(full_name="Jon Smith").price == response.data["price"]
+
+    def test_held_seat_is_skipped(self):
+        get_seat_hold_engine().claim(SeatHold(self.match.id, 2, 0, "name"))
+        response = self.reserve()
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Seat.objects.get(full_name="Jon Smith").number == response.data["number"]
+        assert not Seat.objects.get(match=self.match, number=2).is_reserved
+
+    def test_sold_out(self):
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+        response = self.reserve()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0].code == "not_enough_free_seats"
+
+
+class AddInvoiceItemsViewTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:add-invoice-items"
+
+    def setUp(self):
+        super().setUp()
+        self.match = baker.make(Match)
+        self.seat1 = baker.make(Seat, match=self.match, number=1, price=1000)
+        self.seat2 = baker.make(Seat, match=self.match, number=2, price=2000)
+        self.reserved_seat = baker.make(
+            Seat,
+            match=self.match,
+            number=3,
+            is_reserved=True,
+            full_name="full name",
+        )
+
+    def reserve(self, *seats):
+        return self.client.post(
+            self.get_url(),
+            data={
+                "items": [
+                    {
+                        "match": self.match.id,
+                        "seat": seat.id,
+                        "full_name": f"name {seat.number}",
+                    }
+                    for seat in seats
+                ],
+            },
+            format="json",
+        )
+
+    def test_add_items(self):
+        seats = [self.seat1, self.seat2]
+        response = self.reserve(*seats)
+        assert response.status_code == status.HTTP_201_CREATED
+        invoice = Invoice.objects.get(user=self.user)
+        assert invoice.total_price == sum(seat.price for seat in seats)
+        assert invoice.invoiceitem_set.count() == len(seats)
+        self.seat2.refresh_from_db()
+        assert self.seat2.is_reserved
+        assert self.seat2.full_name == "name 2"
+
+    def test_all_or_nothing(self):
+        response = self.reserve(self.seat1, self.reserved_seat)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        self.seat1.refresh_from_db()
+        assert not self.seat1.is_reserved
+        assert not Invoice.objects.exists()
+
+    def test_duplicate_seat(self):
+        response = self.reserve(self.seat1, self.seat1)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data["items"][0].code == "duplicate_seat"
+        assert not InvoiceItem.objects.exists()
+
+    def test_seat_not_found(self):
+        missing_seat = baker.prepare(Seat, id=self.reserved_seat.id + 1)
+        response = self.reserve(self.seat1, missing_seat)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0].code == "does_not_exist"
+
+    def test_seat_of_another_match_is_not_found(self):
+        other_seat = baker.make(Seat, number=1)
+        response = self.reserve(self.seat1, other_seat)
+        assert response.data[0].code == "does_not_exist"
+        other_seat.refresh_from_db()
+        assert not other_seat.is_reserved
+
 
 class RemoveItemFromInvoiceViewTest(BaseAuthenticatedUserAPITestCase):
     namespace = "api:accounting:remove-invoice-item"
@@ -197,6 +397,11 @@ class PayInvoiceView(BaseAuthenticatedUserAPITestCase):
             paid_at=None,
             status=Invoice.InvoiceStatus.PENDING,
         )
+        self.item = baker.make(
+            InvoiceItem,
+            invoice=self.invoice,
+            seat=baker.make(Seat, price=1000, is_reserved=True, full_name="name"),
+        )
 
     def test_pay_invoice(self):
         response = self.client.post(
@@ -206,3 +411,928 @@ class PayInvoiceView(BaseAuthenticatedUserAPITestCase):
         self.invoice.refresh_from_db()
         assert self.invoice.paid_at is not None
         assert self.invoice.status == Invoice.InvoiceStatus.PAID
+        assert self.invoice.total_price == 1000  # noqa: PLR2004
+
+    def test_invoice_of_expired_items_is_not_paid(self):
+        InvoiceItem.objects.update(expired=True, hold_expires_at=None)
+        response = self.client.post(
+            self.get_url(kwargs={"invoice_id": self.invoice.id}),
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0].code == "no_live_invoice_items"
+        self.invoice.refresh_from_db()
+        assert self.invoice.status == Invoice.InvoiceStatus.PENDING
+        assert self.invoice.paid_at is None
+
+
+class BestAvailableSeatsViewTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:best-available-seats"
+
+    def setUp(self):
+        super().setUp()
+        get_seat_availability.cache_clear()
+        get_seat_hold_engine.cache_clear()
+        self.match = baker.make(Match)
+        for number in range(1, 5):
+            baker.make(Seat, match=self.match, number=number, price=1000)
+        Seat.objects.filter(number=1).update(is_reserved=True, full_name="name")
+
+    def reserve(self, *full_names):
+        return self.client.post(
+            self.get_url(),
+            data={"match": self.match.id, "full_names": full_names},
+            format="json",
+        )
+
+    def test_reserve_best_available_seats(self):
+        response = self.reserve("Jon Smith", "Jane Smith")
+        assert response.status_code == status.HTTP_201_CREATED
+        reserved = Seat.objects.filter(match=self.match, full_name__endswith="Smith")
+        assert sorted(reserved.values_list("number", flat=True)) == [2, 3]
+        assert Invoice.objects.get(user=self.user).invoiceitem_set.count() == len(
+            response.data["items"],
+        )
+
+    def test_each_seat_gets_its_own_name(self):
+        get_seat_hold_engine().claim(SeatHold(self.match.id, 2, 0, "name"))
+        response = self.reserve("Jon Smith", "Jane Smith")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert [item["full_name"] for item in response.data["items"]] == [
+            "Jon Smith",
+            "Jane Smith",
+        ]
+        assert list(
+            InvoiceItem.objects.order_by("seat__number").values_list(
+                "seat__number",
+                "full_name",
+                "seat__full_name",
+            ),
+        ) == [(3, "Jon Smith", "Jon Smith"), (4, "Jane Smith", "Jane Smith")]
+
+    def test_held_seats_are_skipped(self):
+        get_seat_hold_engine().claim(SeatHold(self.match.id, 2, 0, "name"))
+        response = self.reserve("Jon Smith")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Seat.objects.get(match=self.match, number=3).is_reserved
+
+    def test_not_enough_free_seats(self):
+        response = self.reserve("a", "b", "c", "d")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0].code == "not_enough_free_seats"
+        assert not InvoiceItem.objects.exists()
+        assert self.reserve("a", "b", "c").status_code == status.HTTP_201_CREATED
+
+
+class HoldSeatViewTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:hold-seat"
+
+    def setUp(self):
+        super().setUp()
+        get_seat_hold_engine.cache_clear()
+        self.match = baker.make(Match)
+        self.seat = baker.make(Seat, match=self.match, number=1, price=1000)
+
+    def hold(self, number=1):
+        return self.client.post(
+            self.get_url(),
+            data={"match": self.match.id, "number": number, "full_name": "Jon Smith"},
+        )
+
+    def test_hold_is_written_by_flush(self):
+        response = self.hold()
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        self.seat.refresh_from_db()
+        assert not self.seat.is_reserved
+        assert flush_seat_holds() == 1
+        self.seat.refresh_from_db()
+        assert self.seat.is_reserved
+        assert self.seat.full_name == "Jon Smith"
+        invoice = Invoice.objects.get(user=self.user)
+        assert invoice.total_price == self.seat.price
+        assert invoice.invoiceitem_set.get().seat_id == self.seat.id
+
+    def test_duplicate_hold_is_not_queued(self):
+        self.hold()
+        response = self.hold()
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert len(get_seat_hold_engine().pop_pending(10)) == 1
+
+    def test_held_seat_is_rejected(self):
+        self.hold()
+        other = User.objects.create_user(username="other")
+        self.client.force_authenticate(user=other)
+        response = self.hold()
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_hold_of_missing_seat_is_released(self):
+        self.hold(number=2)
+        flush_seat_holds()
+        assert not Invoice.objects.exists()
+        assert self.hold_status(number=2).data["error"] == "does_not_exist"
+        assert self.hold(number=2).status_code == status.HTTP_202_ACCEPTED
+        assert self.hold_status(number=2).data["status"] == "held"
+
+    def hold_status(self, number=1):
+        return self.client.get(
+            reverse(
+                "api:accounting:hold-seat-status",
+                kwargs={"match_id": self.match.id, "number": number},
+            ),
+        )
+
+    def test_hold_status(self):
+        assert self.hold_status().status_code == status.HTTP_404_NOT_FOUND
+        self.hold()
+        assert self.hold_status().data["status"] == "held"
+        flush_seat_holds()
+        response = self.hold_status()
+        assert response.data["status"] == "reserved"
+        assert response.data["item"] == InvoiceItem.objects.get().id
+        self.client.force_authenticate(User.objects.create_user(username="other"))
+        assert self.hold_status().status_code == status.HTTP_404_NOT_FOUND
+
+    def test_held_seat_is_not_sold_by_seat_id(self):
+        self.hold()
+        other = User.objects.create_user(username="other")
+        self.client.force_authenticate(user=other)
+        for url, data in (
+            (
+                "api:accounting:add-invoice-item",
+                {"seat": self.seat.id, "full_name": "other"},
+            ),
+            (
+                "api:accounting:add-invoice-items",
+                {
+                    "items": [
+                        {
+                            "match": self.match.id,
+                            "seat": self.seat.id,
+                            "full_name": "other",
+                        },
+                    ],
+                },
+            ),
+        ):
+            response = self.client.post(reverse(url), data=data, format="json")
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+            assert response.data[0].code == "already_reserved_seat"
+        [result] = reserve_seats_in_order(
+            self.match.id,
+            [SeatReservation(other.id, self.seat.id, "other")],
+        )
+        assert isinstance(result, AlreadyReservedSeatError)
+        flush_seat_holds()
+        assert Invoice.objects.get().user == self.user
+
+    def test_seat_sold_before_the_flush_drops_the_hold(self):
+        self.hold()
+        # e.g. redis lost the hold and the seat was sold by another path
+        Seat.objects.filter(id=self.seat.id).update(is_reserved=True, full_name="a")
+        assert flush_seat_holds() == 1
+        assert not Invoice.objects.exists()
+        response = self.hold_status()
+        assert response.data["status"] == "dropped"
+        assert response.data["error"] == "already_reserved_seat"
+        other = User.objects.create_user(username="other")
+        self.client.force_authenticate(user=other)
+        assert self.hold().status_code == status.HTTP_400_BAD_REQUEST
+
+    @override_settings(DEFERRED_SEAT_HOLDS_IN_PROCESS=False)
+    def test_holds_need_redis(self):
+        response = self.hold()
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.data["detail"].code == "seat_holds_unavailable"
+        assert get_seat_hold_engine().owner(self.match.id, 1) is None
+        with pytest.raises(CommandError):
+            call_command("flush_seat_holds", once=True)
+        with pytest.raises(CommandError):
+            call_command("rebuild_seat_holds")
+
+
+class LazySeatInventoryTest(BaseAuthenticatedUserAPITestCase):
+    def setUp(self):
+        super().setUp()
+        get_seat_availability.cache_clear()
+        get_seat_hold_engine.cache_clear()
+        self.match = baker.make(
+            Match,
+            stadium=baker.make(Stadium, capacity=3),
+            seat_price=1000,
+            lazy_seats=True,
+        )
+
+    def reserved_numbers(self) -> list[int]:
+        return list(
+            Seat.objects.filter(match=self.match, is_reserved=True)
+            .order_by("number")
+            .values_list("number", flat=True),
+        )
+
+    def test_best_available_seats(self):
+        response = self.client.post(
+            reverse("api:accounting:best-available-seats"),
+            data={"match": self.match.id, "full_names": ["a", "b"]},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert self.reserved_numbers() == [1, 2]
+        assert self.match.seat_set.count() == 2  # noqa: PLR2004
+        assert Invoice.objects.get(user=self.user).total_price == 2000  # noqa: PLR2004
+
+    def test_any_seat(self):
+        url = reverse("api:accounting:add-any-seat-invoice-item")
+        data = {"match": self.match.id, "full_name": "Jon Smith"}
+        for number in range(1, 4):
+            response = self.client.post(url, data=data)
+            assert response.status_code == status.HTTP_201_CREATED
+            assert response.data["number"] == number
+        response = self.client.post(url, data=data)
+        assert response.data[0].code == "not_enough_free_seats"
+        response = self.client.post(url, data={**data, "price": 1})
+        assert response.data[0].code == "not_enough_free_seats"
+
+    def test_hold_is_written_by_flush(self):
+        response = self.client.post(
+            reverse("api:accounting:hold-seat"),
+            data={"match": self.match.id, "number": 2, "full_name": "Jon Smith"},
+        )
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert flush_seat_holds() == 1
+        assert self.reserved_numbers() == [2]
+
+    def list_seats(self, **params) -> dict:
+        response = self.client.get(
+            reverse(
+                "api:stadium_management:match-seats",
+                kwargs={"pk": self.match.id},
+            ),
+            params,
+        )
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def test_listed_seats_are_not_materialized(self):
+        page = self.list_seats(page_size=2)
+        assert [seat["number"] for seat in page["results"]] == [1, 2]
+        assert [seat["id"] for seat in page["results"]] == [None, None]
+        assert "after=2" in page["next"]
+        page = self.list_seats(page_size=2, after=2)
+        assert [seat["number"] for seat in page["results"]] == [3]
+        assert page["next"] is None
+        assert not self.match.seat_set.exists()
+
+    def test_seats_are_reserved_by_number(self):
+        response = self.client.post(
+            reverse("api:accounting:add-invoice-item"),
+            data={"match": self.match.id, "number": 1, "full_name": "a"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        response = self.client.post(
+            reverse("api:accounting:add-invoice-items"),
+            data={"items": [{"match": self.match.id, "number": 2, "full_name": "b"}]},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert self.reserved_numbers() == [1, 2]
+        results = self.list_seats()["results"]
+        assert all(seat["id"] is not None for seat in results[:2])
+        response = self.client.get(
+            reverse(
+                "api:stadium_management:seat-detail",
+                kwargs={"pk": results[0]["id"]},
+            ),
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["is_reserved"]
+        page = self.list_seats(available=True)
+        assert [seat["number"] for seat in page["results"]] == [3]
+        # the bitmap agrees with the reservations by number
+        response = self.client.post(
+            reverse("api:accounting:add-any-seat-invoice-item"),
+            data={"match": self.match.id, "full_name": "c"},
+        )
+        assert response.data["number"] == 3  # noqa: PLR2004
+
+    def test_seat_or_number_is_required(self):
+        url = reverse("api:accounting:add-invoice-item")
+        data = {"match": self.match.id, "full_name": "a"}
+        response = self.client.post(url, data=data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not self.match.seat_set.exists()
+
+    def test_hold_out_of_the_capacity_is_released(self):
+        get_seat_hold_engine().claim(SeatHold(self.match.id, 4, self.user.id, "name"))
+        flush_seat_holds()
+        assert not self.match.seat_set.exists()
+        assert not Invoice.objects.exists()
+
+
+class RebuildSeatHoldsTest(APITestCase):
+    def setUp(self):
+        get_seat_hold_engine.cache_clear()
+        self.user = User.objects.create_user(username="username")
+        self.match = baker.make(Match)
+        baker.make(Seat, match=self.match, number=1, is_reserved=True, full_name="a")
+        baker.make(Seat, match=self.match, number=2)
+
+    def test_rebuild_from_seat_table(self):
+        engine = get_seat_hold_engine()
+        engine.claim(SeatHold(self.match.id, 2, self.user.id, "b"), defer=False)
+        rebuild_seat_holds()
+        assert (
+            engine.claim(SeatHold(self.match.id, 1, self.user.id, "b"))
+            == HoldStatus.REJECTED
+        )
+        assert (
+            engine.claim(SeatHold(self.match.id, 2, self.user.id, "b"))
+            == HoldStatus.CLAIMED
+        )
+
+
+class PendingInvoiceUpsertTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="username")
+
+    def test_pending_invoice_is_created_once(self):
+        invoice = Invoice.objects.get_or_create_pending(self.user.id, total_price=10)
+        assert invoice.status == Invoice.InvoiceStatus.PENDING
+        assert invoice.total_price == 10  # noqa: PLR2004
+        same_invoice = Invoice.objects.get_or_create_pending(self.user.id, 5)
+        assert same_invoice.id == invoice.id
+        assert same_invoice.total_price == 15  # noqa: PLR2004
+        assert Invoice.objects.filter(user=self.user).count() == 1
+
+    def test_paid_invoice_is_not_reused(self):
+        invoice = Invoice.objects.get_or_create_pending(self.user.id, total_price=10)
+        baker.make(InvoiceItem, invoice=invoice, seat=baker.make(Seat))
+        assert invoice.pay()
+        new_invoice = Invoice.objects.get_or_create_pending(self.user.id, 5)
+        assert new_invoice.id != invoice.id
+        assert new_invoice.total_price == 5  # noqa: PLR2004
+
+    def test_second_pending_invoice_is_rejected(self):
+        Invoice.objects.get_or_create_pending(self.user.id)
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Invoice.objects.create(user=self.user)
+
+
+class SeatClaimLeaseTest(APITestCase):
+    def setUp(self):
+        get_seat_hold_engine.cache_clear()
+        self.user = User.objects.create_user(username="username")
+        self.match = baker.make(Match)
+        self.seat = baker.make(Seat, match=self.match, number=1, price=1000)
+
+    def tearDown(self):
+        release_request_claims()
+
+    def test_leased_claim_expires(self):
+        clock = SimpleNamespace(now=0.0)
+        engine = LocalSeatHoldEngine(clock=lambda: clock.now)
+        engine.claim(SeatHold(1, 1, 1, "a"), defer=False, ttl=30)
+        assert engine.claim(SeatHold(1, 1, 2, "b")) == HoldStatus.REJECTED
+        clock.now = 30
+        assert engine.owner(1, 1) is None
+        assert engine.claim(SeatHold(1, 1, 2, "b"), ttl=30) == HoldStatus.CLAIMED
+        engine.mark_reserved(1, [1])
+        clock.now = 100
+        assert engine.owner(1, 1) == DATABASE_OWNER
+
+    def test_claims_of_a_rolled_back_request_are_released(self):
+        start_request_claims()
+        with contextlib.suppress(RuntimeError), transaction.atomic():
+            reserve_seat(self.user, self.seat, "Jon Smith")
+            raise RuntimeError
+        assert get_seat_hold_engine().owner(self.match.id, 1) == self.user.id
+        release_request_claims()
+        assert get_seat_hold_engine().owner(self.match.id, 1) is None
+
+    def test_committed_claims_are_kept(self):
+        start_request_claims()
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_seat(self.user, self.seat, "Jon Smith")
+        release_request_claims()
+        assert get_seat_hold_engine().owner(self.match.id, 1) == DATABASE_OWNER
+
+
+class WaitingRoomAdmissionTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:add-any-seat-invoice-item"
+
+    def setUp(self):
+        super().setUp()
+        get_seat_hold_engine.cache_clear()
+        get_waiting_room.cache_clear()
+        self.match = baker.make(Match)
+        baker.make(Seat, match=self.match, number=1)
+
+    def tearDown(self):
+        get_waiting_room.cache_clear()
+
+    def reserve(self, ticket=None):
+        headers = {}
+        if ticket is not None:
+            headers[WAITING_ROOM_HEADER] = make_waiting_room_token(ticket)
+        return self.client.post(
+            self.get_url(),
+            data={"match": self.match.id, "full_name": "Jon Smith"},
+            headers=headers,
+        )
+
+    def test_disabled_waiting_room_admits_everyone(self):
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+
+    @override_settings(WAITING_ROOM_ADMISSION_RATE=1_000_000)
+    def test_admitted_ticket(self):
+        assert self.reserve().status_code == status.HTTP_403_FORBIDDEN
+        ticket = get_waiting_room().join(self.match.id, self.user.id)
+        assert self.reserve(ticket).status_code == status.HTTP_201_CREATED
+
+    @override_settings(WAITING_ROOM_ADMISSION_RATE=1_000_000)
+    def test_ticket_of_another_match_or_user(self):
+        other_match = baker.make(Match)
+        ticket = get_waiting_room().join(other_match.id, self.user.id)
+        assert self.reserve(ticket).status_code == status.HTTP_403_FORBIDDEN
+        ticket = get_waiting_room().join(self.match.id, 0)
+        assert self.reserve(ticket).status_code == status.HTTP_403_FORBIDDEN
+
+    @override_settings(WAITING_ROOM_ADMISSION_RATE=0.001)
+    def test_waiting_ticket(self):
+        get_waiting_room().join(self.match.id, 0)
+        ticket = get_waiting_room().join(self.match.id, self.user.id)
+        response = self.reserve(ticket)
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.data["detail"].code == "not_admitted"
+
+    @override_settings(WAITING_ROOM_ADMISSION_RATE=1_000_000)
+    def test_ids_are_parsed_as_the_serializers_parse_them(self):
+        other_match = baker.make(Match)
+        seat = baker.make(Seat, match=other_match, number=1)
+        ticket = get_waiting_room().join(self.match.id, self.user.id)
+        headers = {WAITING_ROOM_HEADER: make_waiting_room_token(ticket)}
+        for match_id in (f"{other_match.id}.0", f" {other_match.id}"):
+            response = self.client.post(
+                self.get_url(),
+                data={"match": match_id, "full_name": "Jon Smith"},
+                headers=headers,
+            )
+            assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = self.client.post(
+            reverse("api:accounting:add-invoice-item"),
+            data={"seat": float(seat.id), "full_name": "Jon Smith"},
+            headers=headers,
+            format="json",
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = self.client.post(
+            self.get_url(),
+            data={"match": "one", "full_name": "Jon Smith"},
+            headers=headers,
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not InvoiceItem.objects.exists()
+
+
+class PurchaseThrottleTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:add-any-seat-invoice-item"
+
+    def setUp(self):
+        super().setUp()
+        get_seat_hold_engine.cache_clear()
+        get_sliding_windows.cache_clear()
+        self.match = baker.make(Match)
+        for number in range(1, 4):
+            baker.make(Seat, match=self.match, number=number, price=1000)
+        token = baker.make(Token, user=self.user)
+        self.client.force_authenticate()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def tearDown(self):
+        get_sliding_windows.cache_clear()
+
+    def reserve(self, match=None):
+        return self.client.post(
+            self.get_url(),
+            data={"match": (match or self.match).id, "full_name": "Jon Smith"},
+        )
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"purchase_user": "1/min"},
+        },
+    )
+    def test_user_is_throttled(self):
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+        response = self.reserve()
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert 0 < int(response["Retry-After"]) <= 60  # noqa: PLR2004
+        self.client.credentials()
+        self.client.force_authenticate(user=self.user)
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"purchase_match": "1/min"},
+        },
+    )
+    def test_match_is_throttled(self):
+        other_match = baker.make(Match)
+        baker.make(Seat, match=other_match, number=1, price=1000)
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+        assert self.reserve().status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert self.reserve(other_match).status_code == status.HTTP_201_CREATED
+        response = self.client.post(
+            self.get_url(),
+            data={"match": f"{self.match.id}.0", "full_name": "Jon Smith"},
+        )
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"purchase_user": "1/min"},
+        },
+    )
+    def test_seat_purchases_are_throttled_by_user(self):
+        url = reverse("api:accounting:add-invoice-item")
+        seats = Seat.objects.filter(match=self.match).order_by("number")
+        response = self.client.post(
+            url,
+            data={"seat": seats[0].id, "full_name": "Jon Smith"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        response = self.client.post(
+            url,
+            data={"seat": seats[1].id, "full_name": "Jon Smith"},
+        )
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+class IdempotencyKeyTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:add-any-seat-invoice-item"
+
+    def setUp(self):
+        super().setUp()
+        get_seat_hold_engine.cache_clear()
+        get_idempotency_store.cache_clear()
+        self.match = baker.make(Match)
+        for number in range(1, 4):
+            baker.make(Seat, match=self.match, number=number, price=1000)
+
+    def tearDown(self):
+        get_idempotency_store.cache_clear()
+
+    def reserve(self, key="key", full_name="Jon Smith"):
+        return self.client.post(
+            self.get_url(),
+            data={"match": self.match.id, "full_name": full_name},
+            headers={IDEMPOTENCY_HEADER: key},
+        )
+
+    def scope(self, key="key") -> str:
+        request = RequestFactory().post(self.get_url())
+        return IdempotentMixin._idempotency_scope(request, key)  # noqa: SLF001
+
+    def test_retry_is_replayed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.reserve()
+        assert response.status_code == status.HTTP_201_CREATED
+        retry = self.reserve()
+        assert retry.status_code == status.HTTP_201_CREATED
+        assert retry.content == response.content
+        assert retry[REPLAYED_HEADER] == "true"
+        assert InvoiceItem.objects.count() == 1
+        with self.captureOnCommitCallbacks(execute=True):
+            assert self.reserve(key="other").status_code == status.HTTP_201_CREATED
+        assert InvoiceItem.objects.count() == 2  # noqa: PLR2004
+
+    def test_key_of_another_request(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserve()
+        response = self.reserve(full_name="Other Name")
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_validation_error_is_replayed(self):
+        response = self.reserve(full_name="")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert self.reserve(full_name="")[REPLAYED_HEADER] == "true"
+
+    def test_duplicate_waits_for_the_first_request(self):
+        store = get_idempotency_store()
+        store.acquire(self.scope(), timeout=5)
+        stored = StoredResponse(201, "application/json", b"{}", "fingerprint")
+        threading.Timer(0.1, store.save, args=(self.scope(), stored, 60)).start()
+        response = self.reserve()
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert not InvoiceItem.objects.exists()
+
+    def test_retry_of_an_uncommitted_request_runs_again(self):
+        # the on commit callbacks are not run, as when the commit of the request
+        # fails or it is rolled back after the view returned
+        assert self.reserve().status_code == status.HTTP_201_CREATED
+        with self.captureOnCommitCallbacks(execute=True):
+            retry = self.reserve()
+        assert retry.status_code == status.HTTP_201_CREATED
+        assert not retry.has_header(REPLAYED_HEADER)
+        assert self.reserve()[REPLAYED_HEADER] == "true"
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=0)
+    def test_running_duplicate_times_out(self):
+        get_idempotency_store().acquire(self.scope(), timeout=5)
+        assert self.reserve().status_code == status.HTTP_409_CONFLICT
+
+
+@override_settings(RESERVATION_QUEUE_ENABLED=True)
+class QueuedReservationTest(BaseAuthenticatedUserAPITestCase):
+    namespace = "api:accounting:add-invoice-item"
+
+    def setUp(self):
+        super().setUp()
+        self.match = baker.make(Match)
+        self.seat = baker.make(Seat, match=self.match, number=1, price=1000)
+
+    def reserve(self, seat=None, full_name="Jon Smith"):
+        return self.client.post(
+            self.get_url(),
+            data={"seat": (seat or self.seat).id, "full_name": full_name},
+        )
+
+    def reservation(self, ticket, **params):
+        return self.client.get(
+            reverse("api:accounting:reservation", kwargs={"ticket": ticket}),
+            params,
+        )
+
+    def test_reservation_is_applied_by_the_worker(self):
+        response = self.reserve()
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        ticket = response.data["ticket"]
+        self.seat.refresh_from_db()
+        assert not self.seat.is_reserved
+        assert self.reservation(ticket).data["status"] == "Queued"
+        assert process_reservation_queue() == 1
+        self.seat.refresh_from_db()
+        assert self.seat.is_reserved
+        assert self.seat.full_name == "Jon Smith"
+        invoice = Invoice.objects.get(user=self.user)
+        assert invoice.total_price == self.seat.price
+        response = self.reservation(ticket, wait=5)
+        assert response.data["status"] == "Reserved"
+        assert response.data["item"] == invoice.invoiceitem_set.get().id
+        assert process_reservation_queue() == 0
+
+    def test_first_reservation_of_a_seat_wins(self):
+        first = self.reserve().data["ticket"]
+        other = User.objects.create_user(username="other")
+        self.client.force_authenticate(user=other)
+        second = self.reserve(full_name="Other Name").data["ticket"]
+        assert process_match_queue(self.match.id) == 2  # noqa: PLR2004
+        assert self.reservation(second).data["error"] == "already_reserved_seat"
+        self.client.force_authenticate(user=self.user)
+        assert self.reservation(first).data["status"] == "Reserved"
+        assert InvoiceItem.objects.get().invoice.user == self.user
+
+    def test_reserved_seat_is_rejected_at_once(self):
+        Seat.objects.filter(id=self.seat.id).update(is_reserved=True, full_name="name")
+        assert self.reserve().status_code == status.HTTP_400_BAD_REQUEST
+        assert not ReservationRequest.objects.exists()
+
+    def test_ticket_of_another_user(self):
+        ticket = self.reserve().data["ticket"]
+        self.client.force_authenticate(user=baker.make(User))
+        response = self.reservation(ticket)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# the batcher commits in its own threads, they must see the committed test data
+@override_settings(RESERVATION_BATCH_WINDOW=50)
+class GroupCommitReservationTest(APITransactionTestCase):
+    def setUp(self):
+        get_reservation_batcher.cache_clear()
+        self.match = baker.make(Match)
+        self.seats = [
+            baker.make(Seat, match=self.match, number=number, price=1000)
+            for number in (1, 2)
+        ]
+        self.users = [
+            User.objects.create_user(username=f"username{index}") for index in range(3)
+        ]
+
+    def tearDown(self):
+        get_reservation_batcher.cache_clear()
+
+    def test_each_caller_gets_its_result(self):
+        batcher = get_reservation_batcher()
+        seats = [self.seats[0], self.seats[0], self.seats[1]]
+        with ThreadPoolExecutor() as executor:
+            futures = [
+                executor.submit(
+                    batcher.reserve,
+                    self.match.id,
+                    SeatReservation(user.id, seat.id, user.username),
+                )
+                for user, seat in zip(self.users, seats, strict=True)
+            ]
+            wait(futures)
+        errors = [future.exception() for future in futures]
+        assert sum(isinstance(error, AlreadyReservedSeatError) for error in errors) == 1
+        assert errors[2] is None
+        assert InvoiceItem.objects.count() == 2  # noqa: PLR2004
+        assert not Seat.objects.filter(is_reserved=False).exists()
+
+    def test_add_invoice_item_view(self):
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post(
+            reverse("api:accounting:add-invoice-item"),
+            data={"seat": self.seats[0].id, "full_name": "Jon Smith"},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        self.seats[0].refresh_from_db()
+        assert self.seats[0].full_name == "Jon Smith"
+        response = self.client.post(
+            reverse("api:accounting:add-invoice-item"),
+            data={"seat": self.seats[0].id, "full_name": "Jon Smith"},
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_failed_batch_leaves_no_transaction_of_the_request(self):
+        in_atomic_block = []
+
+        def reserve(match_id, reservation):
+            in_atomic_block.append(connection.in_atomic_block)
+            raise AlreadyReservedSeatError
+
+        self.client.force_authenticate(user=self.users[0])
+        with patch.object(get_reservation_batcher(), "reserve", side_effect=reserve):
+            response = self.client.post(
+                reverse("api:accounting:add-invoice-item"),
+                data={"seat": self.seats[0].id, "full_name": "Jon Smith"},
+            )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.data[0].code == "already_reserved_seat"
+        assert in_atomic_block == [False]
+        assert not InvoiceItem.objects.exists()
+
+
+class ExpireInvoiceItemsTest(APITestCase):
+    def setUp(self):
+        get_seat_availability.cache_clear()
+        self.user = User.objects.create_user(username="username")
+        self.match = baker.make(Match)
+        self.seats = [
+            baker.make(Seat, match=self.match, number=number, price=1000)
+            for number in range(1, 4)
+        ]
+        for seat in self.seats:
+            reserve_seat(self.user, seat, "Jon Smith")
+        InvoiceItem.objects.filter(seat__in=self.seats[:2]).update(
+            hold_expires_at=timezone.now() - timezone.timedelta(seconds=1),
+        )
+
+    def test_stale_items_release_their_seats(self):
+        ensure_seat_availability(self.match.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            run = expire_inactive_invoice_items()
+        assert run == ExpiryRun(items_expired=2, seats_released=2)
+        assert list(
+            Seat.objects.filter(is_reserved=False).values_list("number", "full_name"),
+        ) == [(1, ""), (2, "")]
+        assert InvoiceItem.objects.filter(expired=True).count() == 2  # noqa: PLR2004
+        assert Invoice.objects.get().total_price == 1000  # noqa: PLR2004
+        bitmap = get_seat_availability().bitmap(self.match.id)
+        assert unpack_seat_numbers(bitmap) == [1, 2]
+        assert expire_inactive_invoice_items() == ExpiryRun(0, 0)
+
+    def test_batches_are_bounded(self):
+        assert expire_inactive_invoice_items(batch_size=1).items_expired == 1
+        assert expire_inactive_invoice_items(batch_size=1).items_expired == 1
+        assert expire_inactive_invoice_items(batch_size=1).items_expired == 0
+
+    def test_expired_invoice_total_is_zero(self):
+        InvoiceItem.objects.update(hold_expires_at=timezone.now())
+        expire_inactive_invoice_items()
+        assert Invoice.objects.get().total_price == 0
+
+    def test_only_touched_invoices_are_recomputed(self):
+        other = Invoice.objects.create(
+            user=User.objects.create_user(username="other"),
+            total_price=123,
+        )
+        expire_inactive_invoice_items()
+        other.refresh_from_db()
+        assert other.total_price == 123  # noqa: PLR2004
+
+    def test_paid_items_are_not_expired(self):
+        Invoice.objects.get().pay()
+        assert not InvoiceItem.objects.filter(hold_expires_at__isnull=False).exists()
+        assert expire_inactive_invoice_items() == ExpiryRun(0, 0)
+        assert next_hold_expiry() is None
+
+    def test_next_hold_expiry(self):
+        item = InvoiceItem.objects.get(seat=self.seats[2])
+        assert item.hold_expires_at > timezone.now()
+        assert item.hold_expires_at == item.created_at + timezone.timedelta(
+            seconds=settings.INVOICE_ITEM_HOLD_TIME,
+        )
+        assert next_hold_expiry() < timezone.now()
+        expire_inactive_invoice_items()
+        assert next_hold_expiry() == item.hold_expires_at
+
+    def test_locked_due_hold_is_not_spun_on(self):
+        # a due hold locked by another transaction is skipped and stays due
+        command = "accounting.management.commands.expire_invoice_items"
+        with (
+            patch(
+                f"{command}.expire_inactive_invoice_items",
+                return_value=ExpiryRun(0, 0),
+            ),
+            patch(f"{command}.time.sleep", side_effect=StopIteration) as sleep,
+            pytest.raises(StopIteration),
+        ):
+            call_command("expire_invoice_items", interval=5)
+        sleep.assert_called_once_with(MIN_SLEEP)
+
+
+# the payment and the expiry run are in their own threads and transactions
+class PayInvoiceRaceTest(APITransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="username")
+        self.match = baker.make(Match)
+        self.seats = [
+            baker.make(Seat, match=self.match, number=number, price=1000)
+            for number in (1, 2)
+        ]
+        for seat in self.seats:
+            reserve_seat(self.user, seat, "Jon Smith")
+        InvoiceItem.objects.filter(seat=self.seats[0]).update(
+            hold_expires_at=timezone.now() - timezone.timedelta(seconds=1),
+        )
+        self.invoice = Invoice.objects.get()
+
+    def in_transaction(self, function, started, finish):
+        try:
+            with transaction.atomic():
+                result = function()
+                started.set()
+                finish.wait(5)
+            return result
+        finally:
+            connection.close()
+
+    def pay(self):
+        try:
+            return Invoice.objects.get().pay()
+        finally:
+            connection.close()
+
+    def expire(self):
+        try:
+            return expire_inactive_invoice_items()
+        finally:
+            connection.close()
+
+    def test_payment_waits_for_the_expiry_run(self):
+        started, finish = threading.Event(), threading.Event()
+        with ThreadPoolExecutor() as executor:
+            run = executor.submit(
+                self.in_transaction,
+                expire_inactive_invoice_items,
+                started,
+                finish,
+            )
+            assert started.wait(5)
+            payment = executor.submit(self.pay)
+            assert not wait([payment], timeout=0.2).done
+            finish.set()
+            assert run.result() == ExpiryRun(1, 1)
+            assert payment.result()
+        self.invoice.refresh_from_db()
+        assert self.invoice.status == Invoice.InvoiceStatus.PAID
+        assert self.invoice.total_price == 1000  # noqa: PLR2004
+        assert InvoiceItem.objects.get(seat=self.seats[0]).expired
+        assert not Seat.objects.get(id=self.seats[0].id).is_reserved
+        assert not InvoiceItem.objects.filter(hold_expires_at__isnull=False).exists()
+
+    def test_expiry_run_skips_the_items_being_paid(self):
+        started, finish = threading.Event(), threading.Event()
+        with ThreadPoolExecutor() as executor:
+            payment = executor.submit(
+                self.in_transaction,
+                self.invoice.pay,
+                started,
+                finish,
+            )
+            assert started.wait(5)
+            run = executor.submit(self.expire)
+            assert run.result(5) == ExpiryRun(0, 0)
+            finish.set()
+            assert payment.result()
+        self.invoice.refresh_from_db()
+        assert self.invoice.total_price == 2000  # noqa: PLR2004
+        assert not InvoiceItem.objects.filter(expired=True).exists()
+        assert Seat.objects.filter(is_reserved=True).count() == 2  # noqa: PLR2004
+
+    def test_paid_invoice_is_not_paid_again(self):
+        assert self.invoice.pay()
+        assert not Invoice.objects.get().pay()
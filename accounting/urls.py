@@ -1,15 +1,43 @@
 from django.urls import path
 
+from accounting.views import AddAnySeatInvoiceItemView
+from accounting.views import AddInvoiceItemsView
 from accounting.views import AddInvoiceItemView
+from accounting.views import BestAvailableSeatsView
+from accounting.views import HoldSeatStatusView
+from accounting.views import HoldSeatView
 from accounting.views import InvoiceView
 from accounting.views import PayInvoiceView
 from accounting.views import RemoveItemFromInvoiceView
+from accounting.views import ReservationView
 
 app_name = "accounting"
 
 urlpatterns = [
     path("invoice/<int:invoice_id>/", InvoiceView.as_view(), name="invoice"),
     path("invoice/item/add/", AddInvoiceItemView.as_view(), name="add-invoice-item"),
+    path(
+        "invoice/item/add/any/",
+        AddAnySeatInvoiceItemView.as_view(),
+        name="add-any-seat-invoice-item",
+    ),
+    path("invoice/items/", AddInvoiceItemsView.as_view(), name="add-invoice-items"),
+    path(
+        "invoice/items/best-available/",
+        BestAvailableSeatsView.as_view(),
+        name="best-available-seats",
+    ),
+    path("invoice/item/hold/", HoldSeatView.as_view(), name="hold-seat"),
+    path(
+        "invoice/item/hold/<int:match_id>/<int:number>/",
+        HoldSeatStatusView.as_view(),
+        name="hold-seat-status",
+    ),
+    path(
+        "invoice/item/reservation/<int:ticket>/",
+        ReservationView.as_view(),
+        name="reservation",
+    ),
     path(
         "invoice/item/<int:item_id>/remove/",
         RemoveItemFromInvoiceView.as_view(),
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.db import transaction
 from django.db.models import F
+from django.utils.decorators import method_decorator
 from rest_framework import status
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.request import Request
@@ -8,11 +11,41 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from accounting.exceptions import OnlyInvoiceOwner
+from accounting.exceptions import OnlyPendingInvoice
+from accounting.holds import get_seat_hold_engine
+from accounting.idempotency import IdempotentMixin
 from accounting.models import Invoice
 from accounting.models import InvoiceItem
+from accounting.reservation_queue import wait_for_reservation
+from accounting.serializers import AddAnySeatInvoiceItemSerializer
 from accounting.serializers import AddInvoiceItemSerializer
+from accounting.serializers import AddInvoiceItemsSerializer
+from accounting.serializers import BestAvailableSeatsSerializer
+from accounting.serializers import HoldSeatSerializer
+from accounting.serializers import HoldSeatStatusSerializer
 from accounting.serializers import InvoiceSerializer
+from accounting.serializers import LongPollSerializer
+from accounting.serializers import ReservationRequestSerializer
+from config.throttling import IPSlidingWindowThrottle
+from config.throttling import MatchSlidingWindowThrottle
+from config.throttling import ThrottleBeforeAuthenticationMixin
+from config.throttling import UserSlidingWindowThrottle
 from config.utils import OkResponse
+from stadium_management.permissions import IsAdmittedFromWaitingRoom
+from stadium_management.signals import seats_released
+from stadium_management.signals import send_on_commit
+
+PURCHASE_THROTTLE_CLASSES = [
+    UserSlidingWindowThrottle,
+    IPSlidingWindowThrottle,
+    MatchSlidingWindowThrottle,
+]
+# requests which only name seats are not throttled by match, finding the match of
+# a seat needs the database, see MatchSlidingWindowThrottle
+SEAT_PURCHASE_THROTTLE_CLASSES = [
+    UserSlidingWindowThrottle,
+    IPSlidingWindowThrottle,
+]
 
 
 class InvoiceView(APIView):
@@ -40,13 +73,132 @@ class InvoiceView(APIView):
         return Response(status=status.HTTP_200_OK, data=serializer.data)
 
 
-class AddInvoiceItemView(APIView):
-    permission_classes = [IsAuthenticated]
+# a batched reservation is committed by the reservation batcher, on its own
+# connection, the request must not keep a transaction open around it
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class AddInvoiceItemView(
+    IdempotentMixin,
+    ThrottleBeforeAuthenticationMixin,
+    APIView,
+):
+    permission_classes = [IsAuthenticated, IsAdmittedFromWaitingRoom]
+    throttle_classes = SEAT_PURCHASE_THROTTLE_CLASSES
+    throttle_scope = "purchase"
     serializer_class = AddInvoiceItemSerializer
 
+    def dispatch(self, request, *args, **kwargs):
+        if settings.RESERVATION_BATCH_WINDOW and not settings.RESERVATION_QUEUE_ENABLED:
+            return super().dispatch(request, *args, **kwargs)
+        # other reservations are made in the transaction of the request, as
+        # ATOMIC_REQUESTS does for the other views
+        with transaction.atomic():
+            return super().dispatch(request, *args, **kwargs)
+
     def post(self, request):
         """
         Adding item to invoice
+        In the queued reservation mode the reservation is put on the queue of the
+        match and its ticket is returned with 202 Accepted, see ReservationView.
+        A batched reservation is not made in a transaction of the request, it's
+        committed by the reservation batcher, see accounting.batching.
+
+        :param request: request object
+        :type request: Request
+        :return: response object
+        :rtype: Response
+        """
+        queued = settings.RESERVATION_QUEUE_ENABLED
+        serializer_class = (
+            ReservationRequestSerializer if queued else self.serializer_class
+        )
+        serializer = serializer_class(
+            data=request.data,
+            context={"request": request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            data=serializer.data,
+            status=status.HTTP_202_ACCEPTED if queued else status.HTTP_201_CREATED,
+        )
+
+
+# a long poll must not keep a transaction open
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class ReservationView(APIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = ReservationRequestSerializer
+
+    def get(self, request: Request, ticket: int) -> Response:
+        """
+        Show a reservation of the queued reservation mode by its ticket
+        With ?wait=<seconds> the response waits until the reservation is processed
+        or the seconds pass, at most RESERVATION_QUEUE_MAX_WAIT seconds.
+
+        :param request: request object
+        :type request: Request
+        :param ticket: the ticket of the reservation
+        :type ticket: int
+        :return: response object
+        :rtype: Response
+        """
+        params = LongPollSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        reservation = wait_for_reservation(
+            ticket,
+            request.user,
+            timeout=params.validated_data["wait"],
+        )
+        if reservation is None:
+            raise NotFound
+        serializer = self.serializer_class(reservation)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class AddAnySeatInvoiceItemView(
+    IdempotentMixin,
+    ThrottleBeforeAuthenticationMixin,
+    APIView,
+):
+    permission_classes = [IsAuthenticated, IsAdmittedFromWaitingRoom]
+    throttle_classes = PURCHASE_THROTTLE_CLASSES
+    throttle_scope = "purchase"
+    serializer_class = AddAnySeatInvoiceItemSerializer
+
+    def post(self, request: Request) -> Response:
+        """
+        Adding any free seat of a match to invoice
+
+        :param request: request object
+        :type request: Request
+        :return: response object
+        :rtype: Response
+        """
+        serializer = self.serializer_class(
+            data=request.data,
+            context={"request": request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            data=serializer.data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class AddInvoiceItemsView(
+    IdempotentMixin,
+    ThrottleBeforeAuthenticationMixin,
+    APIView,
+):
+    permission_classes = [IsAuthenticated, IsAdmittedFromWaitingRoom]
+    throttle_classes = SEAT_PURCHASE_THROTTLE_CLASSES
+    throttle_scope = "purchase"
+    serializer_class = AddInvoiceItemsSerializer
+
+    def post(self, request: Request) -> Response:
+        """
+        Adding several items to invoice in one transaction, all or nothing
 
         :param request: request object
         :type request: Request
@@ -65,7 +217,124 @@ class AddInvoiceItemView(APIView):
         )
 
 
-class RemoveItemFromInvoiceView(APIView):
+class BestAvailableSeatsView(
+    IdempotentMixin,
+    ThrottleBeforeAuthenticationMixin,
+    APIView,
+):
+    permission_classes = [IsAuthenticated, IsAdmittedFromWaitingRoom]
+    throttle_classes = PURCHASE_THROTTLE_CLASSES
+    throttle_scope = "purchase"
+    serializer_class = BestAvailableSeatsSerializer
+
+    def post(self, request: Request) -> Response:
+        """
+        Reserve the best available seats of a match, the server picks the seats
+
+        :param request: request object
+        :type request: Request
+        :return: response object
+        :rtype: Response
+        """
+        serializer = self.serializer_class(
+            data=request.data,
+            context={"request": request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            data=serializer.data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class HoldSeatView(
+    IdempotentMixin,
+    ThrottleBeforeAuthenticationMixin,
+    APIView,
+):
+    permission_classes = [IsAuthenticated, IsAdmittedFromWaitingRoom]
+    throttle_classes = PURCHASE_THROTTLE_CLASSES
+    throttle_scope = "purchase"
+    serializer_class = HoldSeatSerializer
+
+    def post(self, request: Request) -> Response:
+        """
+        Hold a seat of a match by its number
+        The seat is claimed in the seat hold engine and written to the invoice
+        asynchronously, so the request is accepted without touching the seat table.
+        The state of the hold is shown by HoldSeatStatusView.
+
+        :param request: request object
+        :type request: Request
+        :return: response object
+        :rtype: Response
+        """
+        serializer = self.serializer_class(
+            data=request.data,
+            context={"request": request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(
+            data=serializer.data,
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+
+class HoldSeatStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = HoldSeatStatusSerializer
+
+    def get(self, request: Request, match_id: int, number: int) -> Response:
+        """
+        Show the state of the hold of the user on a seat of a match, a hold which
+        can not be written to the invoice is dropped with its error
+
+        :param request: request object
+        :type request: Request
+        :param match_id: match of the seat
+        :type match_id: int
+        :param number: number of the seat
+        :type number: int
+        :return: response object
+        :rtype: Response
+        """
+        item_id = (
+            InvoiceItem.objects.filter(
+                invoice__user=request.user,
+                seat__match_id=match_id,
+                seat__number=number,
+                expired=False,
+            )
+            .values_list("id", flat=True)
+            .first()
+        )
+        engine = get_seat_hold_engine()
+        dropped = engine.dropped(match_id, number)
+        error = ""
+        if item_id is not None:
+            hold_status = self.serializer_class.RESERVED
+        elif dropped is not None and dropped.user_id == request.user.id:
+            hold_status = self.serializer_class.DROPPED
+            error = dropped.error
+        elif engine.owner(match_id, number) == request.user.id:
+            hold_status = self.serializer_class.HELD
+        else:
+            raise NotFound
+        serializer = self.serializer_class(
+            {
+                "match": match_id,
+                "number": number,
+                "status": hold_status,
+                "error": error,
+                "item": item_id,
+            },
+        )
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class RemoveItemFromInvoiceView(IdempotentMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def delete(self, request, item_id):
@@ -92,10 +361,11 @@ class RemoveItemFromInvoiceView(APIView):
             item.delete()
             if not invoice.invoiceitem_set.exists():
                 invoice.delete()
+            send_on_commit(seats_released, [item.seat])
         return OkResponse()
 
 
-class PayInvoiceView(APIView):
+class PayInvoiceView(IdempotentMixin, APIView):
     permission_classes = [IsAuthenticated]
     serializer_class = InvoiceSerializer
 
@@ -110,14 +380,15 @@ class PayInvoiceView(APIView):
         :rtype: Response
         """
         invoice: Invoice = get_object_or_404(
-            Invoice.objects.prefetch_related("invoiceitem_set__seat__match").filter(
-                status=Invoice.InvoiceStatus.PENDING,
-            ),
+            Invoice.objects.filter(status=Invoice.InvoiceStatus.PENDING),
             id=invoice_id,
         )
         if invoice.user_id != request.user.id:
             raise OnlyInvoiceOwner
-        invoice.pay()
-        invoice.refresh_from_db()
+        if not invoice.pay():
+            raise OnlyPendingInvoice
+        invoice = Invoice.objects.prefetch_related("invoiceitem_set__seat__match").get(
+            id=invoice.id,
+        )
         serializer = self.serializer_class(invoice)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,31 @@
+# ruff: noqa
+"""
+ASGI config for MatchTicketSelling project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+served by uvicorn, e.g. behind gunicorn:
+
+    gunicorn config.asgi -k uvicorn.workers.UvicornWorker
+
+Under ASGI the read endpoints of stadiums, matches and seat availability are
+served by async views (see stadium_management.async_views), so one worker keeps
+many polling clients waiting on the database or redis at once.
+
+"""
+
+import os
+import sys
+from pathlib import Path
+
+from django.core.asgi import get_asgi_application
+
+# This allows easy placement of apps within the interior
+# matchticketselling directory.
+BASE_DIR = Path(__file__).resolve(strict=True).parent.parent
+sys.path.append(str(BASE_DIR / "matchticketselling"))
+# We defer to a DJANGO_SETTINGS_MODULE already in the environment.
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.production")
+os.environ.setdefault("DJANGO_ASYNC_READ_VIEWS", "True")
+
+# This application object is used by any ASGI server configured to use this file.
+application = get_asgi_application()
@@ -0,0 +1,112 @@
+"""
+Fast renderers and parsers of the API
+
+ORJSONRenderer and ORJSONParser render and parse the same json as the json
+renderer and parser of rest framework with orjson, they replace them when
+FAST_JSON_API is set. Types orjson does not know (Decimal, lazy translation
+strings, timedelta, ...) are converted like the json encoder of rest framework
+does.
+MessagePackRenderer and MessagePackParser add the application/msgpack content
+type when MSGPACK_API is set, they need the msgpack package.
+"""
+
+from __future__ import annotations
+
+import datetime
+import importlib
+
+import orjson
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+
+def default(obj):
+    """
+    Convert an object orjson can not serialize, the same as rest framework does
+    """
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    Render json with orjson, non ascii characters are not escaped and the only
+    supported indent is 2, the indent of the Accept header is ignored otherwise
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        # escaped as rest framework does, so the json is a strict javascript subset
+        return (
+            orjson.dumps(data, default=default, option=option)
+            .replace("\u2028".encode(), b"\\u2028")
+            .replace("\u2029".encode(), b"\\u2029")
+        )
+
+
+class ORJSONParser(BaseParser):
+    media_type = "application/json"
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as error:
+            msg = f"JSON parse error - {error}"
+            raise ParseError(msg) from error
+
+
+def _msgpack():
+    try:
+        return importlib.import_module("msgpack")
+    except ImportError as error:
+        msg = "MSGPACK_API needs the msgpack package"
+        raise ImproperlyConfigured(msg) from error
+
+
+def msgpack_default(obj):
+    """
+    Convert an object msgpack can not serialize, datetimes are iso 8601 strings
+    as in json responses
+    """
+    if isinstance(obj, datetime.datetime):
+        representation = obj.isoformat()
+        if representation.endswith("+00:00"):
+            representation = representation[:-6] + "Z"
+        return representation
+    if isinstance(obj, datetime.date | datetime.time):
+        return obj.isoformat()
+    return _encoder.default(obj)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        return _msgpack().packb(data, default=msgpack_default)
+
+
+class MessagePackParser(BaseParser):
+    media_type = "application/msgpack"
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        msgpack = _msgpack()
+        try:
+            return msgpack.unpackb(stream.read())
+        except (ValueError, msgpack.UnpackException) as error:
+            msg = f"MessagePack parse error - {error}"
+            raise ParseError(msg) from error
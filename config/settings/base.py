@@ -299,6 +299,13 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # <throttle_scope of the view>_<user|ip|match>, see config.throttling
+    "DEFAULT_THROTTLE_RATES": {
+        "signup_ip": env("DJANGO_THROTTLE_SIGNUP_IP", default="20/hour"),
+        "purchase_user": env("DJANGO_THROTTLE_PURCHASE_USER", default="60/min"),
+        "purchase_ip": env("DJANGO_THROTTLE_PURCHASE_IP", default="300/min"),
+        "purchase_match": env("DJANGO_THROTTLE_PURCHASE_MATCH", default="500/sec"),
+    },
 }
 
 # django-cors-headers - https://github.com/adamchainz/django-cors-headers#setup
@@ -314,3 +321,63 @@ SPECTACULAR_SETTINGS = {
 }
 # Your stuff...
 # ------------------------------------------------------------------------------
+# Number of consecutive match ids whose seats share one partition of the seat table
+SEAT_PARTITION_SIZE = env.int("DJANGO_SEAT_PARTITION_SIZE", default=10)
+# Tickets admitted from the waiting room of a match per second, 0 disables it
+WAITING_ROOM_ADMISSION_RATE = env.float("DJANGO_WAITING_ROOM_ADMISSION_RATE", default=0)
+# Seconds a waiting room token is valid
+WAITING_ROOM_TOKEN_MAX_AGE = env.int("DJANGO_WAITING_ROOM_TOKEN_MAX_AGE", default=3600)
+# Seconds a response of a request with an Idempotency-Key header is replayed
+IDEMPOTENCY_TTL = env.int("DJANGO_IDEMPOTENCY_TTL", default=24 * 3600)
+# Seconds a duplicate request waits for the first request with the same key
+IDEMPOTENCY_LOCK_TIMEOUT = env.int("DJANGO_IDEMPOTENCY_LOCK_TIMEOUT", default=30)
+# Serve the read endpoints of stadiums and matches with async views, set by
+# config/asgi.py as they only pay off under an ASGI server
+ASYNC_READ_VIEWS = env.bool("DJANGO_ASYNC_READ_VIEWS", default=False)
+# AddInvoiceItemView puts reservations on the queue of their match and answers
+# 202 Accepted, run the process_reservation_queue command to apply them
+RESERVATION_QUEUE_ENABLED = env.bool("DJANGO_RESERVATION_QUEUE_ENABLED", default=False)
+# Maximum seconds a long poll of a queued reservation waits
+RESERVATION_QUEUE_MAX_WAIT = env.int("DJANGO_RESERVATION_QUEUE_MAX_WAIT", default=25)
+# Milliseconds AddInvoiceItemSerializer waits to commit reservations of a match in
+# one transaction, see accounting.batching, 0 disables it. The batches are per
+# process, only set it under ASGI or threaded workers: with sync gunicorn workers
+# a batch holds one reservation and the window only adds latency
+RESERVATION_BATCH_WINDOW = env.float("DJANGO_RESERVATION_BATCH_WINDOW", default=0)
+# Seconds an item of a pending invoice holds its seat before it's expired
+INVOICE_ITEM_HOLD_TIME = env.int("DJANGO_INVOICE_ITEM_HOLD_TIME", default=10 * 60)
+# Matches in a page of the match list, see stadium_management.catalog
+MATCH_CATALOG_PAGE_SIZE = env.int("DJANGO_MATCH_CATALOG_PAGE_SIZE", default=50)
+# Seconds a page of the match list is cached, pages are invalidated when a match is
+# saved or deleted, it bounds how long a started match is listed as on sale
+MATCH_CATALOG_CACHE_TTL = env.int("DJANGO_MATCH_CATALOG_CACHE_TTL", default=30)
+# Seats in a page of the seats of a match
+SEAT_LIST_PAGE_SIZE = env.int("DJANGO_SEAT_LIST_PAGE_SIZE", default=500)
+# Render and parse the json of the API with orjson, see config.renderers
+FAST_JSON_API = env.bool("DJANGO_FAST_JSON_API", default=False)
+# Accept and render application/msgpack in the API, it needs the msgpack package
+MSGPACK_API = env.bool("DJANGO_MSGPACK_API", default=False)
+REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"] = (
+    "config.renderers.ORJSONRenderer"
+    if FAST_JSON_API
+    else "rest_framework.renderers.JSONRenderer",
+    "rest_framework.renderers.BrowsableAPIRenderer",
+    *(["config.renderers.MessagePackRenderer"] if MSGPACK_API else []),
+)
+REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"] = (
+    "config.renderers.ORJSONParser"
+    if FAST_JSON_API
+    else "rest_framework.parsers.JSONParser",
+    "rest_framework.parsers.FormParser",
+    "rest_framework.parsers.MultiPartParser",
+    *(["config.renderers.MessagePackParser"] if MSGPACK_API else []),
+)
+# Seconds after which a match left generating by a generate_seats worker which
+# died is claimed again, see stadium_management.tasks
+SEAT_GENERATION_TIMEOUT = env.int("DJANGO_SEAT_GENERATION_TIMEOUT", default=60)
+# Seconds a seat claimed in the seat hold engine by a reservation is leased for,
+# the claim becomes permanent when the reservation commits, see accounting.holds
+SEAT_CLAIM_TTL = env.int("DJANGO_SEAT_CLAIM_TTL", default=30)
+# Accept deferred seat holds with the in-process seat hold engine when the cache
+# is not redis, the views and the flusher must run in one process, e.g. in tests
+DEFERRED_SEAT_HOLDS_IN_PROCESS = False
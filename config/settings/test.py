@@ -3,6 +3,7 @@ With these settings, tests run faster.
 """
 
 from .base import *  # noqa: F403
+from .base import REST_FRAMEWORK
 from .base import TEMPLATES
 from .base import env
 
@@ -36,3 +37,7 @@ TEMPLATES[0]["OPTIONS"]["debug"] = True  # type: ignore[index]
 MEDIA_URL = "http://media.testserver"
 # Your stuff...
 # ------------------------------------------------------------------------------
+# All test requests come from one ip, throttling tests set their own rates
+REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] = {}
+# Views and the seat hold flusher run in the test process
+DEFERRED_SEAT_HOLDS_IN_PROCESS = True
@@ -0,0 +1,224 @@
+"""
+Sliding window throttling
+
+Each throttle keeps the times of the accepted requests of the last window and
+rejects a request when the window is full, the check and the insert are one redis
+script so concurrent workers can not both take the last slot.
+Rates are read from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] by the throttle_scope
+of the view and the kind of the throttle, e.g. "purchase_user", a scope without a
+rate is not throttled.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import defaultdict
+from collections import deque
+from functools import cache
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from config.utils import parse_id
+from config.utils import redis_connection
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str) -> tuple[int, int]:
+    """
+    Parse a rest framework rate like "30/min"
+
+    :param rate: the rate
+    :type rate: str
+    :return: number of requests and duration of the window in seconds
+    :rtype: tuple[int, int]
+    """
+    limit, period = rate.split("/")
+    return int(limit), DURATIONS[period[0]]
+
+
+class LocalSlidingWindows:
+    """
+    In-process stand-in of the redis sliding windows, used in local development
+    and tests where the default cache is not redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: dict[str, deque[float]] = defaultdict(deque)
+
+    def hit(self, key: str, limit: int, duration: int) -> float | None:
+        """
+        Record a request in the window of the key if the window is not full
+
+        :param key: the window key
+        :type key: str
+        :param limit: maximum number of requests in the window
+        :type limit: int
+        :param duration: length of the window in seconds
+        :type duration: int
+        :return: None when the request is accepted, otherwise seconds to wait
+        :rtype: float | None
+        """
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows[key]
+            while window and window[0] <= now - duration:
+                window.popleft()
+            if len(window) < limit:
+                window.append(now)
+                return None
+            return window[0] + duration - now
+
+
+class RedisSlidingWindows:
+    """
+    Sliding windows stored in redis as sorted sets of request times,
+    throttle:<scope>:<kind>:<ident>
+    """
+
+    HIT_SCRIPT = """
+    local time = redis.call('TIME')
+    local now = time[1] * 1000 + math.floor(time[2] / 1000)
+    local window = tonumber(ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+    if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+        redis.call('ZADD', KEYS[1], now, now .. ':' .. ARGV[3])
+        redis.call('PEXPIRE', KEYS[1], window)
+        return -1
+    end
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return tonumber(oldest[2]) + window - now
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._hit = client.register_script(self.HIT_SCRIPT)
+
+    def hit(self, key: str, limit: int, duration: int) -> float | None:
+        wait = self._hit(keys=[key], args=[limit, duration * 1000, uuid.uuid4().hex])
+        return None if wait < 0 else wait / 1000
+
+
+@cache
+def get_sliding_windows() -> LocalSlidingWindows | RedisSlidingWindows:
+    """
+    Return the sliding windows of this process,
+    redis when the default cache is redis otherwise the local stand-in
+    """
+    client = redis_connection()
+    if client is None:
+        return LocalSlidingWindows()
+    return RedisSlidingWindows(client)
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Base class of sliding window throttles, subclasses return the identity of the
+    request which is throttled, None to not throttle the request.
+    They must not touch the database, views check them before authentication.
+    """
+
+    kind: str
+
+    def __init__(self):
+        self.wait_seconds: float | None = None
+
+    def get_identity(self, request, view) -> str | None:
+        raise NotImplementedError
+
+    def allow_request(self, request, view) -> bool:
+        """
+        Check the request fits in the window of its scope and identity
+        :param request: the request object
+        :type request: Request
+        :param view: view object
+        :type view: View
+        :return: request is allowed
+        :rtype: bool
+        """
+        scope = getattr(view, "throttle_scope", None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(f"{scope}_{self.kind}")
+        if scope is None or rate is None:
+            return True
+        identity = self.get_identity(request, view)
+        if identity is None:
+            return True
+        limit, duration = parse_rate(rate)
+        self.wait_seconds = get_sliding_windows().hit(
+            f"throttle:{scope}:{self.kind}:{identity}",
+            limit,
+            duration,
+        )
+        return self.wait_seconds is None
+
+    def wait(self) -> float | None:
+        return self.wait_seconds
+
+
+class UserSlidingWindowThrottle(SlidingWindowThrottle):
+    """
+    Throttle by the credential of the request (token or session), which is one
+    user, without authenticating it. Anonymous requests are not throttled.
+    """
+
+    kind = "user"
+
+    def get_identity(self, request, view) -> str | None:
+        credential = request.headers.get("Authorization") or request.COOKIES.get(
+            settings.SESSION_COOKIE_NAME,
+        )
+        if not credential:
+            return None
+        return hashlib.sha256(credential.encode()).hexdigest()[:32]
+
+
+class IPSlidingWindowThrottle(SlidingWindowThrottle):
+    """
+    Throttle by the client ip, NUM_PROXIES of rest framework is respected
+    """
+
+    kind = "ip"
+
+    def get_identity(self, request, view) -> str | None:
+        return self.get_ident(request)
+
+
+class MatchSlidingWindowThrottle(SlidingWindowThrottle):
+    """
+    Throttle all the requests for one match, the match is taken from the url or
+    the match field of the request. Requests which only name seats are not
+    throttled, finding their match needs the database, so the views which take
+    seat ids (e.g. accounting.views.AddInvoiceItemView) do not use it.
+    """
+
+    kind = "match"
+
+    def get_identity(self, request, view) -> str | None:
+        match_id = view.kwargs.get("pk") or (
+            request.data.get("match") if hasattr(request.data, "get") else None
+        )
+        # parsed as the serializers parse it, 12.0 and " 12" are match 12 too
+        match_id = parse_id(match_id) if match_id is not None else None
+        return None if match_id is None else str(match_id)
+
+
+class ThrottleBeforeAuthenticationMixin:
+    """
+    Check throttles of the view before authentication and permissions, which read
+    the database, so throttled requests are rejected without touching it.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        self.check_throttles(request)
+        request.throttles_checked = True
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        if not getattr(request, "throttles_checked", False):
+            super().check_throttles(request)
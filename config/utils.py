@@ -4,7 +4,9 @@ from django.test import Client
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
+from django_redis import get_redis_connection
 from model_bakery import baker
+from rest_framework import serializers
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -34,6 +36,34 @@ class OkResponse(Response):
         super().__init__(*args, data=data, status=status, **kwargs)
 
 
+def redis_connection():
+    """
+    Return the raw redis client behind the default cache
+    In local development and tests the default cache is locmem, so there is no
+    redis and None is returned, callers fall back to an in-process stand-in.
+    :return: redis client or None
+    :rtype: redis.Redis | None
+    """
+    try:
+        return get_redis_connection("default")
+    except NotImplementedError:
+        return None
+
+
+def parse_id(value) -> int | None:
+    """
+    Return the id as an IntegerField of rest framework parses it, e.g. 12, "12",
+    12.0 or " 12", so checks made before the serializer see the same id
+    :param value: the value of the request data
+    :return: the id, None if the value is not an id
+    :rtype: int | None
+    """
+    try:
+        return serializers.IntegerField().to_internal_value(value)
+    except serializers.ValidationError:
+        return None
+
+
 class AdminTestCase(TestCase):
     def setUp(self):
         self.client = Client()
@@ -7,16 +7,20 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from config.throttling import IPSlidingWindowThrottle
+from config.throttling import ThrottleBeforeAuthenticationMixin
 from matchticketselling.users.models import User
 from matchticketselling.users.serializers import SignupSerializer
 
 
-class SignupView(APIView):
+class SignupView(ThrottleBeforeAuthenticationMixin, APIView):
     """
     View for user registration and account creation.
     """
 
     permission_classes = [AllowAny]
+    throttle_classes = [IPSlidingWindowThrottle]
+    throttle_scope = "signup"
     serializer_class = SignupSerializer
 
     @extend_schema(
@@ -1,6 +1,10 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
 from rest_framework.test import APIRequestFactory
 
+from config.throttling import get_sliding_windows
 from matchticketselling.users.api.views import UserViewSet
 from matchticketselling.users.models import User
 
@@ -33,3 +37,35 @@ class TestUserViewSet:
             "url": f"http://testserver/api/users/{user.username}/",
             "name": user.name,
         }
+
+
+class TestSignupView:
+    @pytest.fixture()
+    def _signup_rate(self, settings):
+        get_sliding_windows.cache_clear()
+        settings.REST_FRAMEWORK = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {"signup_ip": "2/hour"},
+        }
+        yield
+        get_sliding_windows.cache_clear()
+
+    @pytest.mark.usefixtures("_signup_rate")
+    def test_signup_is_throttled_by_ip(self, db, client):
+        for username in ["first", "second"]:
+            response = client.post(
+                "/auth/signup",
+                {
+                    "username": username,
+                    "password": "password",
+                    "duplicate_password": "password",
+                },
+            )
+            assert response.status_code == status.HTTP_201_CREATED
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post("/auth/signup", {"username": "third"})
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response["Retry-After"]) > 0
+        assert not User.objects.filter(username="third").exists()
+        # only the savepoint of ATOMIC_REQUESTS
+        assert all("SAVEPOINT" in query["sql"] for query in queries)
@@ -3,12 +3,15 @@ from __future__ import annotations
 import typing
 
 from django.contrib import admin
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
 
 from stadium_management.forms import MatchAdminAddForm
 from stadium_management.models import Match
 from stadium_management.models import Seat
 from stadium_management.models import Stadium
 from stadium_management.models import Team
+from stadium_management.versions import bump_match_versions_on_commit
 
 if typing.TYPE_CHECKING:
     from django.forms import ModelForm
@@ -31,9 +34,11 @@ class TeamAdmin(admin.ModelAdmin):
 class MatchAdmin(admin.ModelAdmin):
     add_form = MatchAdminAddForm
     autocomplete_fields = ["host_team", "guest_team", "stadium"]
-    list_display = ["host_team", "guest_team", "stadium", "datetime"]
+    list_display = ["host_team", "guest_team", "stadium", "datetime", "seats_status"]
     search_fields = ["host_team__name", "guest_team__name", "stadium__name"]
-    list_filter = ["datetime"]
+    list_filter = ["datetime", "seats_status"]
+    readonly_fields = ["seats_status"]
+    actions = ["retry_seat_generation"]
 
     def save_model(
         self,
@@ -43,7 +48,8 @@ class MatchAdmin(admin.ModelAdmin):
         change: bool,  # noqa: FBT001
     ):
         """
-        After saving the match base on the user input, it will create match seats
+        Save the match, its seats are generated in the background by the
+        generate_seats command if the user asked for them
 
         :param request: The HttpRequest object
         :type request: HttpRequest
@@ -56,12 +62,24 @@ class MatchAdmin(admin.ModelAdmin):
         :type change: bool
         :return: None
         """
+        if not change and form.cleaned_data.get("does_create_seats"):
+            obj.seats_status = Match.SeatsStatus.PENDING
         super().save_model(request, obj, form, change)
-        if not change:
-            does_create_seats = form.cleaned_data.get("does_create_seats", None)
-            if does_create_seats is None:
-                return
-            obj.create_seats()
+
+    @admin.action(description=_("Retry seat generation of failed or stuck matches"))
+    def retry_seat_generation(self, request: HttpRequest, queryset):
+        # a generating match is locked while its seats are created, the unlocked
+        # ones were left by a worker which died
+        stuck = queryset.filter(
+            Q(seats_status=Match.SeatsStatus.FAILED)
+            | Q(
+                id__in=Match.objects.select_for_update(skip_locked=True)
+                .filter(seats_status=Match.SeatsStatus.GENERATING)
+                .values("id"),
+            ),
+        )
+        bump_match_versions_on_commit(stuck.values_list("id", flat=True))
+        stuck.update(seats_status=Match.SeatsStatus.PENDING, seats_claimed_at=None)
 
     def get_form(
         self,
@@ -101,3 +119,13 @@ class SeatAdmin(admin.ModelAdmin):
         "match__guest_team__name",
         "match__stadium__name",
     ]
+
+    def delete_model(self, request: HttpRequest, obj: Seat) -> None:
+        bump_match_versions_on_commit([obj.match_id])
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request: HttpRequest, queryset) -> None:
+        bump_match_versions_on_commit(
+            queryset.values_list("match_id", flat=True).distinct(),
+        )
+        super().delete_queryset(request, queryset)
@@ -1,6 +1,12 @@
+import contextlib
+
 from django.apps import AppConfig
 
 
 class StadiumManagementConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "stadium_management"
+
+    def ready(self):
+        with contextlib.suppress(ImportError):
+            import stadium_management.signals  # noqa: F401
@@ -0,0 +1,263 @@
+"""
+Async read views of stadiums, matches and seat availability
+
+Under ASGI (config/asgi.py) they replace the GET endpoints of StadiumViewSet and
+MatchViewSet, so a worker keeps serving while many slow clients poll instead of
+giving a thread to each of them. They read through the async ORM and return the
+same responses as the viewsets: rendered by the renderer of
+DEFAULT_RENDERER_CLASSES negotiated on Accept, with the same ETags of match
+versions.
+Other methods of the same urls are delegated to the viewsets in a thread, in a
+transaction as ATOMIC_REQUESTS would do.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import Http404
+from django.http import HttpResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from stadium_management.availability import availability_envelope
+from stadium_management.availability import get_seat_availability
+from stadium_management.availability import rebuild_seat_availability
+from stadium_management.catalog import MatchCatalogQuerySerializer
+from stadium_management.catalog import match_catalog_response
+from stadium_management.models import Match
+from stadium_management.models import Stadium
+from stadium_management.renderers import SeatBitmapRenderer
+from stadium_management.serializers import MatchSerializer
+from stadium_management.serializers import StadiumSerializer
+from stadium_management.versions import etag_matches
+from stadium_management.versions import match_etag
+from stadium_management.views import MatchViewSet
+from stadium_management.views import StadiumViewSet
+
+if typing.TYPE_CHECKING:
+    from django.http import HttpRequest
+    from rest_framework.renderers import BaseRenderer
+    from rest_framework.viewsets import GenericViewSet
+
+
+def api_renderers() -> list[BaseRenderer]:
+    """
+    Return the renderers of DEFAULT_RENDERER_CLASSES (e.g. orjson and msgpack when
+    they are enabled) except the html ones, which need a rest framework view
+    """
+    return [
+        renderer()
+        for renderer in api_settings.DEFAULT_RENDERER_CLASSES
+        if renderer.media_type != "text/html"
+    ]
+
+
+def select_renderer(
+    request: HttpRequest,
+    renderers: list[BaseRenderer] | None = None,
+) -> tuple[BaseRenderer, str]:
+    """
+    Select the renderer of the response by the Accept header and the format
+    query parameter as rest framework does, the first renderer if none of them
+    is acceptable
+
+    :param request: Http request object
+    :type request: HttpRequest
+    :param renderers: the renderers, api_renderers() if it's None
+    :type renderers: list[BaseRenderer] | None
+    :return: the renderer and the accepted media type
+    :rtype: tuple[BaseRenderer, str]
+    """
+    renderers = renderers or api_renderers()
+    negotiator = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS()
+    try:
+        return negotiator.select_renderer(Request(request), renderers)
+    except (Http404, NotAcceptable):
+        return renderers[0], renderers[0].media_type
+
+
+def api_response(
+    request: HttpRequest,
+    data,
+    status_code: int = status.HTTP_200_OK,
+    accepted: tuple[BaseRenderer, str] | None = None,
+) -> HttpResponse:
+    """
+    Render the data with the renderer selected for the request
+
+    :param request: Http request object
+    :type request: HttpRequest
+    :param data: the data
+    :param status_code: status code of the response
+    :type status_code: int
+    :param accepted: renderer and media type of select_renderer, if they are
+        already selected
+    :type accepted: tuple[BaseRenderer, str] | None
+    :return: the response
+    :rtype: HttpResponse
+    """
+    renderer, media_type = accepted or select_renderer(request)
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    return HttpResponse(
+        renderer.render(data, media_type, {}),
+        status=status_code,
+        content_type=content_type,
+    )
+
+
+def not_found(request: HttpRequest) -> HttpResponse:
+    return api_response(request, {"detail": "Not found."}, status.HTTP_404_NOT_FOUND)
+
+
+async def current_match_etag(
+    request: HttpRequest,
+    match_id: int,
+    media_type: str,
+) -> str:
+    # the version is read from redis in a worker thread
+    return await sync_to_async(match_etag, thread_sensitive=False)(
+        request,
+        match_id,
+        media_type,
+    )
+
+
+def not_modified(etag: str) -> HttpResponse:
+    return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+class AsyncReadView(View):
+    """
+    Base class of the async read views, GET is served by the async get method and
+    other methods are delegated to the actions of the viewset.
+    """
+
+    viewset: type[GenericViewSet] | None = None
+    actions: typing.ClassVar[dict[str, str]] = {}
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):  # noqa: N805
+        # reads do not need a transaction, delegated writes open their own
+        view = transaction.non_atomic_requests(super().as_view(**initkwargs))
+        # rest framework views check csrf of session authenticated requests,
+        # csrf_exempt of django 4.2 would hide that the view is async
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        if request.method in ("GET", "HEAD"):
+            return await self.get(request, *args, **kwargs)
+        method = request.method.lower()
+        if self.viewset is None or method not in self.actions:
+            return api_response(
+                request,
+                {"detail": f'Method "{request.method}" not allowed.'},
+                status.HTTP_405_METHOD_NOT_ALLOWED,
+            )
+        view = self.viewset.as_view({method: self.actions[method]})
+        return await sync_to_async(transaction.atomic(view))(request, *args, **kwargs)
+
+    async def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        raise NotImplementedError
+
+
+class StadiumListView(AsyncReadView):
+    viewset = StadiumViewSet
+    actions: typing.ClassVar[dict[str, str]] = {"post": "create"}
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        stadiums = [stadium async for stadium in Stadium.objects.all()]
+        serializer = StadiumSerializer(
+            stadiums,
+            many=True,
+            context={"request": request},
+        )
+        return api_response(request, serializer.data)
+
+
+class StadiumDetailView(AsyncReadView):
+    viewset = StadiumViewSet
+    actions: typing.ClassVar[dict[str, str]] = {
+        "put": "update",
+        "patch": "partial_update",
+        "delete": "destroy",
+    }
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        try:
+            stadium = await Stadium.objects.aget(pk=pk)
+        except Stadium.DoesNotExist:
+            return not_found(request)
+        serializer = StadiumSerializer(stadium, context={"request": request})
+        return api_response(request, serializer.data)
+
+
+class MatchListView(AsyncReadView):
+    viewset = MatchViewSet
+    actions: typing.ClassVar[dict[str, str]] = {"post": "create"}
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        query = MatchCatalogQuerySerializer(data=request.GET)
+        if not query.is_valid():
+            return api_response(request, query.errors, status.HTTP_400_BAD_REQUEST)
+        page = await sync_to_async(match_catalog_response)(
+            request,
+            query.validated_data,
+        )
+        return api_response(request, page)
+
+
+class MatchDetailView(AsyncReadView):
+    viewset = MatchViewSet
+    actions: typing.ClassVar[dict[str, str]] = {"delete": "destroy"}
+
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        accepted = select_renderer(request)
+        etag = await current_match_etag(request, pk, accepted[1])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        try:
+            match = await Match.objects.aget(pk=pk)
+        except Match.DoesNotExist:
+            return not_found(request)
+        response = api_response(request, MatchSerializer(match).data, accepted=accepted)
+        response["ETag"] = etag
+        return response
+
+
+class MatchAvailabilityView(AsyncReadView):
+    async def get(self, request: HttpRequest, pk: int) -> HttpResponse:
+        accepted = select_renderer(request, [SeatBitmapRenderer(), *api_renderers()])
+        etag = await current_match_etag(request, pk, accepted[1])
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        # redis is called in a worker thread to not block the event loop
+        read_bitmap = sync_to_async(
+            get_seat_availability().bitmap,
+            thread_sensitive=False,
+        )
+        bitmap = await read_bitmap(pk)
+        if bitmap is None:
+            if not await Match.objects.filter(pk=pk).aexists():
+                return not_found(request)
+            await sync_to_async(rebuild_seat_availability)(pk)
+            bitmap = await read_bitmap(pk) or b""
+        if isinstance(accepted[0], SeatBitmapRenderer):
+            response = HttpResponse(bitmap, content_type=SeatBitmapRenderer.media_type)
+        else:
+            response = api_response(
+                request,
+                availability_envelope(pk, bitmap),
+                accepted=accepted,
+            )
+        response["ETag"] = etag
+        return response
@@ -0,0 +1,291 @@
+"""
+Free seat bitmap of matches
+
+Each match has a bitmap with one bit per seat number, the bit of seat number n is
+bit n - 1 counting from the most significant bit of the first byte (the order of
+redis SETBIT), a set bit means the seat is free.
+A 12,000 seats arena fits in 1.5 KB, so finding free seats costs microseconds
+instead of scanning and locking rows of the Seat table.
+The bitmap is built lazily from the Seat table (and the stadium capacity for
+matches with lazy seats, see stadium_management.inventory) and kept up to date by
+the seats_reserved and seats_released signals.
+"""
+
+from __future__ import annotations
+
+import base64
+import threading
+import typing
+from functools import cache
+
+from config.utils import redis_connection
+from stadium_management.inventory import lazy_seat_numbers
+from stadium_management.models import Seat
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterable
+
+
+def pack_seat_numbers(size: int, numbers: Iterable[int]) -> bytearray:
+    """
+    Pack seat numbers into a bitmap
+
+    :param size: the biggest seat number
+    :type size: int
+    :param numbers: seat numbers of set bits
+    :type numbers: Iterable[int]
+    :return: the bitmap
+    :rtype: bytearray
+    """
+    bitmap = bytearray((size + 7) // 8)
+    for number in numbers:
+        _set_bit(bitmap, number, value=True)
+    return bitmap
+
+
+def unpack_seat_numbers(bitmap: bytes, count: int | None = None) -> list[int]:
+    """
+    Return seat numbers of set bits in ascending order
+
+    :param bitmap: the bitmap
+    :type bitmap: bytes
+    :param count: maximum number of seat numbers to return, all of them if None
+    :type count: int | None
+    :return: seat numbers
+    :rtype: list[int]
+    """
+    numbers = []
+    for index, byte in enumerate(bitmap):
+        if not byte:
+            continue
+        for bit in range(8):
+            if byte & (0x80 >> bit):
+                numbers.append(index * 8 + bit + 1)
+                if count is not None and len(numbers) == count:
+                    return numbers
+    return numbers
+
+
+def _set_bit(bitmap: bytearray, number: int, *, value: bool) -> None:
+    index, bit = divmod(number - 1, 8)
+    if index >= len(bitmap):
+        return
+    if value:
+        bitmap[index] |= 0x80 >> bit
+    else:
+        bitmap[index] &= ~(0x80 >> bit) & 0xFF
+
+
+class LocalSeatAvailability:
+    """
+    In-process stand-in of the redis bitmaps, used in local development and tests
+    where the default cache is not redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bitmaps: dict[int, bytearray] = {}
+
+    def is_built(self, match_id: int) -> bool:
+        return match_id in self._bitmaps
+
+    def build(self, match_id: int, size: int, free_numbers: Iterable[int]) -> None:
+        bitmap = pack_seat_numbers(size, free_numbers)
+        with self._lock:
+            self._bitmaps[match_id] = bitmap
+
+    def discard(self, match_id: int) -> None:
+        with self._lock:
+            self._bitmaps.pop(match_id, None)
+
+    def mark_reserved(self, match_id: int, numbers: list[int]) -> None:
+        self._update(match_id, numbers, value=False)
+
+    def mark_free(self, match_id: int, numbers: list[int]) -> None:
+        self._update(match_id, numbers, value=True)
+
+    def _update(self, match_id: int, numbers: list[int], *, value: bool) -> None:
+        with self._lock:
+            bitmap = self._bitmaps.get(match_id)
+            if bitmap is None:
+                return
+            for number in numbers:
+                _set_bit(bitmap, number, value=value)
+
+    def allocate(self, match_id: int, count: int) -> list[int]:
+        """
+        Take the lowest numbered free seats of the match, their bits are cleared
+
+        :param match_id: the match id
+        :type match_id: int
+        :param count: number of seats
+        :type count: int
+        :return: seat numbers, fewer than count if there are not enough free seats
+        :rtype: list[int]
+        """
+        with self._lock:
+            bitmap = self._bitmaps.get(match_id)
+            if bitmap is None:
+                return []
+            numbers = unpack_seat_numbers(bitmap, count)
+            for number in numbers:
+                _set_bit(bitmap, number, value=False)
+            return numbers
+
+    def bitmap(self, match_id: int) -> bytes | None:
+        with self._lock:
+            bitmap = self._bitmaps.get(match_id)
+            return None if bitmap is None else bytes(bitmap)
+
+
+class RedisSeatAvailability:
+    """
+    Seat bitmaps stored in redis as strings, seat-availability:<match id>
+    """
+
+    UPDATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local size = redis.call('STRLEN', KEYS[1]) * 8
+    for index = 2, #ARGV do
+        local offset = tonumber(ARGV[index]) - 1
+        if offset < size then
+            redis.call('SETBIT', KEYS[1], offset, ARGV[1])
+        end
+    end
+    return 1
+    """
+    ALLOCATE_SCRIPT = """
+    local numbers = {}
+    local start = 0
+    while #numbers < tonumber(ARGV[1]) do
+        local offset = redis.call('BITPOS', KEYS[1], 1, start)
+        if offset < 0 then
+            break
+        end
+        redis.call('SETBIT', KEYS[1], offset, 0)
+        numbers[#numbers + 1] = offset + 1
+        start = math.floor(offset / 8)
+    end
+    return numbers
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._update = client.register_script(self.UPDATE_SCRIPT)
+        self._allocate = client.register_script(self.ALLOCATE_SCRIPT)
+
+    @staticmethod
+    def _key(match_id: int) -> str:
+        return f"seat-availability:{match_id}"
+
+    def is_built(self, match_id: int) -> bool:
+        return bool(self._client.exists(self._key(match_id)))
+
+    def build(self, match_id: int, size: int, free_numbers: Iterable[int]) -> None:
+        self._client.set(
+            self._key(match_id),
+            bytes(pack_seat_numbers(size, free_numbers)),
+        )
+
+    def discard(self, match_id: int) -> None:
+        self._client.delete(self._key(match_id))
+
+    def mark_reserved(self, match_id: int, numbers: list[int]) -> None:
+        if numbers:
+            self._update(keys=[self._key(match_id)], args=[0, *numbers])
+
+    def mark_free(self, match_id: int, numbers: list[int]) -> None:
+        if numbers:
+            self._update(keys=[self._key(match_id)], args=[1, *numbers])
+
+    def allocate(self, match_id: int, count: int) -> list[int]:
+        numbers = self._allocate(keys=[self._key(match_id)], args=[count])
+        return [int(number) for number in numbers]
+
+    def bitmap(self, match_id: int) -> bytes | None:
+        return self._client.get(self._key(match_id))
+
+
+@cache
+def get_seat_availability() -> LocalSeatAvailability | RedisSeatAvailability:
+    """
+    Return the seat bitmaps of this process,
+    redis when the default cache is redis otherwise the local stand-in
+    """
+    client = redis_connection()
+    if client is None:
+        return LocalSeatAvailability()
+    return RedisSeatAvailability(client)
+
+
+def rebuild_seat_availability(match_id: int) -> None:
+    """
+    Build the bitmap of the match from the Seat table, the seats of a match with
+    lazy seats are the capacity of its stadium less its reserved seats
+
+    :param match_id: the match id
+    :type match_id: int
+    """
+    capacity = lazy_seat_numbers(match_id)
+    if capacity is not None:
+        reserved = set(
+            Seat.objects.filter(match_id=match_id, is_reserved=True).values_list(
+                "number",
+                flat=True,
+            ),
+        )
+        get_seat_availability().build(
+            match_id,
+            size=capacity,
+            free_numbers=(
+                number for number in range(1, capacity + 1) if number not in reserved
+            ),
+        )
+        return
+    seats = list(
+        Seat.objects.filter(match_id=match_id).values_list("number", "is_reserved"),
+    )
+    get_seat_availability().build(
+        match_id,
+        size=max((number for number, _ in seats), default=0),
+        free_numbers=(number for number, is_reserved in seats if not is_reserved),
+    )
+
+
+def ensure_seat_availability(
+    match_id: int,
+) -> LocalSeatAvailability | RedisSeatAvailability:
+    """
+    Return the seat bitmaps, the bitmap of the match is built if it does not exist
+
+    :param match_id: the match id
+    :type match_id: int
+    :return: the seat bitmaps
+    :rtype: LocalSeatAvailability | RedisSeatAvailability
+    """
+    availability = get_seat_availability()
+    if not availability.is_built(match_id):
+        rebuild_seat_availability(match_id)
+    return availability
+
+
+def availability_envelope(match_id: int, bitmap: bytes) -> dict:
+    """
+    Return the json representation of the bitmap of the match
+
+    :param match_id: the match id
+    :type match_id: int
+    :param bitmap: the bitmap
+    :type bitmap: bytes
+    :return: match, number of seats and free seats and the base64 bitmap
+    :rtype: dict
+    """
+    return {
+        "match": match_id,
+        "seats": len(bitmap) * 8,
+        "free": int.from_bytes(bitmap, "big").bit_count(),
+        "encoding": "base64",
+        "bitmap": base64.b64encode(bitmap).decode(),
+    }
@@ -0,0 +1,200 @@
+"""
+Match catalog
+
+The match list (MatchViewSet.list and the async MatchListView) is filtered by the
+query parameters of MatchCatalogQuerySerializer and paginated by keyset on
+(datetime, id): a page starts right after the last match of the previous page, so
+it's read from the match_catalog indexes instead of skipping the previous pages.
+Pages are cached per query, the cache keys contain the catalog version which is
+changed when a match is saved or deleted (see stadium_management.signals), so
+cached pages are never served after a change of the catalog.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import time
+import typing
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.http import urlencode
+from rest_framework import serializers
+from rest_framework.utils.urls import replace_query_param
+
+from stadium_management.models import Match
+from stadium_management.serializers import MatchSerializer
+
+if typing.TYPE_CHECKING:
+    from django.db.models import QuerySet
+    from django.http import HttpRequest
+
+CATALOG_VERSION_KEY = "match-catalog-version"
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(match: Match) -> str:
+    """
+    Return the cursor of the page which starts after the match
+
+    :param match: last match of a page
+    :type match: Match
+    :return: the cursor
+    :rtype: str
+    """
+    position = json.dumps([match.datetime.isoformat(), match.id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Return the datetime and id of the last match of the previous page
+
+    :param cursor: the cursor
+    :type cursor: str
+    :return: datetime and id
+    :rtype: tuple[datetime, int]
+    :raises ValueError: if it's not a cursor
+    """
+    try:
+        position, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position), int(pk)
+    except (TypeError, ValueError) as error:
+        raise ValueError(cursor) from error
+
+
+class MatchCatalogQuerySerializer(serializers.Serializer):
+    stadium = serializers.IntegerField(min_value=1, required=False)
+    team = serializers.IntegerField(
+        min_value=1,
+        required=False,
+        help_text="Matches of the team, as the host or the guest",
+    )
+    since = serializers.DateTimeField(
+        required=False,
+        help_text="Matches which start at or after it",
+    )
+    until = serializers.DateTimeField(
+        required=False,
+        help_text="Matches which start before it",
+    )
+    on_sale = serializers.BooleanField(
+        required=False,
+        default=False,
+        help_text="Upcoming matches whose seats are ready",
+    )
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=MAX_PAGE_SIZE,
+        required=False,
+    )
+
+    def validate_cursor(self, cursor: str) -> tuple[datetime, int]:
+        try:
+            return decode_cursor(cursor)
+        except ValueError as error:
+            msg = "Invalid cursor"
+            raise serializers.ValidationError(msg) from error
+
+
+def match_catalog_queryset(query: dict) -> QuerySet[Match]:
+    """
+    Return the matches of the query in the order of the catalog
+
+    :param query: validated data of MatchCatalogQuerySerializer
+    :type query: dict
+    :return: the matches
+    :rtype: QuerySet[Match]
+    """
+    matches = Match.objects.order_by("datetime", "id")
+    if "stadium" in query:
+        matches = matches.filter(stadium_id=query["stadium"])
+    if "team" in query:
+        matches = matches.filter(
+            Q(host_team_id=query["team"]) | Q(guest_team_id=query["team"]),
+        )
+    if "since" in query:
+        matches = matches.filter(datetime__gte=query["since"])
+    if "until" in query:
+        matches = matches.filter(datetime__lt=query["until"])
+    if query.get("on_sale"):
+        matches = matches.filter(
+            datetime__gt=timezone.now(),
+            seats_status=Match.SeatsStatus.READY,
+        )
+    if "cursor" in query:
+        after, pk = query["cursor"]
+        # datetime >= after lets postgres start the index scan at the cursor
+        matches = matches.filter(datetime__gte=after).filter(
+            Q(datetime__gt=after) | Q(id__gt=pk),
+        )
+    return matches
+
+
+def match_catalog_page(query: dict) -> dict:
+    """
+    Return a page of the catalog from the cache, the page is read from the
+    database and cached on a miss
+
+    :param query: validated data of MatchCatalogQuerySerializer
+    :type query: dict
+    :return: the matches of the page and the cursor of the next page
+    :rtype: dict
+    """
+    page_size = query.get("page_size", settings.MATCH_CATALOG_PAGE_SIZE)
+    key = _page_key(query, page_size)
+    page = cache.get(key)
+    if page is None:
+        matches = list(match_catalog_queryset(query)[: page_size + 1])
+        page = {
+            "next": encode_cursor(matches[page_size - 1])
+            if len(matches) > page_size
+            else None,
+            "results": MatchSerializer(matches[:page_size], many=True).data,
+        }
+        cache.set(key, page, settings.MATCH_CATALOG_CACHE_TTL)
+    return page
+
+
+def match_catalog_response(request: HttpRequest, query: dict) -> dict:
+    """
+    Return the json of a page of the catalog, next is the url of the next page
+
+    :param request: the request of the page
+    :type request: HttpRequest
+    :param query: validated data of MatchCatalogQuerySerializer
+    :type query: dict
+    :return: the page
+    :rtype: dict
+    """
+    page = match_catalog_page(query)
+    next_url = None
+    if page["next"] is not None:
+        next_url = replace_query_param(
+            request.build_absolute_uri(),
+            "cursor",
+            page["next"],
+        )
+    return {"next": next_url, "results": page["results"]}
+
+
+def invalidate_match_catalog() -> None:
+    """
+    Change the catalog version, the cached pages are not read anymore and expire
+    """
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def _page_key(query: dict, page_size: int) -> str:
+    version = cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, None)
+    params = {**query, "page_size": page_size}
+    digest = hashlib.sha256(
+        urlencode(sorted((key, str(value)) for key, value in params.items())).encode(),
+    ).hexdigest()
+    return f"match-catalog:{version}:{digest}"
@@ -18,4 +18,12 @@ class MatchAdminAddForm(forms.ModelForm):
 
     class Meta:
         model = Match
-        fields = ["host_team", "guest_team", "stadium", "datetime", "seat_price"]
+        fields = [
+            "host_team",
+            "guest_team",
+            "stadium",
+            "datetime",
+            "duration",
+            "seat_price",
+            "lazy_seats",
+        ]
@@ -0,0 +1,114 @@
+"""
+Lazy seat inventory
+
+The seats of a match with lazy_seats are not created with the match, its seat
+numbers are 1 to the capacity of its stadium and the free ones are tracked by the
+seat availability bitmap. The Seat row of a number is inserted by
+materialize_seats in the transaction which reserves it, the unique constraint of
+(number, match) keeps two transactions from selling the same seat. Released seats
+keep their rows.
+Reservations by seat number (seat holds, best available and any seat) work on
+both kinds of matches. match/<id>/seats/ lists the seats of a lazy match from the
+capacity without writing, seats without a row are listed without an id. The
+reservation endpoints which take seat ids take a match and a seat number instead,
+they materialize the seat of the number for the authenticated buyer.
+"""
+
+from __future__ import annotations
+
+import typing
+
+from django.db import connection
+
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.models import Stadium
+
+# Insert the missing free seats of the numbers, for ready lazy matches only. Numbers
+# out of the capacity of the stadium are ignored, seats which exist are left
+# untouched.
+MATERIALIZE_SEATS_SQL = """
+INSERT INTO {seat} (number, match_id, price, is_reserved, full_name)
+SELECT number, match.id, match.seat_price, false, ''
+FROM {match} AS match
+JOIN {stadium} AS stadium ON stadium.id = match.stadium_id
+CROSS JOIN unnest(%s::integer[]) AS number
+WHERE match.id = %s
+    AND match.lazy_seats
+    AND match.seats_status = %s
+    AND number BETWEEN 1 AND stadium.capacity
+ORDER BY number
+ON CONFLICT (number, match_id) DO NOTHING
+"""
+
+
+def materialize_seats(match_id: int, numbers: list[int]) -> None:
+    """
+    Make sure the seats of the numbers exist before they are locked and reserved,
+    it does nothing for matches without lazy_seats or whose seats are not ready.
+    Call it in the transaction of the reservation.
+
+    :param match_id: the match id
+    :type match_id: int
+    :param numbers: seat numbers
+    :type numbers: list[int]
+    """
+    if not numbers:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            MATERIALIZE_SEATS_SQL.format(
+                seat=Seat._meta.db_table,  # noqa: SLF001
+                match=Match._meta.db_table,  # noqa: SLF001
+                stadium=Stadium._meta.db_table,  # noqa: SLF001
+            ),
+            [sorted(set(numbers)), match_id, Match.SeatsStatus.READY],
+        )
+
+
+def lazy_seat_numbers(match_id: int) -> int | None:
+    """
+    Return the number of seats of the match if it has lazy seats which are ready,
+    otherwise None
+
+    :param match_id: the match id
+    :type match_id: int
+    :return: capacity of the stadium of a lazy match
+    :rtype: int | None
+    """
+    return (
+        Match.objects.filter(
+            id=match_id,
+            lazy_seats=True,
+            seats_status=Match.SeatsStatus.READY,
+        )
+        .values_list("stadium__capacity", flat=True)
+        .first()
+    )
+
+
+class LazySeats(typing.NamedTuple):
+    capacity: int
+    seat_price: int
+
+
+def lazy_seats(match_id: int) -> LazySeats | None:
+    """
+    Return the capacity and the seat price of the match if it has lazy seats
+    which are ready, otherwise None
+
+    :param match_id: the match id
+    :type match_id: int
+    :return: capacity and seat price of a lazy match
+    :rtype: LazySeats | None
+    """
+    row = (
+        Match.objects.filter(
+            id=match_id,
+            lazy_seats=True,
+            seats_status=Match.SeatsStatus.READY,
+        )
+        .values_list("stadium__capacity", "seat_price")
+        .first()
+    )
+    return None if row is None else LazySeats(*row)
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from stadium_management.models import Match
+from stadium_management.models import Stadium
+from stadium_management.models import Team
+
+SERVERS = {
+    "wsgi": ["config.wsgi"],
+    "asgi": ["config.asgi", "--worker-class", "uvicorn.workers.UvicornWorker"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare one gunicorn sync worker (config.wsgi) and one uvicorn worker "
+        "(config.asgi) under concurrent clients polling the match and its seat "
+        "availability. It starts both servers on free local ports and creates and "
+        "removes its own stadium, match and seats."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pollers",
+            type=int,
+            nargs="+",
+            default=[1, 16, 64, 256],
+            help="Numbers of concurrent pollers to run, one round for each",
+        )
+        parser.add_argument("--duration", type=float, default=5)
+        parser.add_argument("--seats", type=int, default=2000)
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host header of the requests, it must be in ALLOWED_HOSTS",
+        )
+
+    def handle(self, *args, pollers, duration, seats, host, **options):
+        match = self._setup(seats)
+        requests = [
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+            "Accept: application/json\r\nConnection: close\r\n\r\n".encode()
+            for path in (
+                reverse(f"api:stadium_management:{name}", kwargs={"pk": match.id})
+                for name in ("match-detail", "match-availability")
+            )
+        ]
+        try:
+            for name, server in SERVERS.items():
+                with self._server(name, server) as port:
+                    for count in pollers:
+                        latencies, errors = asyncio.run(
+                            self._poll(port, requests, count, duration),
+                        )
+                        self._report(
+                            f"{name}: {count:>4} pollers",
+                            duration,
+                            latencies,
+                            errors,
+                        )
+        finally:
+            match.stadium.delete()
+            match.host_team.delete()
+            match.guest_team.delete()
+
+    def _report(self, label, duration, latencies, errors):
+        if not latencies:
+            self.stdout.write(f"{label}, no response")
+            return
+        latencies.sort()
+        p50 = statistics.median(latencies)
+        p99 = latencies[int(len(latencies) * 0.99)]
+        self.stdout.write(
+            f"{label}, {len(latencies) / duration:>6.0f} requests/s, "
+            f"p50 {p50 * 1000:>7.1f}ms, p99 {p99 * 1000:>7.1f}ms, {errors} errors",
+        )
+
+    @staticmethod
+    async def _poll(port, requests, count, duration):
+        latencies: list[float] = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+
+        async def poller(index):
+            nonlocal errors
+            request = requests[index % len(requests)]
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    writer.write(request)
+                    response = await reader.read()
+                    writer.close()
+                except OSError:
+                    errors += 1
+                    continue
+                if response.startswith(b"HTTP/1.1 200"):
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(poller(index) for index in range(count)))
+        return latencies, errors
+
+    @contextmanager
+    def _server(self, name, server):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE}
+        env.pop("DJANGO_ASYNC_READ_VIEWS", None)
+        process = subprocess.Popen(
+            [  # noqa: S603
+                sys.executable,
+                "-m",
+                "gunicorn",
+                *server,
+                "--workers",
+                "1",
+                "--backlog",
+                "4096",
+                "--bind",
+                f"127.0.0.1:{port}",
+                "--log-level",
+                "warning",
+            ],
+            env=env,
+            cwd=settings.BASE_DIR,
+        )
+        try:
+            self._wait_for_port(port, process)
+            self.stdout.write(f"{name} server on port {port}")
+            yield port
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    @staticmethod
+    def _wait_for_port(port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                msg = "The server exited before accepting connections"
+                raise CommandError(msg)
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            except OSError:
+                time.sleep(0.2)
+            else:
+                return
+        msg = "The server did not accept connections in time"
+        raise CommandError(msg)
+
+    @staticmethod
+    def _setup(seats):
+        name = f"benchmark-{uuid.uuid4().hex[:8]}"
+        stadium = Stadium.objects.create(name=name, description=name, capacity=seats)
+        match = Match.objects.create(
+            host_team=Team.objects.create(name=f"{name}-host"),
+            guest_team=Team.objects.create(name=f"{name}-guest"),
+            stadium=stadium,
+            datetime=timezone.now(),
+            seat_price=1000,
+        )
+        match.create_seats()
+        return match
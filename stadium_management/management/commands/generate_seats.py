@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stadium_management.tasks import generate_pending_seats
+
+
+class Command(BaseCommand):
+    help = "Generate the seats of the matches which wait for their seats"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1,
+            help="Seconds to sleep when there is no match waiting for its seats",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Generate the seats of the waiting matches and exit",
+        )
+
+    def handle(self, *args, interval: float, once: bool, **options):
+        while True:
+            start = time.perf_counter()
+            match = generate_pending_seats()
+            if match is not None:
+                self.stdout.write(
+                    f"match={match.id} seats_status={match.seats_status} "
+                    f"duration_ms={(time.perf_counter() - start) * 1000:.1f}",
+                )
+                continue
+            if once:
+                return
+            time.sleep(interval)
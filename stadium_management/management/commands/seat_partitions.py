@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from stadium_management.partitions import create_seat_partitions
+from stadium_management.partitions import detach_seat_partition
+from stadium_management.partitions import has_reserved_seats
+from stadium_management.partitions import old_seat_partitions
+from stadium_management.partitions import seat_references
+
+
+class Command(BaseCommand):
+    help = (
+        "Create partitions of the seat table for existing and upcoming matches, "
+        "seats of matches without a partition are moved out of the default "
+        "partition. Partitions of old matches are detached or dropped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=1,
+            help="Partitions to create after the last match",
+        )
+        parser.add_argument(
+            "--detach-before",
+            type=parse_datetime,
+            default=None,
+            help=(
+                "Detach partitions whose matches are all held before this datetime, "
+                "partitions with seats referenced by other tables are kept"
+            ),
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop detached partitions, partitions with reserved seats are kept",
+        )
+
+    def handle(self, *args, ahead, detach_before, drop, **options):
+        for partition in create_seat_partitions(ahead):
+            self.stdout.write(
+                f"{partition.name} is created for matches "
+                f"{partition.start} to {partition.end - 1}",
+            )
+        if detach_before is None:
+            return
+        for partition in old_seat_partitions(detach_before):
+            if references := seat_references(partition):
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"{partition.name} has seats referenced by "
+                        f"{', '.join(references)}, it is not detached",
+                    ),
+                )
+                continue
+            if drop and has_reserved_seats(partition):
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"{partition.name} has reserved seats, it is not dropped",
+                    ),
+                )
+                continue
+            detach_seat_partition(partition, drop=drop)
+            action = "dropped" if drop else "detached"
+            self.stdout.write(self.style.SUCCESS(f"{partition.name} is {action}"))
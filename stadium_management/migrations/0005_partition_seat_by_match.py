@@ -0,0 +1,85 @@
+# Generated by Django 4.2.11 on 2026-10-18 20:40
+
+from django.db import migrations
+import pgtrigger.compiler
+import pgtrigger.migrations
+
+# The seat table is rebuilt as a table partitioned by range of match_id, the
+# primary key of a partitioned table must contain the partition key so it becomes
+# (id, match_id). Existing rows are moved to the default partition, the
+# seat_partitions command moves them to range partitions.
+PARTITION_SEAT_SQL = """
+CREATE TABLE stadium_management_seat_partitioned (
+    LIKE stadium_management_seat INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY
+) PARTITION BY RANGE (match_id);
+CREATE TABLE stadium_management_seat_default
+    PARTITION OF stadium_management_seat_partitioned DEFAULT;
+INSERT INTO stadium_management_seat_partitioned SELECT * FROM stadium_management_seat;
+SELECT setval(
+    pg_get_serial_sequence('stadium_management_seat_partitioned', 'id'),
+    coalesce(max(id), 0) + 1,
+    false
+) FROM stadium_management_seat;
+DROP TABLE stadium_management_seat;
+ALTER TABLE stadium_management_seat_partitioned RENAME TO stadium_management_seat;
+ALTER SEQUENCE stadium_management_seat_partitioned_id_seq
+    RENAME TO stadium_management_seat_id_seq;
+ALTER TABLE stadium_management_seat
+    ADD CONSTRAINT stadium_management_seat_pkey PRIMARY KEY (id, match_id);
+ALTER TABLE stadium_management_seat
+    ADD CONSTRAINT match_seats_number_are_unique UNIQUE (number, match_id);
+CREATE INDEX stadium_management_seat_match_id_7982ae11
+    ON stadium_management_seat (match_id);
+ALTER TABLE stadium_management_seat
+    ADD CONSTRAINT stadium_management_s_match_id_7982ae11_fk_stadium_m
+    FOREIGN KEY (match_id) REFERENCES stadium_management_match (id)
+    DEFERRABLE INITIALLY DEFERRED;
+"""
+
+UNPARTITION_SEAT_SQL = """
+CREATE TABLE stadium_management_seat_plain (
+    LIKE stadium_management_seat INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY
+);
+INSERT INTO stadium_management_seat_plain SELECT * FROM stadium_management_seat;
+SELECT setval(
+    pg_get_serial_sequence('stadium_management_seat_plain', 'id'),
+    coalesce(max(id), 0) + 1,
+    false
+) FROM stadium_management_seat;
+DROP TABLE stadium_management_seat;
+ALTER TABLE stadium_management_seat_plain RENAME TO stadium_management_seat;
+ALTER SEQUENCE stadium_management_seat_plain_id_seq
+    RENAME TO stadium_management_seat_id_seq;
+ALTER TABLE stadium_management_seat
+    ADD CONSTRAINT stadium_management_seat_pkey PRIMARY KEY (id);
+ALTER TABLE stadium_management_seat
+    ADD CONSTRAINT match_seats_number_are_unique UNIQUE (number, match_id);
+CREATE INDEX stadium_management_seat_match_id_7982ae11
+    ON stadium_management_seat (match_id);
+ALTER TABLE stadium_management_seat
+    ADD CONSTRAINT stadium_management_s_match_id_7982ae11_fk_stadium_m
+    FOREIGN KEY (match_id) REFERENCES stadium_management_match (id)
+    DEFERRABLE INITIALLY DEFERRED;
+"""
+
+PROTECT_RESERVED_SEATS_TRIGGER = pgtrigger.compiler.Trigger(name='protect_reserved_seats_from_update_and_delete', sql=pgtrigger.compiler.UpsertTriggerSql(condition='WHEN (OLD."is_reserved")', func="RAISE EXCEPTION 'pgtrigger: Cannot delete or update rows from % table', TG_TABLE_NAME;", hash='d954a9a66bbddb6a70bdbb74f1a7420daa7f3b49', operation='DELETE OR UPDATE', pgid='pgtrigger_protect_reserved_seats_from_update_and_delete_c2061', table='stadium_management_seat', when='BEFORE'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0004_alter_seat_full_name_alter_seat_is_reserved'),
+        ('accounting', '0004_invoiceitem_seat_without_db_constraint'),
+    ]
+
+    operations = [
+        pgtrigger.migrations.RemoveTrigger(
+            model_name='seat',
+            name='protect_reserved_seats_from_update_and_delete',
+        ),
+        migrations.RunSQL(PARTITION_SEAT_SQL, UNPARTITION_SEAT_SQL),
+        pgtrigger.migrations.AddTrigger(
+            model_name='seat',
+            trigger=PROTECT_RESERVED_SEATS_TRIGGER,
+        ),
+    ]
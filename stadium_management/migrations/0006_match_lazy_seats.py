@@ -0,0 +1,18 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0005_partition_seat_by_match'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='lazy_seats',
+            field=models.BooleanField(default=False, help_text="Seats are not created with the match, the seat of a number is created when it's reserved.", verbose_name='lazy seats'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0006_match_lazy_seats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='seats_status',
+            field=models.CharField(choices=[('PEND', 'Pending'), ('GENR', 'Generating'), ('REDY', 'Ready'), ('FAIL', 'Failed')], default='REDY', max_length=4, verbose_name='seats status'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(condition=models.Q(('seats_status', 'PEND')), fields=['id'], name='matches_waiting_for_seats'),
+        ),
+    ]
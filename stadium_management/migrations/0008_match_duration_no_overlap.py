@@ -0,0 +1,25 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:10
+
+import datetime
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0007_match_seats_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='duration',
+            field=models.DurationField(default=datetime.timedelta(seconds=7200), verbose_name='duration'),
+        ),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(models.Func(models.F('stadium'), models.F('stadium'), models.Value('[]'), function='int8range', output_field=django.contrib.postgres.fields.ranges.BigIntegerRangeField()), '='), (models.Func(models.F('datetime'), models.Func(models.Value('UTC'), models.Func(models.Func(models.Value('UTC'), models.F('datetime'), function='timezone'), models.F('duration'), arg_joiner=' + ', output_field=models.DateTimeField(), template='(%(expressions)s)'), function='timezone'), function='tstzrange', output_field=django.contrib.postgres.fields.ranges.DateTimeRangeField()), '&&')], name='stadium_matches_do_not_overlap', violation_error_message='This stadium has a match for that date time!'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0008_match_duration_no_overlap'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['datetime', 'id'], name='match_catalog'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['stadium', 'datetime', 'id'], name='stadium_match_catalog'),
+        ),
+    ]
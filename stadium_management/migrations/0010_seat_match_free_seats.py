@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0009_match_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='seat',
+            index=models.Index(condition=models.Q(('is_reserved', False)), fields=['match', 'number'], name='match_free_seats'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.11 on 2026-10-18 21:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stadium_management', '0010_seat_match_free_seats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='match',
+            name='matches_waiting_for_seats',
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='seats_claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='seats claimed at'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(condition=models.Q(('seats_status__in', ['PEND', 'GENR'])), fields=['id'], name='matches_waiting_for_seats'),
+        ),
+    ]
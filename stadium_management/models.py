@@ -1,14 +1,23 @@
 from datetime import timedelta
 
 import pgtrigger
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import BigIntegerRangeField
+from django.contrib.postgres.fields import DateTimeRangeField
+from django.contrib.postgres.fields import RangeOperators
+from django.db import IntegrityError
+from django.db import connection
 from django.db import models
+from django.db import transaction
 from django.db.models import CheckConstraint
+from django.db.models import DateTimeField
+from django.db.models import F
+from django.db.models import Func
 from django.db.models import Q
 from django.db.models import UniqueConstraint
+from django.db.models import Value
 from django.utils.translation import gettext_lazy as _
-from django_lifecycle import BEFORE_CREATE
 from django_lifecycle import LifecycleModel
-from django_lifecycle import hook
 from rest_framework.exceptions import ValidationError
 
 
@@ -37,10 +46,58 @@ class Team(models.Model):
         return self.name
 
 
+# Seats are generated by postgres in one statement, nothing is built in python
+# and the memory use does not depend on the capacity of the stadium.
+CREATE_SEATS_SQL = """
+INSERT INTO {seat} (number, match_id, price, is_reserved, full_name)
+SELECT number, %s, %s, false, ''
+FROM generate_series(1, %s) AS number
+"""
+
+MATCH_CONFLICT_CONSTRAINT = "stadium_matches_do_not_overlap"
+
+
+def _utc(expression) -> Func:
+    return Func(Value("UTC"), expression, function="timezone")
+
+
+# [datetime, datetime + duration) of a match. The end is computed in UTC since
+# timestamptz + interval depends on the time zone and can not be indexed.
+MATCH_PERIOD = Func(
+    F("datetime"),
+    _utc(
+        Func(
+            _utc(F("datetime")),
+            F("duration"),
+            template="(%(expressions)s)",
+            arg_joiner=" + ",
+            output_field=DateTimeField(),
+        ),
+    ),
+    function="tstzrange",
+    output_field=DateTimeRangeField(),
+)
+# int8range(stadium_id, stadium_id, '[]') compares stadiums by the range equality
+# operator of gist, so the constraint does not need the btree_gist extension
+MATCH_STADIUM = Func(
+    F("stadium"),
+    F("stadium"),
+    Value("[]"),
+    function="int8range",
+    output_field=BigIntegerRangeField(),
+)
+
+
 class Match(LifecycleModel):
-    # TODO: it's better to put it on the constance package to be configurable
-    # from admin panel
+    # default duration of a match, it's set per match by the duration field
     DURATION = timedelta(minutes=120)
+
+    class SeatsStatus(models.TextChoices):
+        PENDING = "PEND", _("Pending")
+        GENERATING = "GENR", _("Generating")
+        READY = "REDY", _("Ready")
+        FAILED = "FAIL", _("Failed")
+
     host_team = models.ForeignKey(
         Team,
         on_delete=models.CASCADE,
@@ -59,11 +116,61 @@ class Match(LifecycleModel):
         verbose_name=_("stadium"),
     )
     datetime = models.DateTimeField(verbose_name=_("datetime"))
+    duration = models.DurationField(verbose_name=_("duration"), default=DURATION)
     seat_price = models.PositiveIntegerField(verbose_name=_("seat price"), default=0)
+    # seats are generated in the background by the generate_seats command, they
+    # become visible in the transaction which sets the status to ready
+    seats_status = models.CharField(
+        verbose_name=_("seats status"),
+        max_length=4,
+        choices=SeatsStatus.choices,
+        default=SeatsStatus.READY,
+    )
+    # when a generate_seats worker claimed the match, a generating match whose
+    # claim is older than SEAT_GENERATION_TIMEOUT is claimed again
+    seats_claimed_at = models.DateTimeField(
+        verbose_name=_("seats claimed at"),
+        null=True,
+        blank=True,
+    )
+    lazy_seats = models.BooleanField(
+        verbose_name=_("lazy seats"),
+        default=False,
+        help_text=_(
+            "Seats are not created with the match, the seat of a number is "
+            "created when it's reserved.",
+        ),
+    )
 
     class Meta:
         verbose_name = _("match")
         verbose_name_plural = _("matches")
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=Q(seats_status__in=["PEND", "GENR"]),
+                name="matches_waiting_for_seats",
+            ),
+            # keyset pagination of the match list, see stadium_management.catalog
+            models.Index(fields=["datetime", "id"], name="match_catalog"),
+            models.Index(
+                fields=["stadium", "datetime", "id"],
+                name="stadium_match_catalog",
+            ),
+        ]
+        constraints = [
+            # matches of a stadium must not overlap, checked by its gist index
+            ExclusionConstraint(
+                name=MATCH_CONFLICT_CONSTRAINT,
+                expressions=[
+                    (MATCH_STADIUM, RangeOperators.EQUAL),
+                    (MATCH_PERIOD, RangeOperators.OVERLAPS),
+                ],
+                violation_error_message=_(
+                    "This stadium has a match for that date time!",
+                ),
+            ),
+        ]
 
     def __str__(self):
         return (
@@ -71,26 +178,36 @@ class Match(LifecycleModel):
             f"{self.datetime} in {self.stadium}"
         )
 
-    @hook(BEFORE_CREATE)
-    def validate_stadium_conflict_of_matches(self):
-        """It prevents overlapping matches in stadiums"""
-        if self.__class__.objects.filter(
-            stadium=self.stadium,
-            datetime__lte=self.datetime + self.DURATION,
-            datetime__gte=self.datetime - self.DURATION,
-        ).exists():
+    def save(self, *args, **kwargs):
+        """
+        Save the match, a violation of the no overlapping matches constraint of
+        the stadium is raised as a validation error.
+        Bulk imports may use bulk_create, the constraint is checked by postgres.
+        """
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as error:
+            diag = getattr(error.__cause__, "diag", None)
+            if getattr(diag, "constraint_name", None) != MATCH_CONFLICT_CONSTRAINT:
+                raise
             raise ValidationError(
                 code=_("stadium_match_conflict"),
                 detail=_("This stadium has a match for that date time!"),
-            )
+            ) from error
 
     def create_seats(self):
-        seats = [
-            Seat(number=number, match=self, price=self.seat_price)
-            for number in range(1, self.stadium.capacity + 1)
-        ]
+        from stadium_management.partitions import create_seat_partition
 
-        Seat.objects.bulk_create(seats)
+        create_seat_partition(self.id)
+        if self.lazy_seats:
+            # see stadium_management.inventory
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                CREATE_SEATS_SQL.format(seat=Seat._meta.db_table),  # noqa: SLF001
+                [self.id, self.seat_price, self.stadium.capacity],
+            )
 
 
 class Seat(models.Model):
@@ -114,6 +231,14 @@ class Seat(models.Model):
     class Meta:
         verbose_name = _("seat")
         verbose_name_plural = _("seats")
+        indexes = [
+            # free seats of a match in order of number, see MatchViewSet.seats
+            models.Index(
+                fields=["match", "number"],
+                condition=Q(is_reserved=False),
+                name="match_free_seats",
+            ),
+        ]
         constraints = [
             UniqueConstraint(
                 fields=["number", "match"],
@@ -0,0 +1,223 @@
+"""
+Range partitions of the Seat table
+
+The seat table is partitioned by match_id, each partition holds the seats of
+settings.SEAT_PARTITION_SIZE consecutive match ids, so the seats of the matches on
+sale live in small partitions whose indexes stay in memory.
+Seats of matches without a partition land in the default partition.
+Seats of old matches are removed by detaching or dropping their partition instead
+of deleting their rows.
+"""
+
+from __future__ import annotations
+
+import re
+import typing
+
+import pgtrigger
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.db.models import Max
+
+from stadium_management.models import Match
+from stadium_management.models import Seat
+
+if typing.TYPE_CHECKING:
+    from datetime import datetime
+
+SEAT_TRIGGER = "stadium_management.Seat:protect_reserved_seats_from_update_and_delete"
+
+LIST_PARTITIONS_SQL = """
+SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+WHERE parent.relname = %s
+"""
+BOUND_RE = re.compile(r"FROM \('?(\d+)'?\) TO \('?(\d+)'?\)")
+
+# Rows of the new range that were inserted in the default partition are moved to
+# the new partition before it is attached, otherwise attaching fails.
+CREATE_PARTITION_SQL = """
+CREATE TABLE {partition} (LIKE {seat} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+WITH moved AS (
+    DELETE FROM {default} WHERE match_id >= %s AND match_id < %s
+    RETURNING *
+)
+INSERT INTO {partition} SELECT * FROM moved;
+ALTER TABLE {seat} ATTACH PARTITION {partition}
+    FOR VALUES FROM (%s) TO (%s);
+"""
+
+
+class SeatPartition(typing.NamedTuple):
+    name: str
+    start: int
+    end: int
+
+
+def _seat_table() -> str:
+    return Seat._meta.db_table  # noqa: SLF001
+
+
+def seat_partition_range(match_id: int) -> tuple[int, int]:
+    """
+    Return the match id range [start, end) of the partition of the match
+
+    :param match_id: the match id
+    :type match_id: int
+    :return: start and end of the range
+    :rtype: tuple[int, int]
+    """
+    start = match_id // settings.SEAT_PARTITION_SIZE * settings.SEAT_PARTITION_SIZE
+    return start, start + settings.SEAT_PARTITION_SIZE
+
+
+def list_seat_partitions() -> list[SeatPartition]:
+    """
+    Return range partitions of the seat table ordered by their range,
+    the default partition is not included
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(LIST_PARTITIONS_SQL, [_seat_table()])
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        matched = BOUND_RE.search(bound)
+        if matched is not None:
+            partitions.append(
+                SeatPartition(name, int(matched.group(1)), int(matched.group(2))),
+            )
+    return sorted(partitions, key=lambda partition: partition.start)
+
+
+def create_seat_partition(match_id: int) -> SeatPartition | None:
+    """
+    Create the partition of the match if no partition covers it
+
+    :param match_id: the match id
+    :type match_id: int
+    :return: the created partition, None if it exists
+    :rtype: SeatPartition | None
+    """
+    start, end = seat_partition_range(match_id)
+    with transaction.atomic():
+        # serializes concurrent creators, the second one finds the partition
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext(%s))",
+                [_seat_table()],
+            )
+        if any(
+            partition.start < end and start < partition.end
+            for partition in list_seat_partitions()
+        ):
+            return None
+        partition = SeatPartition(f"{_seat_table()}_p{start}", start, end)
+        # moving reserved seats out of the default partition deletes them there
+        with pgtrigger.ignore(SEAT_TRIGGER), connection.cursor() as cursor:
+            cursor.execute(
+                CREATE_PARTITION_SQL.format(
+                    seat=_seat_table(),
+                    default=f"{_seat_table()}_default",
+                    partition=partition.name,
+                ),
+                [start, end, start, end],
+            )
+    return partition
+
+
+def create_seat_partitions(ahead: int = 1) -> list[SeatPartition]:
+    """
+    Create partitions of all matches and of the next match ids
+
+    :param ahead: number of partitions to create after the last match
+    :type ahead: int
+    :return: created partitions
+    :rtype: list[SeatPartition]
+    """
+    starts = {
+        seat_partition_range(match_id)[0]
+        for match_id in Match.objects.values_list("id", flat=True)
+    }
+    last_id = Match.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+    next_start = seat_partition_range(last_id)[1]
+    starts.update(
+        next_start + index * settings.SEAT_PARTITION_SIZE for index in range(ahead)
+    )
+    created = [create_seat_partition(start) for start in sorted(starts)]
+    return [partition for partition in created if partition is not None]
+
+
+def old_seat_partitions(before: datetime) -> list[SeatPartition]:
+    """
+    Return partitions whose match ids are all allocated and whose matches are all
+    held before the given time
+
+    :param before: the time
+    :type before: datetime
+    :return: old partitions
+    :rtype: list[SeatPartition]
+    """
+    last_id = Match.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+    return [
+        partition
+        for partition in list_seat_partitions()
+        if partition.end <= last_id + 1
+        and not Match.objects.filter(
+            id__gte=partition.start,
+            id__lt=partition.end,
+            datetime__gte=before,
+        ).exists()
+    ]
+
+
+def has_reserved_seats(partition: SeatPartition) -> bool:
+    return Seat.objects.filter(
+        match_id__gte=partition.start,
+        match_id__lt=partition.end,
+        is_reserved=True,
+    ).exists()
+
+
+def seat_references(partition: SeatPartition) -> list[str]:
+    """
+    Return the models with rows which reference seats of the partition, e.g. the
+    invoice items of its matches. Their foreign keys have no database constraint
+    (see accounting.models.InvoiceItem.seat), so postgres does not stop the
+    partition from being detached or dropped under them.
+
+    :param partition: the partition
+    :type partition: SeatPartition
+    :return: labels of the referencing models
+    :rtype: list[str]
+    """
+    return [
+        relation.related_model._meta.label  # noqa: SLF001
+        for relation in Seat._meta.related_objects  # noqa: SLF001
+        if relation.related_model._default_manager.filter(  # noqa: SLF001
+            **{
+                f"{relation.field.name}__match_id__gte": partition.start,
+                f"{relation.field.name}__match_id__lt": partition.end,
+            },
+        ).exists()
+    ]
+
+
+def detach_seat_partition(partition: SeatPartition, *, drop: bool = False) -> None:
+    """
+    Detach the partition from the seat table, its table is kept for archiving
+    unless drop is True
+
+    :param partition: the partition
+    :type partition: SeatPartition
+    :param drop: drop the table of the partition too
+    :type drop: bool
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"ALTER TABLE {_seat_table()} DETACH PARTITION {partition.name}",
+        )
+        if drop:
+            cursor.execute(f"DROP TABLE {partition.name}")
@@ -1,6 +1,13 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
 
+from config.utils import parse_id
 from stadium_management.models import Seat
+from stadium_management.waiting_room import WAITING_ROOM_HEADER
+from stadium_management.waiting_room import get_waiting_room
+from stadium_management.waiting_room import read_waiting_room_token
 
 
 class IsAdminUserOrReadOnly(permissions.BasePermission):
@@ -39,3 +46,73 @@ class IsAdminAndNotReservedOrReadOnly(permissions.BasePermission):
         return request.method in permissions.SAFE_METHODS or (
             request.user and request.user.is_staff and not obj.is_reserved
         )
+
+
+class IsAdmittedFromWaitingRoom(permissions.BasePermission):
+    """
+    It's used for reservation views, the request must carry a waiting room token
+    of the requested match whose ticket is admitted. Everyone is admitted when the
+    waiting room is disabled.
+    """
+
+    message = _("You are not admitted from the waiting room of this match yet.")
+    code = "not_admitted"
+
+    def has_permission(self, request, view) -> bool:
+        """
+        Check the waiting room token of the request is admitted
+        :param request: the request object
+        :type request: Request
+        :param view: view object
+        :type view: View
+        :return: user has permission to this operation
+        :rtype: bool
+        """
+        if not settings.WAITING_ROOM_ADMISSION_RATE:
+            return True
+        ticket = read_waiting_room_token(request.headers.get(WAITING_ROOM_HEADER, ""))
+        if ticket is None or ticket.user_id != request.user.id:
+            return False
+        if not is_request_for_match(request.data, ticket.match_id):
+            return False
+        return get_waiting_room().is_admitted(ticket)
+
+
+def is_request_for_match(data, match_id: int) -> bool:
+    """
+    Check a reservation request is only for the match, from its match, seat,
+    items[].match and items[].seat fields. Ids are parsed as the serializers
+    parse them, a value they may accept is never skipped. Seats are looked up
+    within the match, so only its partition of the seat table is read.
+    :param data: request data
+    :type data: dict
+    :param match_id: the match of the waiting room ticket
+    :type match_id: int
+    :return: every given match and seat is of the match
+    :rtype: bool
+    :raises ValidationError: if a given id can not be parsed
+    """
+    if not hasattr(data, "get"):
+        return True
+    items = [data]
+    if isinstance(data.get("items"), list):
+        items += [item for item in data["items"] if hasattr(item, "get")]
+    if set(_parse_ids([item.get("match") for item in items])) - {match_id}:
+        return False
+    seat_ids = set(_parse_ids([item.get("seat") for item in items]))
+    return not seat_ids or Seat.objects.filter(
+        match_id=match_id,
+        id__in=seat_ids,
+    ).count() == len(seat_ids)
+
+
+def _parse_ids(values: list) -> list[int]:
+    ids = []
+    for value in values:
+        if value is None:
+            continue
+        parsed = parse_id(value)
+        if parsed is None:
+            raise ValidationError(_("A valid integer is required."), code="invalid")
+        ids.append(parsed)
+    return ids
@@ -0,0 +1,18 @@
+from rest_framework.renderers import BaseRenderer
+
+
+class SeatBitmapRenderer(BaseRenderer):
+    """
+    Render the packed seat bitmap as is, one bit per seat number
+    """
+
+    media_type = "application/octet-stream"
+    format = "bin"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if isinstance(data, bytes):
+            return data
+        # errors like 404 are rendered as an empty body with their status code
+        return b""
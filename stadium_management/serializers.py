@@ -35,27 +35,55 @@ class MatchSerializer(serializers.ModelSerializer):
             "guest_team",
             "stadium",
             "datetime",
+            "duration",
             "seat_price",
+            "lazy_seats",
+            "seats_status",
             "does_create_seats",
         ]
+        read_only_fields = ["seats_status"]
 
     def create(self, validated_data: dict) -> Match:
         """
         Create a new match
-        if the does_create_seats is set to True, will create match's seats
+        if the does_create_seats is set to True, match's seats are generated in the
+        background by the generate_seats command, see seats_status
         :param validated_data: validated data dictionary
         :type validated_data: dict
         :return: created match obj
         :rtype: Match
         """
-        does_create_seats = validated_data.pop("does_create_seats", None)
-        obj: Match = super().create(validated_data)
-        if does_create_seats:
-            obj.create_seats()
-        return obj
+        if validated_data.pop("does_create_seats", None):
+            validated_data["seats_status"] = Match.SeatsStatus.PENDING
+        return super().create(validated_data)
 
 
 class SeatSerializer(serializers.ModelSerializer):
     class Meta:
         model = Seat
         fields = ["number", "match", "is_reserved", "price"]
+
+
+class MatchSeatsQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the seats of a match, pages are keyed by seat number
+    """
+
+    MAX_PAGE_SIZE = 5000
+
+    available = serializers.BooleanField(
+        required=False,
+        allow_null=True,
+        default=None,
+        help_text="Only free seats if true, only reserved seats if false",
+    )
+    after = serializers.IntegerField(
+        min_value=0,
+        default=0,
+        help_text="Seats with a greater number",
+    )
+    page_size = serializers.IntegerField(
+        min_value=1,
+        max_value=MAX_PAGE_SIZE,
+        required=False,
+    )
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from collections.abc import Iterable
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.dispatch import receiver
+
+from stadium_management.availability import get_seat_availability
+from stadium_management.catalog import invalidate_match_catalog
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.versions import bump_match_versions_on_commit
+from stadium_management.versions import get_match_versions
+
+# Both signals are sent with match_id and numbers (list of seat numbers)
+# after the transaction that reserved or released the seats is committed.
+seats_reserved = Signal()
+seats_released = Signal()
+
+
+def send_on_commit(signal: Signal, seats: Iterable[Seat]) -> None:
+    """
+    Send the signal for the seats of each match when the transaction is committed
+
+    :param signal: seats_reserved or seats_released
+    :type signal: Signal
+    :param seats: reserved or released seats
+    :type seats: Iterable[Seat]
+    """
+    numbers = defaultdict(list)
+    for seat in seats:
+        numbers[seat.match_id].append(seat.number)
+    for match_id, match_numbers in numbers.items():
+        transaction.on_commit(
+            partial(
+                signal.send,
+                sender=Seat,
+                match_id=match_id,
+                numbers=match_numbers,
+            ),
+        )
+
+
+@receiver(seats_reserved)
+def mark_seats_reserved(sender, match_id: int, numbers: list[int], **kwargs):
+    get_seat_availability().mark_reserved(match_id, numbers)
+
+
+@receiver(seats_released)
+def mark_seats_free(sender, match_id: int, numbers: list[int], **kwargs):
+    get_seat_availability().mark_free(match_id, numbers)
+
+
+# connected after the bitmap receivers, a new version is never served with the
+# bitmap of the previous one
+@receiver(seats_reserved)
+@receiver(seats_released)
+def bump_match_version(sender, match_id: int, **kwargs):
+    get_match_versions().bump([match_id])
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def invalidate_match_catalog_on_commit(sender, **kwargs):
+    transaction.on_commit(invalidate_match_catalog)
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def bump_match_version_on_commit(sender, instance: Match, **kwargs):
+    bump_match_versions_on_commit([instance.id])
+
+
+# post_delete of seats is not used, it would be sent for every seat of a deleted
+# match, seats deleted one by one bump the version in SeatViewSet and SeatAdmin
+@receiver(post_save, sender=Seat)
+def bump_seat_match_version_on_commit(sender, instance: Seat, **kwargs):
+    bump_match_versions_on_commit([instance.match_id])
@@ -0,0 +1,81 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from stadium_management.availability import get_seat_availability
+from stadium_management.models import Match
+
+logger = logging.getLogger(__name__)
+
+
+def _lock_claim(match_id: int, claimed_at) -> bool:
+    """
+    Lock the match if it's still claimed at claimed_at, the claim of a worker may
+    be taken over by another one before it's locked
+    """
+    return (
+        Match.objects.select_for_update()
+        .filter(id=match_id, seats_claimed_at=claimed_at)
+        .exists()
+    )
+
+
+def generate_pending_seats() -> Match | None:
+    """
+    Generate the seats of the oldest match which waits for its seats, it's run by
+    the generate_seats command.
+    The match is claimed by setting its status to generating and its claim time,
+    concurrent workers skip it. Seats are created and the status is set to ready
+    in one transaction which holds the lock of the match, so they are never seen
+    half created and the match is not claimed again while it's generated. A match
+    left generating by a worker which died is claimed again after
+    SEAT_GENERATION_TIMEOUT seconds. The status is set to failed if the
+    generation fails.
+    :return: the match, None if no match waits for its seats
+    :rtype: Match | None
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.SEAT_GENERATION_TIMEOUT)
+    with transaction.atomic():
+        match = (
+            Match.objects.select_for_update(skip_locked=True)
+            .select_related("stadium")
+            .filter(
+                Q(seats_status=Match.SeatsStatus.PENDING)
+                | Q(
+                    seats_status=Match.SeatsStatus.GENERATING,
+                    seats_claimed_at__lt=stale,
+                ),
+            )
+            .order_by("id")
+            .first()
+        )
+        if match is None:
+            return None
+        if match.seats_status == Match.SeatsStatus.GENERATING:
+            logger.warning("Seat generation of match %s is claimed again", match.id)
+        match.seats_status = Match.SeatsStatus.GENERATING
+        match.seats_claimed_at = now
+        match.save(update_fields=["seats_status", "seats_claimed_at"])
+    try:
+        with transaction.atomic():
+            if not _lock_claim(match.id, now):
+                return match
+            match.create_seats()
+            match.seats_status = Match.SeatsStatus.READY
+            match.save(update_fields=["seats_status"])
+            # the bitmap of the match may be built before it had seats
+            transaction.on_commit(
+                lambda: get_seat_availability().discard(match.id),
+            )
+    except Exception:
+        logger.exception("Seat generation of match %s failed", match.id)
+        with transaction.atomic():
+            if _lock_claim(match.id, now):
+                match.seats_status = Match.SeatsStatus.FAILED
+                match.save(update_fields=["seats_status"])
+    return match
@@ -9,6 +9,7 @@ from stadium_management.models import Match
 from stadium_management.models import Seat
 from stadium_management.models import Stadium
 from stadium_management.models import Team
+from stadium_management.tasks import generate_pending_seats
 
 
 class TestStadiumAdmin(AdminTestCase):
@@ -94,6 +95,7 @@ class TestMatchAdmin(AdminTestCase):
                 "stadium": 1,
                 "datetime_0": "2024-01-01",
                 "datetime_1": "20:30",
+                "duration": "02:00:00",
                 "seat_price": 10_000,
                 "does_create_seats": "on",
             },
@@ -105,10 +107,37 @@ class TestMatchAdmin(AdminTestCase):
             stadium=stadium,
         ).first()
         assert match is not None
+        assert match.seats_status == Match.SeatsStatus.PENDING
+        generate_pending_seats()
         seats = Seat.objects.filter(match=match)
         assert seats.count() == stadium.capacity
         assert seats.first().price == match.seat_price
 
+    def test_retry_seat_generation(self):
+        matches = [
+            baker.make(Match, seats_status=seats_status)
+            for seats_status in (
+                Match.SeatsStatus.FAILED,
+                Match.SeatsStatus.GENERATING,
+                Match.SeatsStatus.READY,
+            )
+        ]
+        response = self.client.post(
+            reverse("admin:stadium_management_match_changelist"),
+            data={
+                "action": "retry_seat_generation",
+                "_selected_action": [match.id for match in matches],
+            },
+        )
+        assert response.status_code == HTTPStatus.FOUND
+        for match in matches:
+            match.refresh_from_db()
+        assert [match.seats_status for match in matches] == [
+            Match.SeatsStatus.PENDING,
+            Match.SeatsStatus.PENDING,
+            Match.SeatsStatus.READY,
+        ]
+
     def test_view_match(self):
         match = baker.make(Match)
         url = reverse(
@@ -0,0 +1,148 @@
+import base64
+
+import pytest
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import RequestFactory
+from django.test import TestCase
+from django.test import override_settings
+from model_bakery import baker
+from rest_framework import status
+
+from matchticketselling.users.models import User
+from stadium_management.availability import get_seat_availability
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.models import Stadium
+from stadium_management.signals import seats_reserved
+from stadium_management.urls import async_read_urlpatterns
+from stadium_management.urls import router
+from stadium_management.versions import get_match_versions
+from stadium_management.views import MatchViewSet
+
+# the urls of stadium_management.urls when settings.ASYNC_READ_VIEWS is set
+urlpatterns = [*async_read_urlpatterns(), *router.urls]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadViewsTest(TestCase):
+    def setUp(self):
+        get_seat_availability.cache_clear()
+        get_match_versions.cache_clear()
+        self.stadium = baker.make(Stadium, name="azadi", logo=None)
+        self.match = baker.make(Match, stadium=self.stadium, seat_price=1000)
+        for number in range(1, 4):
+            baker.make(Seat, match=self.match, number=number, price=1000)
+        Seat.objects.filter(number=2).update(is_reserved=True, full_name="name")
+
+    def tearDown(self):
+        get_seat_availability.cache_clear()
+
+    async def test_stadium_list_and_detail(self):
+        response = await self.async_client.get("/stadium/")
+        assert response.status_code == status.HTTP_200_OK
+        assert [stadium["name"] for stadium in response.json()] == ["azadi"]
+        response = await self.async_client.get(f"/stadium/{self.stadium.id}/")
+        assert response.json()["id"] == self.stadium.id
+        response = await self.async_client.get("/stadium/0/")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @override_settings(MATCH_CATALOG_PAGE_SIZE=1)
+    async def test_match_list(self):
+        response = await self.async_client.get("/match/")
+        assert response.status_code == status.HTTP_200_OK
+        assert [match["id"] for match in response.json()["results"]] == [
+            self.match.id,
+        ]
+        assert response.json()["next"] is None
+        response = await self.async_client.get("/match/", {"cursor": "invalid"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    async def test_match_detail(self):
+        response = await self.async_client.get(f"/match/{self.match.id}/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json()["seat_price"] == 1000  # noqa: PLR2004
+
+    async def test_availability(self):
+        url = f"/match/{self.match.id}/availability/"
+        response = await self.async_client.get(url)
+        assert response["Content-Type"] == "application/octet-stream"
+        assert response.content == bytes([0b10100000])
+        response = await self.async_client.get(url, {"format": "json"})
+        assert response.json()["free"] == 2  # noqa: PLR2004
+        assert base64.b64decode(response.json()["bitmap"]) == bytes([0b10100000])
+        response = await self.async_client.get("/match/0/availability/")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    async def test_match_etags(self):
+        for url, params in (
+            (f"/match/{self.match.id}/", {}),
+            (f"/match/{self.match.id}/availability/", {}),
+            (f"/match/{self.match.id}/availability/", {"format": "json"}),
+        ):
+            etag = (await self.async_client.get(url, params))["ETag"]
+            response = await self.async_client.get(
+                url,
+                params,
+                headers={"If-None-Match": etag},
+            )
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response["ETag"] == etag
+            seats_reserved.send(sender=Seat, match_id=self.match.id, numbers=[1])
+            response = await self.async_client.get(
+                url,
+                params,
+                headers={"If-None-Match": etag},
+            )
+            assert response.status_code == status.HTTP_200_OK
+            assert response["ETag"] != etag
+
+    async def test_same_etags_as_the_viewset(self):
+        url = f"/match/{self.match.id}/"
+        response = await self.async_client.get(url)
+        retrieve = sync_to_async(MatchViewSet.as_view({"get": "retrieve"}))
+        viewset_response = await retrieve(RequestFactory().get(url), pk=self.match.id)
+        assert viewset_response["ETag"] == response["ETag"]
+
+    async def test_renderers_of_the_settings(self):
+        msgpack = pytest.importorskip("msgpack")
+        rest_framework = {
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_RENDERER_CLASSES": [
+                "config.renderers.ORJSONRenderer",
+                "rest_framework.renderers.BrowsableAPIRenderer",
+                "config.renderers.MessagePackRenderer",
+            ],
+        }
+        url = f"/match/{self.match.id}/"
+        with override_settings(REST_FRAMEWORK=rest_framework):
+            response = await self.async_client.get(url, headers={"Accept": "text/html"})
+            packed = await self.async_client.get(
+                url,
+                headers={"Accept": "application/msgpack"},
+            )
+            envelope = await self.async_client.get(
+                f"{url}availability/",
+                {"format": "msgpack"},
+            )
+        assert response["Content-Type"] == "application/json"
+        assert packed["Content-Type"] == "application/msgpack"
+        assert msgpack.unpackb(packed.content) == response.json()
+        assert packed["ETag"] != response["ETag"]
+        assert msgpack.unpackb(envelope.content)["free"] == 2  # noqa: PLR2004
+
+    def test_writes_are_delegated_to_the_viewset(self):
+        response = self.client.post(
+            "/stadium/",
+            {"name": "name", "description": "description", "capacity": 10},
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        self.client.force_login(baker.make(User, is_staff=True))
+        response = self.client.post(
+            "/stadium/",
+            {"name": "name", "description": "description", "capacity": 10},
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Stadium.objects.filter(name="name").exists()
+        response = self.client.put(f"/match/{self.match.id}/", {})
+        assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
@@ -0,0 +1,44 @@
+from django.test import TestCase
+from model_bakery import baker
+
+from stadium_management.availability import ensure_seat_availability
+from stadium_management.availability import get_seat_availability
+from stadium_management.availability import pack_seat_numbers
+from stadium_management.availability import unpack_seat_numbers
+from stadium_management.models import Match
+from stadium_management.models import Seat
+
+
+class SeatNumbersPackingTest(TestCase):
+    def test_pack_uses_redis_bit_order(self):
+        assert pack_seat_numbers(10, [1, 8, 10]) == bytearray([0b10000001, 0b01000000])
+
+    def test_unpack(self):
+        bitmap = pack_seat_numbers(20, [3, 9, 20])
+        assert unpack_seat_numbers(bitmap) == [3, 9, 20]
+        assert unpack_seat_numbers(bitmap, count=2) == [3, 9]
+
+
+class SeatAvailabilityTest(TestCase):
+    def setUp(self):
+        get_seat_availability.cache_clear()
+        self.match = baker.make(Match)
+        for number in range(1, 6):
+            baker.make(Seat, match=self.match, number=number)
+        Seat.objects.filter(number=2).update(is_reserved=True, full_name="name")
+
+    def test_build_from_seat_table(self):
+        availability = ensure_seat_availability(self.match.id)
+        assert unpack_seat_numbers(availability.bitmap(self.match.id)) == [1, 3, 4, 5]
+
+    def test_allocate_takes_lowest_free_seats(self):
+        availability = ensure_seat_availability(self.match.id)
+        assert availability.allocate(self.match.id, 2) == [1, 3]
+        assert availability.allocate(self.match.id, 5) == [4, 5]
+        assert availability.allocate(self.match.id, 1) == []
+
+    def test_mark_reserved_and_free(self):
+        availability = ensure_seat_availability(self.match.id)
+        availability.mark_reserved(self.match.id, [1])
+        availability.mark_free(self.match.id, [2])
+        assert unpack_seat_numbers(availability.bitmap(self.match.id)) == [2, 3, 4, 5]
@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from matchticketselling.users.models import User
+from stadium_management.models import Match
+from stadium_management.models import Stadium
+from stadium_management.models import Team
+
+
+class MatchCatalogTest(APITestCase):
+    url = reverse("api:stadium_management:match-list")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create_user(username="user"))
+        self.start = timezone.now() + timedelta(days=1)
+        self.team = baker.make(Team)
+        self.stadiums = baker.make(Stadium, _quantity=2)
+        # two matches of each day, at the same time in different stadiums
+        self.matches = [
+            baker.make(
+                Match,
+                stadium=stadium,
+                datetime=self.start + timedelta(days=day),
+                host_team=self.team if day == 0 else baker.make(Team),
+            )
+            for day in range(3)
+            for stadium in self.stadiums
+        ]
+
+    def tearDown(self):
+        cache.clear()
+
+    def list_ids(self, **params) -> list[int]:
+        response = self.client.get(self.url, params)
+        assert response.status_code == status.HTTP_200_OK
+        return [match["id"] for match in response.data["results"]]
+
+    def test_pages_follow_the_keyset(self):
+        ids = []
+        url = f"{self.url}?page_size=4"
+        while url is not None:
+            response = self.client.get(url)
+            ids += [match["id"] for match in response.data["results"]]
+            url = response.data["next"]
+        assert ids == [match.id for match in self.matches]
+
+    def test_filters(self):
+        stadium = self.stadiums[1]
+        assert self.list_ids(stadium=stadium.id) == [
+            match.id for match in self.matches if match.stadium == stadium
+        ]
+        assert self.list_ids(team=self.team.id) == [
+            match.id for match in self.matches[:2]
+        ]
+        assert self.list_ids(
+            since=self.start + timedelta(days=1),
+            until=self.start + timedelta(days=2),
+        ) == [match.id for match in self.matches[2:4]]
+
+    def test_on_sale(self):
+        Match.objects.filter(id=self.matches[0].id).update(
+            seats_status=Match.SeatsStatus.PENDING,
+        )
+        Match.objects.filter(id=self.matches[1].id).update(
+            datetime=timezone.now() - timedelta(days=1),
+        )
+        assert self.list_ids(on_sale=True) == [match.id for match in self.matches[2:]]
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_pages_are_cached_until_a_match_changes(self):
+        ids = self.list_ids()
+        with CaptureQueriesContext(connection) as queries:
+            assert self.list_ids() == ids
+        assert not [query for query in queries if "SELECT" in query["sql"]]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.matches[0].delete()
+        assert self.list_ids() == ids[1:]
@@ -0,0 +1,52 @@
+from django.test import TestCase
+from model_bakery import baker
+
+from stadium_management.availability import ensure_seat_availability
+from stadium_management.availability import get_seat_availability
+from stadium_management.availability import unpack_seat_numbers
+from stadium_management.inventory import materialize_seats
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.models import Stadium
+
+
+class LazySeatInventoryTest(TestCase):
+    def setUp(self):
+        get_seat_availability.cache_clear()
+        self.match = baker.make(
+            Match,
+            stadium=baker.make(Stadium, capacity=10),
+            seat_price=1000,
+            lazy_seats=True,
+        )
+        self.match.create_seats()
+
+    def tearDown(self):
+        get_seat_availability.cache_clear()
+
+    def test_seats_are_not_created_with_the_match(self):
+        assert not self.match.seat_set.exists()
+
+    def test_seats_are_materialized_within_the_capacity(self):
+        materialize_seats(self.match.id, [3, 1, 3, 11])
+        assert list(
+            self.match.seat_set.order_by("number").values_list(
+                "number",
+                "price",
+                "is_reserved",
+            ),
+        ) == [(1, 1000, False), (3, 1000, False)]
+        Seat.objects.filter(number=3).update(is_reserved=True, full_name="name")
+        materialize_seats(self.match.id, [3])
+        assert Seat.objects.get(number=3).is_reserved
+
+    def test_seats_of_other_matches_are_not_materialized(self):
+        match = baker.make(Match, stadium=baker.make(Stadium, capacity=10))
+        materialize_seats(match.id, [1])
+        assert not match.seat_set.exists()
+
+    def test_availability_is_built_from_the_capacity(self):
+        materialize_seats(self.match.id, [1, 2])
+        Seat.objects.filter(number=2).update(is_reserved=True, full_name="name")
+        bitmap = ensure_seat_availability(self.match.id).bitmap(self.match.id)
+        assert unpack_seat_numbers(bitmap) == [1, *range(3, 11)]
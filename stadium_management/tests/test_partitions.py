@@ -0,0 +1,128 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import ProgrammingError
+from django.db import connection
+from django.db import transaction
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+from model_bakery import baker
+
+from accounting.models import InvoiceItem
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.models import Stadium
+from stadium_management.partitions import create_seat_partition
+from stadium_management.partitions import list_seat_partitions
+from stadium_management.partitions import seat_partition_range
+
+
+def seat_partition_of(match: Match) -> set[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT DISTINCT tableoid::regclass::text FROM stadium_management_seat "
+            "WHERE match_id = %s",
+            [match.id],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+@override_settings(SEAT_PARTITION_SIZE=1)
+class SeatPartitionTest(TestCase):
+    def make_match(self, **kwargs) -> Match:
+        return baker.make(
+            Match,
+            stadium=baker.make(Stadium, capacity=3),
+            datetime=kwargs.pop("datetime", timezone.now()),
+            **kwargs,
+        )
+
+    def test_create_seats_creates_the_partition(self):
+        match = self.make_match(seat_price=1000)
+        match.create_seats()
+        assert seat_partition_of(match) == {f"stadium_management_seat_p{match.id}"}
+        assert list(
+            match.seat_set.order_by("number").values_list(
+                "number",
+                "price",
+                "is_reserved",
+                "full_name",
+            ),
+        ) == [(number, 1000, False, "") for number in range(1, 4)]
+        assert seat_partition_range(match.id) in {
+            (partition.start, partition.end) for partition in list_seat_partitions()
+        }
+
+    def test_seats_are_moved_out_of_the_default_partition(self):
+        match = self.make_match()
+        baker.make(Seat, match=match, number=1, is_reserved=True, full_name="name")
+        baker.make(Seat, match=match, number=2)
+        assert seat_partition_of(match) == {"stadium_management_seat_default"}
+        assert create_seat_partition(match.id) is not None
+        assert create_seat_partition(match.id) is None
+        assert seat_partition_of(match) == {f"stadium_management_seat_p{match.id}"}
+        assert Seat.objects.filter(match=match, is_reserved=True).count() == 1
+
+    def test_reserved_seats_are_protected_in_partitions(self):
+        match = self.make_match()
+        match.create_seats()
+        seat = Seat.objects.get(match=match, number=1)
+        seat.is_reserved = True
+        seat.full_name = "name"
+        seat.save()
+        with pytest.raises(ProgrammingError), transaction.atomic():
+            Seat.objects.filter(id=seat.id).update(full_name="other")
+
+    def test_old_partitions_are_dropped(self):
+        old_match = self.make_match(datetime=timezone.now() - timedelta(days=30))
+        old_match.create_seats()
+        reserved_match = self.make_match(datetime=timezone.now() - timedelta(days=20))
+        reserved_match.create_seats()
+        Seat.objects.filter(match=reserved_match, number=1).update(
+            is_reserved=True,
+            full_name="name",
+        )
+        match = self.make_match()
+        match.create_seats()
+        # a partition with pending foreign key checks can not be dropped
+        with connection.cursor() as cursor:
+            cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        call_command(
+            "seat_partitions",
+            "--ahead=0",
+            f"--detach-before={(timezone.now() - timedelta(days=1)).isoformat()}",
+            "--drop",
+        )
+        starts = {partition.start for partition in list_seat_partitions()}
+        assert old_match.id not in starts
+        assert reserved_match.id in starts
+        assert match.id in starts
+        assert not Seat.objects.filter(match=old_match).exists()
+        assert Seat.objects.filter(match=match).count() == 3  # noqa: PLR2004
+
+    def test_partitions_with_referenced_seats_are_kept(self):
+        old_match = self.make_match(datetime=timezone.now() - timedelta(days=30))
+        old_match.create_seats()
+        # the hold of the item is expired and its seat is released
+        baker.make(
+            InvoiceItem,
+            seat=Seat.objects.get(match=old_match, number=1),
+            expired=True,
+            hold_expires_at=None,
+        )
+        self.make_match()
+        stdout = StringIO()
+        call_command(
+            "seat_partitions",
+            "--ahead=0",
+            f"--detach-before={(timezone.now() - timedelta(days=1)).isoformat()}",
+            "--drop",
+            stdout=stdout,
+        )
+        assert "referenced by accounting.InvoiceItem" in stdout.getvalue()
+        starts = {partition.start for partition in list_seat_partitions()}
+        assert old_match.id in starts
+        assert Seat.objects.filter(match=old_match).count() == 3  # noqa: PLR2004
@@ -0,0 +1,71 @@
+import io
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.test import TestCase
+from django.utils.translation import gettext_lazy as _
+from model_bakery import baker
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from config.renderers import MessagePackParser
+from config.renderers import MessagePackRenderer
+from config.renderers import ORJSONParser
+from config.renderers import ORJSONRenderer
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.serializers import MatchSerializer
+from stadium_management.serializers import SeatSerializer
+
+
+class ORJSONRendererTest(TestCase):
+    def setUp(self):
+        match = baker.make(Match, seat_price=1000)
+        self.data = {
+            "match": MatchSerializer(match).data,
+            "seats": SeatSerializer(
+                baker.make(Seat, match=match, _quantity=3),
+                many=True,
+            ).data,
+            "datetime": datetime(2024, 1, 1, 20, 30, 0, 500, tzinfo=UTC),
+            "price": Decimal("10.50"),
+            "duration": timedelta(minutes=90),
+            "name": _("match"),
+            "unicode": "آزادی",
+            "separators": "line\u2028paragraph\u2029",
+            1: None,
+        }
+
+    def test_same_json_as_rest_framework(self):
+        assert ORJSONRenderer().render(self.data) == JSONRenderer().render(self.data)
+
+    def test_indent(self):
+        rendered = ORJSONRenderer().render(
+            [1],
+            "application/json; indent=4",
+            {},
+        )
+        assert rendered == b"[\n  1\n]"
+
+    def test_parser(self):
+        rendered = JSONRenderer().render(self.data)
+        assert ORJSONParser().parse(io.BytesIO(rendered)) == JSONParser().parse(
+            io.BytesIO(rendered),
+        )
+        with pytest.raises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b"{"))
+
+    def test_message_pack(self):
+        pytest.importorskip("msgpack")
+        # the parser only accepts string keys, as json does
+        del self.data[1]
+        rendered = MessagePackRenderer().render(self.data)
+        parsed = MessagePackParser().parse(io.BytesIO(rendered))
+        assert parsed["datetime"] == "2024-01-01T20:30:00.000500Z"
+        assert parsed["seats"] == self.data["seats"]
+        with pytest.raises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b"\xc1"))
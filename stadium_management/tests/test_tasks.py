@@ -0,0 +1,74 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+from django.utils import timezone
+from model_bakery import baker
+
+from stadium_management.availability import ensure_seat_availability
+from stadium_management.availability import get_seat_availability
+from stadium_management.inventory import materialize_seats
+from stadium_management.models import Match
+from stadium_management.models import Stadium
+from stadium_management.tasks import generate_pending_seats
+
+
+class GeneratePendingSeatsTest(TestCase):
+    def setUp(self):
+        get_seat_availability.cache_clear()
+        self.match = baker.make(
+            Match,
+            stadium=baker.make(Stadium, capacity=3),
+            seats_status=Match.SeatsStatus.PENDING,
+        )
+
+    def tearDown(self):
+        get_seat_availability.cache_clear()
+
+    def test_seats_are_generated(self):
+        assert ensure_seat_availability(self.match.id).allocate(self.match.id, 1) == []
+        with self.captureOnCommitCallbacks(execute=True):
+            assert generate_pending_seats() == self.match
+        self.match.refresh_from_db()
+        assert self.match.seats_status == Match.SeatsStatus.READY
+        assert self.match.seat_set.count() == 3  # noqa: PLR2004
+        availability = ensure_seat_availability(self.match.id)
+        assert availability.allocate(self.match.id, 1) == [1]
+        assert generate_pending_seats() is None
+
+    def test_failed_generation(self):
+        with mock.patch.object(Match, "create_seats", side_effect=RuntimeError):
+            generate_pending_seats()
+        self.match.refresh_from_db()
+        assert self.match.seats_status == Match.SeatsStatus.FAILED
+        assert not self.match.seat_set.exists()
+        assert generate_pending_seats() is None
+
+    def test_stale_generating_match_is_claimed_again(self):
+        claimed_at = timezone.now() - timedelta(
+            seconds=settings.SEAT_GENERATION_TIMEOUT + 1,
+        )
+        Match.objects.update(
+            seats_status=Match.SeatsStatus.GENERATING,
+            seats_claimed_at=claimed_at,
+        )
+        assert generate_pending_seats() == self.match
+        self.match.refresh_from_db()
+        assert self.match.seats_status == Match.SeatsStatus.READY
+        assert self.match.seat_set.count() == 3  # noqa: PLR2004
+
+    def test_recent_generating_match_is_not_claimed(self):
+        Match.objects.update(
+            seats_status=Match.SeatsStatus.GENERATING,
+            seats_claimed_at=timezone.now(),
+        )
+        assert generate_pending_seats() is None
+
+    def test_lazy_seats_are_not_sold_before_ready(self):
+        Match.objects.update(lazy_seats=True)
+        materialize_seats(self.match.id, [1])
+        assert not self.match.seat_set.exists()
+        generate_pending_seats()
+        materialize_seats(self.match.id, [1])
+        assert self.match.seat_set.count() == 1
@@ -0,0 +1,98 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from model_bakery import baker
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from stadium_management.availability import get_seat_availability
+from stadium_management.models import Match
+from stadium_management.models import Seat
+from stadium_management.signals import seats_reserved
+from stadium_management.versions import LocalMatchVersions
+from stadium_management.versions import get_match_versions
+
+
+class LocalMatchVersionsTest(APITestCase):
+    def test_bump(self):
+        versions = LocalMatchVersions()
+        version = versions.current(1)
+        versions.bump([1])
+        assert versions.current(1) == version + 1
+
+    def test_missing_version_is_not_reused(self):
+        version = LocalMatchVersions().current(1)
+        assert LocalMatchVersions().current(1) > version
+
+
+class MatchETagTest(APITestCase):
+    def setUp(self):
+        get_match_versions.cache_clear()
+        get_seat_availability.cache_clear()
+        self.match = baker.make(Match)
+        for number in range(1, 4):
+            baker.make(Seat, match=self.match, number=number)
+        self.urls = [
+            reverse(
+                f"api:stadium_management:match-{name}",
+                kwargs={"pk": self.match.id},
+            )
+            for name in ("detail", "seats", "availability")
+        ]
+
+    def get(self, url, etag=None, **params):
+        headers = {"If-None-Match": etag} if etag else {}
+        return self.client.get(url, params, headers=headers)
+
+    def test_not_modified_without_queries(self):
+        for url in self.urls:
+            etag = self.get(url)["ETag"]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.get(url, etag)
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED
+            assert response["ETag"] == etag
+            assert not response.content
+            assert not [query for query in queries if "SELECT" in query["sql"]]
+
+    def test_weak_comparison(self):
+        etag = self.get(self.urls[0])["ETag"]
+        response = self.get(self.urls[0], f'"other", W/{etag}')
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_representations_have_different_etags(self):
+        url = self.urls[2]
+        assert self.get(url)["ETag"] != self.get(url, format="json")["ETag"]
+        assert self.get(self.urls[1])["ETag"] != self.get(self.urls[1], after=1)["ETag"]
+
+    def test_reserved_seats_change_the_etag(self):
+        etags = [self.get(url)["ETag"] for url in self.urls]
+        seats_reserved.send(sender=Seat, match_id=self.match.id, numbers=[1])
+        for url, etag in zip(self.urls, etags, strict=True):
+            response = self.get(url, etag)
+            assert response.status_code == status.HTTP_200_OK
+            assert response["ETag"] != etag
+        assert self.get(self.urls[2]).content == bytes([0b01100000])
+
+    def test_saved_match_and_seat_change_the_etag(self):
+        etag = self.get(self.urls[0])["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.match.save()
+        assert self.get(self.urls[0], etag).status_code == status.HTTP_200_OK
+        etag = self.get(self.urls[1])["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Seat.objects.get(match=self.match, number=1).save()
+        assert self.get(self.urls[1], etag).status_code == status.HTTP_200_OK
+
+    def test_other_match_keeps_its_etag(self):
+        etag = self.get(self.urls[0])["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            baker.make(Match)
+        assert self.get(self.urls[0], etag).status_code == (
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+    def test_not_found(self):
+        url = reverse("api:stadium_management:match-detail", kwargs={"pk": 0})
+        response = self.client.get(url)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert "ETag" not in response
@@ -1,5 +1,10 @@
+import base64
 from datetime import datetime
+from datetime import timedelta
 
+import pytest
+from django.db import IntegrityError
+from django.db import transaction
 from django.urls import reverse
 from django.utils import timezone
 from model_bakery import baker
@@ -7,10 +12,13 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 
 from config.utils import BaseTestCase
+from stadium_management.availability import get_seat_availability
 from stadium_management.models import Match
 from stadium_management.models import Seat
 from stadium_management.models import Stadium
 from stadium_management.models import Team
+from stadium_management.signals import seats_released
+from stadium_management.tasks import generate_pending_seats
 
 
 class StadiumViewSetTest(BaseTestCase, APITestCase):
@@ -139,8 +147,34 @@ class MatchViewSetTest(BaseTestCase, APITestCase):
         for case in test_table:
             self.test_create_view(status_code=status.HTTP_400_BAD_REQUEST, data=case)
 
+    def test_match_duration(self):
+        data = self.get_create_data()
+        data["datetime"] = self.datetime - timedelta(minutes=30)
+        data["duration"] = "00:30:00"
+        response = self.client.post(self.get_list_url(), data)
+        assert response.status_code == status.HTTP_201_CREATED
+        data["datetime"] = self.datetime + self.match.duration
+        response = self.client.post(self.get_list_url(), data)
+        assert response.status_code == status.HTTP_201_CREATED
+        data["datetime"] -= timedelta(minutes=1)
+        response = self.client.post(self.get_list_url(), data)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_bulk_created_matches_do_not_overlap(self):
+        match = Match(
+            stadium=self.stadium,
+            host_team=self.host_team,
+            guest_team=self.guest_team,
+            datetime=self.datetime + timedelta(hours=1),
+        )
+        with pytest.raises(IntegrityError), transaction.atomic():
+            Match.objects.bulk_create([match])
+
     def test_seats_created(self):
         self.test_create_view()
+        match = Match.objects.get(seats_status=Match.SeatsStatus.PENDING)
+        assert not Seat.objects.exists()
+        assert generate_pending_seats() == match
         assert Seat.objects.count() == self.stadium.capacity
 
     def test_deos_not_create_seats(self):
@@ -184,3 +218,89 @@ class SeatViewSetTest(BaseTestCase, APITestCase):
             {"price": 10_000},
         )
         assert response.status_code == status.HTTP_403_FORBIDDEN
+
+
+class MatchSeatsTest(APITestCase):
+    def setUp(self):
+        self.match = baker.make(Match)
+        for number in range(1, 6):
+            baker.make(Seat, match=self.match, number=number, price=1000)
+        baker.make(Seat, number=1)
+        Seat.objects.filter(match=self.match, number__in=[2, 4]).update(
+            is_reserved=True,
+            full_name="a",
+        )
+        self.url = reverse(
+            "api:stadium_management:match-seats",
+            kwargs={"pk": self.match.id},
+        )
+
+    def numbers(self, url, **params) -> tuple[list[int], str | None]:
+        response = self.client.get(url, params)
+        assert response.status_code == status.HTTP_200_OK
+        numbers = [seat["number"] for seat in response.data["results"]]
+        return numbers, response.data["next"]
+
+    def test_pages_follow_the_seat_numbers(self):
+        response = self.client.get(self.url, {"page_size": 2})
+        assert response.data["results"][0] == {
+            "id": Seat.objects.get(match=self.match, number=1).id,
+            "number": 1,
+            "match": self.match.id,
+            "is_reserved": False,
+            "price": 1000,
+        }
+        numbers, url = self.numbers(self.url, page_size=2)
+        assert numbers == [1, 2]
+        assert self.numbers(url) == ([3, 4], url.replace("after=2", "after=4"))
+        assert self.numbers(self.url, after=4) == ([5], None)
+
+    def test_available_filter(self):
+        assert self.numbers(self.url, available=True) == ([1, 3, 5], None)
+        assert self.numbers(self.url, available=False) == ([2, 4], None)
+
+    def test_match_not_found(self):
+        url = reverse("api:stadium_management:match-seats", kwargs={"pk": 0})
+        assert self.client.get(url).status_code == status.HTTP_404_NOT_FOUND
+
+
+class MatchAvailabilityTest(APITestCase):
+    def setUp(self):
+        get_seat_availability.cache_clear()
+        self.match = baker.make(Match)
+        for number in range(1, 11):
+            baker.make(Seat, match=self.match, number=number)
+        Seat.objects.filter(number__in=[1, 10]).update(is_reserved=True, full_name="a")
+        self.url = reverse(
+            "api:stadium_management:match-availability",
+            kwargs={"pk": self.match.id},
+        )
+
+    def test_packed_bitmap(self):
+        response = self.client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/octet-stream"
+        assert response.content == bytes([0b01111111, 0b10000000])
+
+    def test_base64_envelope(self):
+        response = self.client.get(self.url, {"format": "json"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            "match": self.match.id,
+            "seats": 16,
+            "free": 8,
+            "encoding": "base64",
+            "bitmap": base64.b64encode(bytes([0b01111111, 0b10000000])).decode(),
+        }
+
+    def test_bitmap_is_updated_on_release(self):
+        self.client.get(self.url)
+        seats_released.send(sender=Seat, match_id=self.match.id, numbers=[1])
+        response = self.client.get(self.url)
+        assert response.content == bytes([0b11111111, 0b10000000])
+
+    def test_not_found(self):
+        response = self.client.get(
+            reverse("api:stadium_management:match-availability", kwargs={"pk": 0}),
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,104 @@
+from django.test import TestCase
+from django.test import override_settings
+from django.urls import reverse
+from model_bakery import baker
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from matchticketselling.users.models import User
+from stadium_management.models import Match
+from stadium_management.waiting_room import WAITING_ROOM_HEADER
+from stadium_management.waiting_room import LocalWaitingRoom
+from stadium_management.waiting_room import WaitingRoomTicket
+from stadium_management.waiting_room import get_waiting_room
+from stadium_management.waiting_room import make_waiting_room_token
+from stadium_management.waiting_room import read_waiting_room_token
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class LocalWaitingRoomTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.room = LocalWaitingRoom(rate=2, clock=self.clock)
+
+    def test_join_is_idempotent(self):
+        assert self.room.join(1, 10).number == 1
+        assert self.room.join(1, 11).number == 2  # noqa: PLR2004
+        assert self.room.join(1, 10).number == 1
+        assert self.room.join(2, 11).number == 1
+
+    def test_head_moves_by_rate_up_to_tail(self):
+        tickets = [self.room.join(1, user_id) for user_id in range(5)]
+        assert not self.room.is_admitted(tickets[0])
+        self.clock.now = 1
+        assert self.room.is_admitted(tickets[1])
+        assert not self.room.is_admitted(tickets[2])
+        self.clock.now = 10
+        assert self.room.head(1) == len(tickets)
+        late_ticket = self.room.join(1, 5)
+        assert not self.room.is_admitted(late_ticket)
+        self.clock.now = 10.5
+        assert self.room.is_admitted(late_ticket)
+
+    def test_burst_after_idle_queue_is_admitted_at_rate(self):
+        self.room.join(1, 0)
+        self.clock.now = 100
+        tickets = [self.room.join(1, user_id) for user_id in range(1, 7)]
+        assert self.room.head(1) == 1
+        self.clock.now = 101
+        assert self.room.head(1) == 3  # noqa: PLR2004
+        assert self.room.is_admitted(tickets[1])
+        assert not self.room.is_admitted(tickets[2])
+
+    def test_token(self):
+        ticket = WaitingRoomTicket(1, 2, 3)
+        token = make_waiting_room_token(ticket)
+        assert read_waiting_room_token(token) == ticket
+        assert read_waiting_room_token(token[:-1]) is None
+        assert read_waiting_room_token("") is None
+
+
+@override_settings(WAITING_ROOM_ADMISSION_RATE=0.001)
+class MatchWaitingRoomTest(APITestCase):
+    def setUp(self):
+        get_waiting_room.cache_clear()
+        self.user = User.objects.create_user(username="username")
+        self.client.force_authenticate(user=self.user)
+        self.match = baker.make(Match)
+        self.url = reverse(
+            "api:stadium_management:match-waiting-room",
+            kwargs={"pk": self.match.id},
+        )
+
+    def tearDown(self):
+        get_waiting_room.cache_clear()
+
+    def test_join_and_poll_position(self):
+        get_waiting_room().join(self.match.id, 0)
+        response = self.client.post(self.url)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["ticket"] == 2  # noqa: PLR2004
+        assert response.data["position"] == 2  # noqa: PLR2004
+        assert not response.data["admitted"]
+        response = self.client.get(
+            self.url,
+            headers={WAITING_ROOM_HEADER: response.data["token"]},
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["ticket"] == 2  # noqa: PLR2004
+
+    def test_token_of_another_match_is_rejected(self):
+        token = make_waiting_room_token(WaitingRoomTicket(0, self.user.id, 1))
+        response = self.client.get(self.url, headers={WAITING_ROOM_HEADER: token})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_join_missing_match(self):
+        url = reverse("api:stadium_management:match-waiting-room", kwargs={"pk": 0})
+        assert self.client.post(url).status_code == status.HTTP_404_NOT_FOUND
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 from rest_framework.routers import SimpleRouter
 
@@ -17,3 +18,26 @@ router.register("seat", SeatViewSet)
 urlpatterns = [
     *router.urls,
 ]
+
+
+def async_read_urlpatterns() -> list:
+    """
+    Return the urls of the async read views, they are served before the viewsets
+    and writes are delegated to them
+    """
+    from stadium_management import async_views
+
+    return [
+        path("stadium/", async_views.StadiumListView.as_view()),
+        path("stadium/<int:pk>/", async_views.StadiumDetailView.as_view()),
+        path("match/", async_views.MatchListView.as_view()),
+        path("match/<int:pk>/", async_views.MatchDetailView.as_view()),
+        path(
+            "match/<int:pk>/availability/",
+            async_views.MatchAvailabilityView.as_view(),
+        ),
+    ]
+
+
+if settings.ASYNC_READ_VIEWS:
+    urlpatterns = [*async_read_urlpatterns(), *urlpatterns]
@@ -0,0 +1,178 @@
+"""
+Version counters of matches
+
+Every match has a version number which is changed when the match is saved or
+deleted and when its seats are reserved, released or edited (see
+stadium_management.signals). The match detail, its seats and its availability are
+served with a strong ETag made from the version, by the viewset and by the async
+read views, so polling clients which send it back in If-None-Match get a 304
+response without reading the Seat table.
+A missing version starts at the current time in nanoseconds rather than zero, so
+a version lost by redis or by a restart of the process is never reused for a
+different state of the match.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+import typing
+from functools import cache
+from functools import partial
+
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from config.utils import redis_connection
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from django.http import HttpRequest
+    from rest_framework.request import Request
+
+VERSION_TTL = 24 * 60 * 60
+
+
+class LocalMatchVersions:
+    """
+    In-process stand-in of the redis counters, used in local development and tests
+    where the default cache is not redis.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+
+    def current(self, match_id: int) -> int:
+        with self._lock:
+            return self._versions.setdefault(match_id, time.time_ns())
+
+    def bump(self, match_ids: Iterable[int]) -> None:
+        with self._lock:
+            for match_id in match_ids:
+                self._versions[match_id] = (
+                    self._versions.get(match_id, time.time_ns()) + 1
+                )
+
+
+class RedisMatchVersions:
+    """
+    Version counters stored in redis, match-version:<match id>, they expire after
+    VERSION_TTL seconds without a change
+    """
+
+    CURRENT_SCRIPT = """
+    redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2])
+    return redis.call('GET', KEYS[1])
+    """
+    BUMP_SCRIPT = """
+    for index = 1, #KEYS do
+        redis.call('SET', KEYS[index], ARGV[1], 'NX')
+        redis.call('INCR', KEYS[index])
+        redis.call('EXPIRE', KEYS[index], ARGV[2])
+    end
+    return #KEYS
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._current = client.register_script(self.CURRENT_SCRIPT)
+        self._bump = client.register_script(self.BUMP_SCRIPT)
+
+    @staticmethod
+    def _key(match_id: int) -> str:
+        return f"match-version:{match_id}"
+
+    def current(self, match_id: int) -> int:
+        return int(
+            self._current(
+                keys=[self._key(match_id)],
+                args=[time.time_ns(), VERSION_TTL],
+            ),
+        )
+
+    def bump(self, match_ids: Iterable[int]) -> None:
+        keys = [self._key(match_id) for match_id in match_ids]
+        if keys:
+            self._bump(keys=keys, args=[time.time_ns(), VERSION_TTL])
+
+
+@cache
+def get_match_versions() -> LocalMatchVersions | RedisMatchVersions:
+    """
+    Return the match versions of this process,
+    redis when the default cache is redis otherwise the local stand-in
+    """
+    client = redis_connection()
+    if client is None:
+        return LocalMatchVersions()
+    return RedisMatchVersions(client)
+
+
+def bump_match_versions_on_commit(match_ids: Iterable[int]) -> None:
+    """
+    Bump the versions of the matches when the transaction is committed
+
+    :param match_ids: the match ids
+    :type match_ids: Iterable[int]
+    """
+    transaction.on_commit(partial(get_match_versions().bump, list(match_ids)))
+
+
+def match_etag(request: HttpRequest, match_id: int, media_type: str) -> str:
+    """
+    Return the strong ETag of the response of the request for the current version
+    of the match, responses of other urls and media types have other ETags
+
+    :param request: Http request object
+    :type request: HttpRequest
+    :param match_id: the match id
+    :type match_id: int
+    :param media_type: the media type of the response
+    :type media_type: str
+    :return: the quoted ETag
+    :rtype: str
+    """
+    version = get_match_versions().current(match_id)
+    digest = hashlib.sha256(
+        f"{request.get_full_path()} {media_type}".encode(),
+    ).hexdigest()[:16]
+    return f'"{match_id}-{version}-{digest}"'
+
+
+def etag_matches(request: HttpRequest, etag: str) -> bool:
+    """
+    Return True if If-None-Match of the request contains the ETag
+
+    :param request: Http request object
+    :type request: HttpRequest
+    :param etag: the quoted ETag of the response
+    :type etag: str
+    :return: True if the client has the current response
+    :rtype: bool
+    """
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return etag in (tag.removeprefix("W/") for tag in etags)
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    """
+    Return a 304 response if If-None-Match of the request contains the ETag
+
+    :param request: rest_framework Http request object
+    :type request: Request
+    :param etag: the quoted ETag of the response
+    :type etag: str
+    :return: the 304 response or None
+    :rtype: Response | None
+    """
+    if etag_matches(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
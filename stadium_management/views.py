@@ -1,3 +1,5 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import OpenApiExample
 from drf_spectacular.utils import OpenApiParameter
 from drf_spectacular.utils import OpenApiTypes
@@ -5,17 +7,40 @@ from drf_spectacular.utils import extend_schema
 from rest_framework import mixins
 from rest_framework import status
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from stadium_management.availability import availability_envelope
+from stadium_management.availability import get_seat_availability
+from stadium_management.availability import rebuild_seat_availability
+from stadium_management.catalog import MatchCatalogQuerySerializer
+from stadium_management.catalog import match_catalog_response
+from stadium_management.inventory import lazy_seats
 from stadium_management.models import Match
 from stadium_management.models import Seat
 from stadium_management.models import Stadium
 from stadium_management.permissions import IsAdminAndNotReservedOrReadOnly
 from stadium_management.permissions import IsAdminUserOrReadOnly
+from stadium_management.renderers import SeatBitmapRenderer
+from stadium_management.serializers import MatchSeatsQuerySerializer
 from stadium_management.serializers import MatchSerializer
 from stadium_management.serializers import SeatSerializer
 from stadium_management.serializers import StadiumSerializer
+from stadium_management.versions import bump_match_versions_on_commit
+from stadium_management.versions import match_etag
+from stadium_management.versions import not_modified
+from stadium_management.waiting_room import WAITING_ROOM_HEADER
+from stadium_management.waiting_room import WaitingRoomTicket
+from stadium_management.waiting_room import get_waiting_room
+from stadium_management.waiting_room import make_waiting_room_token
+from stadium_management.waiting_room import read_waiting_room_token
 
 
 class StadiumViewSet(viewsets.ModelViewSet):
@@ -74,6 +99,22 @@ class StadiumViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
+def _lazy_seat_rows(
+    rows: list[tuple],
+    numbers: range,
+    seat_price: int,
+) -> list[tuple]:
+    """
+    Return the rows of the seat numbers of a lazy match, the numbers which have
+    no Seat row are free seats without an id
+    """
+    materialized = {row[1]: row for row in rows}
+    return [
+        materialized.get(number, (None, number, False, seat_price))
+        for number in numbers
+    ]
+
+
 class MatchViewSet(
     mixins.RetrieveModelMixin,
     mixins.ListModelMixin,
@@ -84,6 +125,7 @@ class MatchViewSet(
     queryset = Match.objects.all()
     serializer_class = MatchSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    lookup_value_regex = r"\d+"
 
     @extend_schema(
         parameters=[
@@ -132,8 +174,263 @@ class MatchViewSet(
         """
         return super().create(request, *args, **kwargs)
 
+    @extend_schema(
+        parameters=[MatchCatalogQuerySerializer],
+        description="Matches ordered by datetime, a page of page_size matches "
+        "starts after the cursor, next is the url of the next page",
+        responses={200: MatchSerializer(many=True)},
+    )
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """
+        List a page of the match catalog, see stadium_management.catalog
+        """
+        query = MatchCatalogQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        return Response(match_catalog_response(request, query.validated_data))
+
+    @extend_schema(
+        description="Match details, the response has an ETag which changes with "
+        "the version of the match, it's 304 when If-None-Match contains it",
+        responses={200: MatchSerializer(), 304: None},
+    )
+    def retrieve(self, request: Request, *args, **kwargs) -> Response:
+        """
+        Return the match, or 304 if the client has its current version
+
+        :param request: rest_framework Http request object
+        :type request: Request
+        :return: http response object
+        :rtype: Response
+        """
+        etag = match_etag(request, int(kwargs["pk"]), request.accepted_media_type)
+        if (response := not_modified(request, etag)) is not None:
+            return response
+        response = super().retrieve(request, *args, **kwargs)
+        response["ETag"] = etag
+        return response
+
+    @extend_schema(
+        parameters=[MatchSeatsQuerySerializer],
+        description="Seats of the match ordered by number, a page of page_size "
+        "seats starts after the seat number after, next is the url of the next page",
+        responses={200: SeatSerializer(many=True)},
+    )
+    @action(detail=True, methods=["get"])
+    def seats(self, request: Request, pk: str) -> Response:
+        """
+        Return a page of the seats of the match
+        Free seats are read from the match_free_seats index, rows are read as
+        tuples and rendered without model instances. The seats of a lazy match
+        are listed by windows of page_size numbers without writing, seats which
+        have no row yet are free and have no id.
+
+        :param request: rest_framework Http request object
+        :type request: Request
+        :param pk: the match id
+        :type pk: str
+        :return: http response object
+        :rtype: Response
+        """
+        query = MatchSeatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        match_id = int(pk)
+        etag = match_etag(request, match_id, request.accepted_media_type)
+        if (response := not_modified(request, etag)) is not None:
+            return response
+        page_size = query.validated_data.get(
+            "page_size",
+            settings.SEAT_LIST_PAGE_SIZE,
+        )
+        after = query.validated_data["after"]
+        available = query.validated_data["available"]
+        lazy = lazy_seats(match_id)
+        if lazy is None:
+            get_object_or_404(Match.objects.only("id"), pk=match_id)
+        seats = Seat.objects.filter(match_id=match_id, number__gt=after)
+        if lazy is not None:
+            seats = seats.filter(number__lte=after + page_size)
+        elif available is not None:
+            seats = seats.filter(is_reserved=not available)
+        rows = list(
+            seats.order_by("number").values_list(
+                "id",
+                "number",
+                "is_reserved",
+                "price",
+            )[: page_size + 1],
+        )
+        next_after = None
+        if lazy is not None:
+            # listed by windows of page_size numbers, without writing
+            window = range(after + 1, min(after + page_size, lazy.capacity) + 1)
+            rows = _lazy_seat_rows(rows, window, lazy.seat_price)
+            if available is not None:
+                rows = [row for row in rows if row[2] is not available]
+            if after + page_size < lazy.capacity:
+                next_after = after + page_size
+        elif len(rows) > page_size:
+            rows = rows[:page_size]
+            next_after = rows[-1][1]
+        next_url = None
+        if next_after is not None:
+            next_url = replace_query_param(
+                request.build_absolute_uri(),
+                "after",
+                next_after,
+            )
+        return Response(
+            {
+                "next": next_url,
+                "results": [
+                    {
+                        "id": seat_id,
+                        "number": number,
+                        "match": match_id,
+                        "is_reserved": is_reserved,
+                        "price": price,
+                    }
+                    for seat_id, number, is_reserved, price in rows
+                ],
+            },
+            headers={"ETag": etag},
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name="format",
+                description="bin for the packed bitmap (default), "
+                "json for a base64 envelope",
+                required=False,
+                type=str,
+                enum=["bin", "json"],
+            ),
+        ],
+        description="Seat availability of the match as a packed bitmap, "
+        "bit n - 1 (from the most significant bit of the first byte) is set "
+        "when seat number n is free",
+        responses={(200, "application/octet-stream"): OpenApiTypes.BINARY},
+    )
+    @action(
+        detail=True,
+        methods=["get"],
+        renderer_classes=[SeatBitmapRenderer, JSONRenderer],
+    )
+    def availability(self, request: Request, pk: str) -> Response:
+        """
+        Return the free seat bitmap of the match
+        The bitmap is served from the per match bitmap which is updated on every
+        reserve and release, so the Seat table is only read to build it.
+
+        :param request: rest_framework Http request object
+        :type request: Request
+        :param pk: the match id
+        :type pk: str
+        :return: http response object
+        :rtype: Response
+        """
+        match_id = int(pk)
+        etag = match_etag(request, match_id, request.accepted_media_type)
+        if (response := not_modified(request, etag)) is not None:
+            return response
+        availability = get_seat_availability()
+        bitmap = availability.bitmap(match_id)
+        if bitmap is None:
+            get_object_or_404(Match.objects.only("id"), pk=match_id)
+            rebuild_seat_availability(match_id)
+            bitmap = availability.bitmap(match_id) or b""
+        if request.accepted_renderer.format == SeatBitmapRenderer.format:
+            return Response(bitmap, headers={"ETag": etag})
+        return Response(
+            availability_envelope(match_id, bitmap),
+            headers={"ETag": etag},
+        )
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                name=WAITING_ROOM_HEADER,
+                description="Token of the waiting room, required to get the position",
+                required=False,
+                type=str,
+                location=OpenApiParameter.HEADER,
+            ),
+        ],
+        description="Join the waiting room of the match (POST) or get the position "
+        "in it (GET). Reservation requests of the match must send the token in the "
+        f"{WAITING_ROOM_HEADER} header once it's admitted.",
+        request=None,
+        responses={200: OpenApiTypes.OBJECT, 201: OpenApiTypes.OBJECT},
+    )
+    @action(
+        detail=True,
+        methods=["get", "post"],
+        url_path="waiting-room",
+        permission_classes=[IsAuthenticated],
+    )
+    def waiting_room(self, request: Request, pk: str) -> Response:
+        """
+        Join the waiting room of the match or get the position in it
+        Getting the position does not touch the database, so buyers can poll it.
+
+        :param request: rest_framework Http request object
+        :type request: Request
+        :param pk: the match id
+        :type pk: str
+        :return: http response object
+        :rtype: Response
+        """
+        match_id = int(pk)
+        room = get_waiting_room()
+        if request.method == "POST":
+            get_object_or_404(Match.objects.only("id"), pk=match_id)
+            ticket = room.join(match_id, request.user.id)
+            response_status = status.HTTP_201_CREATED
+        else:
+            ticket = read_waiting_room_token(
+                request.headers.get(WAITING_ROOM_HEADER, ""),
+            )
+            if (
+                ticket is None
+                or ticket.match_id != match_id
+                or ticket.user_id != request.user.id
+            ):
+                raise ValidationError(
+                    code=_("invalid_waiting_room_token"),
+                    detail=_("The waiting room token is invalid or expired."),
+                )
+            response_status = status.HTTP_200_OK
+        return Response(self._waiting_room_state(ticket), status=response_status)
+
+    @staticmethod
+    def _waiting_room_state(ticket: WaitingRoomTicket) -> dict:
+        rate = settings.WAITING_ROOM_ADMISSION_RATE
+        position = max(ticket.number - get_waiting_room().head(ticket.match_id), 0)
+        if not rate:
+            position = 0
+        return {
+            "match": ticket.match_id,
+            "ticket": ticket.number,
+            "position": position,
+            "admitted": position == 0,
+            "wait": round(position / rate, 1) if rate else 0,
+            "token": make_waiting_room_token(ticket),
+        }
+
+
+class SeatCursorPagination(CursorPagination):
+    ordering = "id"
+    page_size = settings.SEAT_LIST_PAGE_SIZE
+
 
 class SeatViewSet(viewsets.ModelViewSet):
     queryset = Seat.objects.all()
     serializer_class = SeatSerializer
     permission_classes = [IsAdminAndNotReservedOrReadOnly]
+    # seats of one match are listed by MatchViewSet.seats
+    pagination_class = SeatCursorPagination
+
+    def perform_destroy(self, instance: Seat) -> None:
+        # seats have no post_delete receiver, see stadium_management.signals
+        bump_match_versions_on_commit([instance.match_id])
+        super().perform_destroy(instance)
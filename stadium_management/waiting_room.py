@@ -0,0 +1,205 @@
+"""
+Waiting room of matches
+
+When the sale of a match opens, buyers join the waiting room of the match and get
+a ticket number and a signed token. The head of the queue moves forward by
+settings.WAITING_ROOM_ADMISSION_RATE tickets per second and only the buyers whose
+ticket is behind the head are admitted to the reservation endpoints, so the
+database gets a steady load instead of every buyer at once.
+The room is disabled when the admission rate is zero.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import typing
+from functools import cache
+
+from django.conf import settings
+from django.core import signing
+
+from config.utils import redis_connection
+
+if typing.TYPE_CHECKING:
+    from collections.abc import Callable
+
+WAITING_ROOM_HEADER = "X-Waiting-Room-Token"
+SIGNING_SALT = "stadium_management.waiting_room"
+
+
+class WaitingRoomTicket(typing.NamedTuple):
+    match_id: int
+    user_id: int
+    number: int
+
+
+def make_waiting_room_token(ticket: WaitingRoomTicket) -> str:
+    return signing.dumps(list(ticket), salt=SIGNING_SALT)
+
+
+def read_waiting_room_token(token: str) -> WaitingRoomTicket | None:
+    """
+    Return the ticket of the token, None if the token is invalid or expired
+
+    :param token: the signed token
+    :type token: str
+    :return: the ticket
+    :rtype: WaitingRoomTicket | None
+    """
+    try:
+        match_id, user_id, number = signing.loads(
+            token,
+            salt=SIGNING_SALT,
+            max_age=settings.WAITING_ROOM_TOKEN_MAX_AGE,
+        )
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+    return WaitingRoomTicket(match_id, user_id, number)
+
+
+class LocalWaitingRoom:
+    """
+    In-process stand-in of the redis waiting rooms, used in local development and
+    tests where the default cache is not redis.
+    """
+
+    def __init__(self, rate: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self._clock = clock
+        self._lock = threading.Lock()
+        # match id -> [tail, head, updated at]
+        self._queues: dict[int, list[float]] = {}
+        self._tickets: dict[tuple[int, int], int] = {}
+
+    def join(self, match_id: int, user_id: int) -> WaitingRoomTicket:
+        """
+        Give the user a ticket of the match, the same ticket if the user has one
+
+        :param match_id: the match id
+        :type match_id: int
+        :param user_id: the user id
+        :type user_id: int
+        :return: the ticket
+        :rtype: WaitingRoomTicket
+        """
+        with self._lock:
+            number = self._tickets.get((match_id, user_id))
+            if number is None:
+                queue = self._queues.setdefault(match_id, [0, 0, self._clock()])
+                # the head does not move past the tail while the queue is idle,
+                # a burst of joins after it is admitted at the rate too
+                self._move_head(queue)
+                queue[0] += 1
+                number = self._tickets[match_id, user_id] = int(queue[0])
+        return WaitingRoomTicket(match_id, user_id, number)
+
+    def _move_head(self, queue: list[float]) -> None:
+        now = self._clock()
+        queue[1] = min(queue[0], queue[1] + (now - queue[2]) * self.rate)
+        queue[2] = now
+
+    def head(self, match_id: int) -> int:
+        """
+        Move the head of the queue forward and return the last admitted ticket
+
+        :param match_id: the match id
+        :type match_id: int
+        :return: the last admitted ticket number
+        :rtype: int
+        """
+        with self._lock:
+            queue = self._queues.get(match_id)
+            if queue is None:
+                return 0
+            self._move_head(queue)
+            return int(queue[1])
+
+    def is_admitted(self, ticket: WaitingRoomTicket) -> bool:
+        return ticket.number <= self.head(ticket.match_id)
+
+
+class RedisWaitingRoom:
+    """
+    Waiting rooms stored in redis,
+    waiting-room:<match id> is a hash of tail, head and updated_at of the queue
+    and waiting-room:<match id>:tickets is a hash of user id to ticket number.
+    """
+
+    # the head is moved up to the tail before a ticket is added, so it does not
+    # move past the tail while the queue is idle, see LocalWaitingRoom.join
+    JOIN_SCRIPT = """
+    local number = redis.call('HGET', KEYS[2], ARGV[1])
+    if number then
+        return tonumber(number)
+    end
+    local time = redis.call('TIME')
+    local now = time[1] + time[2] / 1e6
+    local state = redis.call('HMGET', KEYS[1], 'tail', 'head', 'updated_at')
+    local tail = 0
+    local head = 0
+    if state[1] then
+        tail = tonumber(state[1])
+        head = math.min(
+            tail,
+            tonumber(state[2]) + (now - tonumber(state[3])) * tonumber(ARGV[2])
+        )
+    end
+    number = tail + 1
+    redis.call(
+        'HSET', KEYS[1],
+        'tail', number, 'head', tostring(head), 'updated_at', tostring(now)
+    )
+    redis.call('HSET', KEYS[2], ARGV[1], number)
+    return number
+    """
+    HEAD_SCRIPT = """
+    local state = redis.call('HMGET', KEYS[1], 'tail', 'head', 'updated_at')
+    if not state[1] then
+        return 0
+    end
+    local time = redis.call('TIME')
+    local now = time[1] + time[2] / 1e6
+    local head = math.min(
+        tonumber(state[1]),
+        tonumber(state[2]) + (now - tonumber(state[3])) * tonumber(ARGV[1])
+    )
+    redis.call('HSET', KEYS[1], 'head', tostring(head), 'updated_at', tostring(now))
+    return math.floor(head)
+    """
+
+    def __init__(self, client, rate: float):
+        self.rate = rate
+        self._client = client
+        self._join = client.register_script(self.JOIN_SCRIPT)
+        self._head = client.register_script(self.HEAD_SCRIPT)
+
+    @staticmethod
+    def _key(match_id: int) -> str:
+        return f"waiting-room:{match_id}"
+
+    def join(self, match_id: int, user_id: int) -> WaitingRoomTicket:
+        number = self._join(
+            keys=[self._key(match_id), f"{self._key(match_id)}:tickets"],
+            args=[user_id, self.rate],
+        )
+        return WaitingRoomTicket(match_id, user_id, int(number))
+
+    def head(self, match_id: int) -> int:
+        return int(self._head(keys=[self._key(match_id)], args=[self.rate]))
+
+    def is_admitted(self, ticket: WaitingRoomTicket) -> bool:
+        return ticket.number <= self.head(ticket.match_id)
+
+
+@cache
+def get_waiting_room() -> LocalWaitingRoom | RedisWaitingRoom:
+    """
+    Return the waiting rooms of this process,
+    redis when the default cache is redis otherwise the local stand-in
+    """
+    rate = settings.WAITING_ROOM_ADMISSION_RATE
+    client = redis_connection()
+    if client is None:
+        return LocalWaitingRoom(rate)
+    return RedisWaitingRoom(client, rate)